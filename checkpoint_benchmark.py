@@ -0,0 +1,109 @@
+"""Benchmark DeltaMemorySaver against MemorySaver on long recipe-revision conversations.
+
+Runs the cocktail graph with the scripted fake model (no OpenAI calls). The
+user answers the four questions, then asks for `--revisions` recipe changes
+before approving. For each checkpointer the benchmark reports the stored
+bytes, the time spent saving checkpoints, the conversation wall time and the
+`get_state` latency at the end. It also checks that both checkpointers
+rebuild identical message histories.
+
+Example:
+    python checkpoint_benchmark.py --conversations 5 --revisions 10 25 50 100
+"""
+import argparse
+import os
+import time
+from statistics import mean
+
+# Measure the checkpointers, not the LLM scheduler
+os.environ.setdefault("LLM_RATE_LIMIT", "0")
+os.environ.setdefault("LLM_SINGLE_FLIGHT", "0")
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Command
+
+import cocktail_agent
+from checkpoint_introspection import memory_report
+from checkpointers import DEFAULT_SNAPSHOT_EVERY, DeltaMemorySaver
+from fake_llm import ScriptedCocktailModel
+
+
+def _normalized(messages: list) -> list:
+    # Message and tool call ids are random, compare what the conversation says
+    return [(m.type, m.content, [call["args"] for call in getattr(m, "tool_calls", [])]) for m in messages]
+
+
+class _TimedPuts:
+    """Wraps a checkpointer's `put` to accumulate the time spent saving checkpoints."""
+
+    def __init__(self, checkpointer):
+        self.seconds = 0.0
+        put = checkpointer.put
+
+        def timed_put(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return put(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+
+        checkpointer.put = timed_put
+
+
+def run_conversations(checkpointer, conversations: int, revisions: int, state_reads: int) -> dict:
+    cocktail_agent.model = ScriptedCocktailModel(revisions=revisions)
+    agent = cocktail_agent.workflow.compile(checkpointer=checkpointer)
+    puts = _TimedPuts(checkpointer)
+
+    started = time.perf_counter()
+    histories = []
+    for i in range(conversations):
+        config = {"configurable": {"thread_id": f"bench-{i}"}}
+        cocktail_agent.start_agent(agent, config)
+        while agent.get_state(config).next:
+            agent.invoke(Command(resume="Could you make it a bit less sweet?"), config)
+        histories.append(_normalized(agent.get_state(config).values["messages"]))
+    elapsed = time.perf_counter() - started
+
+    config = {"configurable": {"thread_id": "bench-0"}}
+    read_times = []
+    for _ in range(state_reads):
+        read_started = time.perf_counter()
+        agent.get_state(config)
+        read_times.append(time.perf_counter() - read_started)
+
+    totals = memory_report(checkpointer, top=1)["totals"]
+    return {
+        "stored_bytes": totals["total_bytes"],
+        "checkpoints": totals["checkpoints"],
+        "messages": totals["messages"] // conversations,
+        "put_seconds": puts.seconds,
+        "elapsed_seconds": elapsed,
+        "get_state_ms": mean(read_times) * 1000,
+        "histories": histories,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"{args.conversations} conversations per run, snapshot every {args.snapshot_every} versions\n")
+    print(f"{'revisions':>9}{'messages':>10}{'saver':>8}{'stored KB':>12}{'put s':>9}{'total s':>9}"
+          f"{'get_state ms':>14}{'size ratio':>12}")
+    for revisions in args.revisions:
+        full = run_conversations(MemorySaver(), args.conversations, revisions, args.state_reads)
+        delta = run_conversations(DeltaMemorySaver(snapshot_every=args.snapshot_every),
+                                  args.conversations, revisions, args.state_reads)
+        if full["histories"] != delta["histories"]:
+            raise AssertionError(f"Delta checkpointer rebuilt different histories ({revisions} revisions)")
+        for name, result in (("full", full), ("delta", delta)):
+            ratio = f"{full['stored_bytes'] / result['stored_bytes']:.1f}x" if name == "delta" else ""
+            print(f"{revisions:>9}{result['messages']:>10}{name:>8}{result['stored_bytes'] / 1024:>12.1f}"
+                  f"{result['put_seconds']:>9.3f}{result['elapsed_seconds']:>9.3f}{result['get_state_ms']:>14.2f}{ratio:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare DeltaMemorySaver with MemorySaver")
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--revisions", type=int, nargs="+", default=[0, 10, 25, 50, 100])
+    parser.add_argument("--snapshot-every", type=int, default=DEFAULT_SNAPSHOT_EVERY)
+    parser.add_argument("--state-reads", type=int, default=50, help="get_state calls timed at the end")
+    main(parser.parse_args())
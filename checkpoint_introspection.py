@@ -0,0 +1,249 @@
+"""Per-thread memory accounting for LangGraph checkpointers.
+
+Answers "how much does each conversation cost and what is taking the space?":
+for every thread it reports the serialized size of its checkpoints, how many
+checkpoints it has, the bytes per state channel, the bytes per message kind
+(system prompt, human, AI text, AI tool calls, tool results) and the largest
+messages of the latest state.
+
+For `MemorySaver` the sizes are the bytes it actually keeps in memory (stored
+checkpoints, channel blobs and pending writes). Other checkpointers are
+measured by re-serializing what `list()` returns, which is an approximation.
+
+`TracemallocProbe` adds an optional process-wide view: a diff of Python
+allocations between two calls, grouped by source line.
+"""
+import threading
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from langgraph.checkpoint.memory import MemorySaver
+
+PREVIEW_CHARS = 80
+
+
+def _nbytes(typed: Any) -> int:
+    # Serialized values are stored as (type, bytes) pairs
+    return len(typed[1]) if isinstance(typed, tuple) and len(typed) == 2 else 0
+
+
+def _message_kind(message: Any) -> str:
+    kind = getattr(message, "type", type(message).__name__)
+    if kind == "ai" and getattr(message, "tool_calls", None):
+        return "ai_tool_calls"
+    return kind
+
+
+def _preview(message: Any) -> str:
+    text = getattr(message, "content", "") or ""
+    if not text and getattr(message, "tool_calls", None):
+        text = str(message.tool_calls[0].get("args", ""))
+    text = str(text).replace("\n", " ")
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS] + "..."
+
+
+def _message_breakdown(checkpointer, messages: List[Any], top: int) -> Dict[str, Any]:
+    by_kind: Dict[str, int] = defaultdict(int)
+    sized = []
+    for index, message in enumerate(messages):
+        size = _nbytes(checkpointer.serde.dumps_typed(message))
+        kind = _message_kind(message)
+        by_kind[kind] += size
+        sized.append({"index": index, "kind": kind, "bytes": size, "preview": _preview(message)})
+    sized.sort(key=lambda m: m["bytes"], reverse=True)
+    return {"message_count": len(messages), "bytes_by_kind": dict(by_kind), "largest_messages": sized[:top]}
+
+
+def _by_thread(mapping: Any, thread_ids: List[str]) -> Dict[str, List[Any]]:
+    """Entries of MemorySaver's `blobs` or `writes` grouped by thread, for `thread_ids`.
+
+    In-process dicts are scanned once for every thread. Shared stores
+    (checkpoint_stores.py) read only the keys of the requested threads.
+    """
+    if hasattr(mapping, "thread_items"):
+        return {thread_id: mapping.thread_items(thread_id) for thread_id in thread_ids}
+    wanted = set(thread_ids)
+    grouped: Dict[str, List[Any]] = defaultdict(list)
+    for key, value in list(mapping.items()):
+        if key[0] in wanted:
+            grouped[key[0]].append((key, value))
+    return grouped
+
+
+def _memory_saver_usage(checkpointer: MemorySaver, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Bytes actually held by a MemorySaver for each of `thread_ids`."""
+    blobs = _by_thread(checkpointer.blobs, thread_ids)
+    writes = _by_thread(checkpointer.writes, thread_ids)
+    usage = {}
+    for thread_id in thread_ids:
+        checkpoints = checkpoint_bytes = 0
+        for namespace in checkpointer.storage.get(thread_id, {}).values():
+            for checkpoint, metadata, _parent in namespace.values():
+                checkpoints += 1
+                checkpoint_bytes += _nbytes(checkpoint) + _nbytes(metadata)
+
+        blob_bytes: Dict[str, int] = defaultdict(int)
+        blob_versions: Dict[str, int] = defaultdict(int)
+        for (_thread, _ns, channel, _version), blob in blobs.get(thread_id, []):
+            blob_bytes[channel] += _nbytes(blob)
+            blob_versions[channel] += 1
+
+        write_bytes = 0
+        for _key, pending in writes.get(thread_id, []):
+            write_bytes += sum(_nbytes(value) for _task, _channel, value, *_ in pending.values())
+
+        usage[thread_id] = {
+            "checkpoints": checkpoints,
+            "checkpoint_bytes": checkpoint_bytes,
+            "channel_bytes": dict(blob_bytes),
+            "channel_versions": dict(blob_versions),
+            "pending_write_bytes": write_bytes,
+            "total_bytes": checkpoint_bytes + sum(blob_bytes.values()) + write_bytes,
+        }
+    return usage
+
+
+def _generic_usage(checkpointer, thread_id: str) -> Dict[str, Any]:
+    """Re-serialize every checkpoint of a thread (channel values included)."""
+    checkpoints = checkpoint_bytes = write_bytes = 0
+    channel_bytes: Dict[str, int] = defaultdict(int)
+    for item in checkpointer.list({"configurable": {"thread_id": thread_id}}):
+        checkpoints += 1
+        values = item.checkpoint.get("channel_values", {})
+        for channel, value in values.items():
+            channel_bytes[channel] += _nbytes(checkpointer.serde.dumps_typed(value))
+        header = {k: v for k, v in item.checkpoint.items() if k != "channel_values"}
+        checkpoint_bytes += _nbytes(checkpointer.serde.dumps_typed(header))
+        checkpoint_bytes += _nbytes(checkpointer.serde.dumps_typed(item.metadata))
+        write_bytes += sum(_nbytes(checkpointer.serde.dumps_typed(v)) for _task, _channel, v in item.pending_writes or [])
+    return {
+        "checkpoints": checkpoints,
+        "checkpoint_bytes": checkpoint_bytes,
+        "channel_bytes": dict(channel_bytes),
+        "pending_write_bytes": write_bytes,
+        "total_bytes": checkpoint_bytes + sum(channel_bytes.values()) + write_bytes,
+    }
+
+
+def list_threads(checkpointer) -> List[str]:
+    """Ids of every thread with at least one checkpoint."""
+    if isinstance(checkpointer, MemorySaver):
+        return [thread_id for thread_id, namespaces in list(checkpointer.storage.items()) if any(namespaces.values())]
+    seen = {}
+    for item in checkpointer.list(None):
+        seen.setdefault(item.config["configurable"]["thread_id"], None)
+    return list(seen)
+
+
+def _storage_usage(checkpointer, thread_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    if isinstance(checkpointer, MemorySaver):
+        return _memory_saver_usage(checkpointer, thread_ids)
+    return {thread_id: _generic_usage(checkpointer, thread_id) for thread_id in thread_ids}
+
+
+def _with_messages(checkpointer, thread_id: str, usage: Dict[str, Any], top: int) -> Dict[str, Any]:
+    latest = checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+    messages = latest.checkpoint["channel_values"].get("messages", []) if latest else []
+    return {"thread_id": thread_id, **usage, **_message_breakdown(checkpointer, messages, top)}
+
+
+def thread_memory(checkpointer, thread_id: str, top: int = 5) -> Dict[str, Any]:
+    """Memory report of one thread: storage sizes plus a breakdown of its latest messages.
+
+    Args:
+        checkpointer: The graph's checkpointer (e.g. `agent.checkpointer`)
+        thread_id: Thread to inspect
+        top: Number of largest messages to include
+
+    Returns:
+        Dict[str, Any]: Checkpoint count and byte sizes, bytes per channel,
+        bytes per message kind and the `top` largest messages
+    """
+    usage = _storage_usage(checkpointer, [thread_id])[thread_id]
+    return _with_messages(checkpointer, thread_id, usage, top)
+
+
+def memory_report(checkpointer, thread_ids: Optional[Iterable[str]] = None, top: int = 5,
+                  limit: Optional[int] = None) -> Dict[str, Any]:
+    """Memory report of several threads (all of them by default), largest first, with totals.
+
+    Storage sizes are measured for every thread, but only the `limit` largest
+    get a per-message breakdown and a thread report. Checkpoint and byte
+    totals cover every inspected thread; message totals cover the reported ones.
+    """
+    thread_ids = list(thread_ids) if thread_ids is not None else list_threads(checkpointer)
+    usage = _storage_usage(checkpointer, thread_ids)
+    ranked = sorted(thread_ids, key=lambda thread_id: usage[thread_id]["total_bytes"], reverse=True)
+    reported = ranked[:limit] if limit is not None else ranked
+    threads = [_with_messages(checkpointer, thread_id, usage[thread_id], top) for thread_id in reported]
+
+    totals: Dict[str, Any] = {"threads": len(thread_ids), "reported_threads": len(threads), "checkpoints": 0,
+                              "total_bytes": 0, "messages": 0}
+    bytes_by_kind: Dict[str, int] = defaultdict(int)
+    channel_bytes: Dict[str, int] = defaultdict(int)
+    for thread in usage.values():
+        totals["checkpoints"] += thread["checkpoints"]
+        totals["total_bytes"] += thread["total_bytes"]
+        for channel, size in thread["channel_bytes"].items():
+            channel_bytes[channel] += size
+    for thread in threads:
+        totals["messages"] += thread["message_count"]
+        for kind, size in thread["bytes_by_kind"].items():
+            bytes_by_kind[kind] += size
+    totals["avg_bytes_per_thread"] = totals["total_bytes"] // len(thread_ids) if thread_ids else 0
+    totals["bytes_by_kind"] = dict(bytes_by_kind)
+    totals["channel_bytes"] = dict(channel_bytes)
+
+    return {
+        "checkpointer": type(checkpointer).__name__,
+        "totals": totals,
+        "threads": threads,
+    }
+
+
+class TracemallocProbe:
+    """Diffs Python allocations between consecutive calls to `diff()`.
+
+    The first call starts tracemalloc (if needed) and takes the baseline
+    snapshot; later calls return the top allocation growth since the previous
+    call. Tracing slows the process down, so `stop()` it when done.
+    """
+
+    def __init__(self, frames: int = 1):
+        self.frames = frames
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._started = False  # tracing was started by this probe, so stop() may end it
+
+    def diff(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._started = True
+                self._snapshot = None
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+            )
+            previous, self._snapshot = self._snapshot, snapshot
+            current, peak = tracemalloc.get_traced_memory()
+            report: Dict[str, Any] = {"traced_bytes": current, "peak_traced_bytes": peak}
+            if previous is None:
+                report["note"] = "Baseline snapshot taken; call again to get a diff"
+                return report
+            report["top_growth"] = [
+                {"location": str(stat.traceback), "size_diff_bytes": stat.size_diff, "size_bytes": stat.size,
+                 "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(previous, "lineno")[:top]
+            ]
+            return report
+
+    def stop(self) -> bool:
+        """Stop tracing if this probe started it; returns whether it did."""
+        with self._lock:
+            self._snapshot = None
+            if not (self._started and tracemalloc.is_tracing()):
+                return False
+            tracemalloc.stop()
+            self._started = False
+            return True
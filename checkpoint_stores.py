@@ -0,0 +1,373 @@
+"""Shared key-value stores behind the multi-worker checkpointers.
+
+`SharedMemorySaver` (checkpointers.py) keeps MemorySaver's logic but replaces
+its three in-process dicts (`storage`, `writes`, `blobs`) with the mapping
+views below. The views read and write a store shared by every worker, so
+each turn of a conversation can land on any worker. Stores only need a few
+Redis-style hash commands:
+
+    hget / hset / hexists / hkeys / hgetall / hlen / hdel / delete
+
+`SQLiteStore` serves them from one SQLite file, for several workers on a
+single host. `RedisStore` serves them from anything that speaks the Redis
+protocol (Redis, Valkey, KeyDB or a local stand-in) for multi-node setups.
+
+Layout, per key prefix:
+    {prefix}:threads                           field thread id
+    {prefix}:cp:{thread}                       field ns \\x1f checkpoint id -> checkpoint, metadata, parent
+    {prefix}:blobs:{thread}                    field ns \\x1f channel \\x1f version -> channel value
+    {prefix}:writes:{thread}:{ns}:{checkpoint} field task id \\x1f idx -> pending write
+    {prefix}:writekeys:{thread}                field ns \\x1f checkpoint id (index for deletion)
+"""
+import sqlite3
+import struct
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SEP = "\x1f"
+
+
+# ----------------------------------
+# Stores
+# ----------------------------------
+class SQLiteStore:
+    """Redis-style hashes in a SQLite file (WAL mode, one connection per thread)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT, field TEXT, value BLOB, PRIMARY KEY (key, field)) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def hget(self, key: str, field: str) -> Optional[bytes]:
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ? AND field = ?", (key, field)).fetchone()
+        return row[0] if row else None
+
+    def hset(self, key: str, field: str, value: bytes) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO kv (key, field, value) VALUES (?, ?, ?)", (key, field, value))
+
+    def hexists(self, key: str, field: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM kv WHERE key = ? AND field = ?", (key, field)).fetchone() is not None
+
+    def hkeys(self, key: str) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT field FROM kv WHERE key = ?", (key,))]
+
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        return dict(self._conn().execute("SELECT field, value FROM kv WHERE key = ?", (key,)).fetchall())
+
+    def hlen(self, key: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM kv WHERE key = ?", (key,)).fetchone()[0]
+
+    def hdel(self, key: str, field: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ? AND field = ?", (key, field))
+
+    def delete(self, *keys: str) -> None:
+        self._conn().executemany("DELETE FROM kv WHERE key = ?", [(key,) for key in keys])
+
+
+class RedisStore:
+    """Thin adapter over a redis-py client (connection pooling is redis-py's)."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis checkpointer backend needs redis-py: pip install redis") from e
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+
+    def hget(self, key: str, field: str) -> Optional[bytes]:
+        return self._client.hget(key, field)
+
+    def hset(self, key: str, field: str, value: bytes) -> None:
+        self._client.hset(key, field, value)
+
+    def hexists(self, key: str, field: str) -> bool:
+        return bool(self._client.hexists(key, field))
+
+    def hkeys(self, key: str) -> List[str]:
+        return [field.decode() for field in self._client.hkeys(key)]
+
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        return {field.decode(): value for field, value in self._client.hgetall(key).items()}
+
+    def hlen(self, key: str) -> int:
+        return self._client.hlen(key)
+
+    def hdel(self, key: str, field: str) -> None:
+        self._client.hdel(key, field)
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self._client.delete(*keys)
+
+
+# ----------------------------------
+# Encoding
+# ----------------------------------
+def _pack(*parts: bytes) -> bytes:
+    return b"".join(struct.pack(">I", len(part)) + part for part in parts)
+
+
+def _unpack(data: bytes) -> List[bytes]:
+    parts, offset = [], 0
+    while offset < len(data):
+        (size,) = struct.unpack_from(">I", data, offset)
+        parts.append(data[offset + 4:offset + 4 + size])
+        offset += 4 + size
+    return parts
+
+
+def _pack_checkpoint(saved: Tuple[Tuple[str, bytes], Tuple[str, bytes], Optional[str]]) -> bytes:
+    (checkpoint_type, checkpoint), (metadata_type, metadata), parent = saved
+    return _pack(checkpoint_type.encode(), checkpoint, metadata_type.encode(), metadata, (parent or "").encode())
+
+
+def _unpack_checkpoint(data: bytes) -> Tuple[Tuple[str, bytes], Tuple[str, bytes], Optional[str]]:
+    checkpoint_type, checkpoint, metadata_type, metadata, parent = _unpack(data)
+    return (checkpoint_type.decode(), checkpoint), (metadata_type.decode(), metadata), parent.decode() or None
+
+
+def _pack_write(write: Tuple[str, str, Tuple[str, bytes], str]) -> bytes:
+    task_id, channel, (value_type, value), task_path = write
+    return _pack(task_id.encode(), channel.encode(), value_type.encode(), value, task_path.encode())
+
+
+def _unpack_write(data: bytes) -> Tuple[str, str, Tuple[str, bytes], str]:
+    task_id, channel, value_type, value, task_path = _unpack(data)
+    return task_id.decode(), channel.decode(), (value_type.decode(), value), task_path.decode()
+
+
+# ----------------------------------
+# MemorySaver-compatible views
+# ----------------------------------
+class _Keys:
+    def __init__(self, store: Any, prefix: str):
+        self.store = store
+        self.prefix = prefix
+
+    @property
+    def threads(self) -> str:
+        return f"{self.prefix}:threads"
+
+    def checkpoints(self, thread_id: str) -> str:
+        return f"{self.prefix}:cp:{thread_id}"
+
+    def blobs(self, thread_id: str) -> str:
+        return f"{self.prefix}:blobs:{thread_id}"
+
+    def writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"{self.prefix}:writes:{thread_id}:{checkpoint_ns}:{checkpoint_id}"
+
+    def write_index(self, thread_id: str) -> str:
+        return f"{self.prefix}:writekeys:{thread_id}"
+
+    def thread_ids(self) -> List[str]:
+        return self.store.hkeys(self.threads)
+
+
+class _Checkpoints(_Keys):
+    """storage[thread_id][checkpoint_ns]: checkpoint id -> (checkpoint, metadata, parent id)."""
+
+    def __init__(self, store: Any, prefix: str, thread_id: str, checkpoint_ns: str):
+        super().__init__(store, prefix)
+        self.thread_id = thread_id
+        self.checkpoint_ns = checkpoint_ns
+        self._field_prefix = checkpoint_ns + SEP
+
+    def keys(self) -> List[str]:
+        return [f[len(self._field_prefix):] for f in self.store.hkeys(self.checkpoints(self.thread_id))
+                if f.startswith(self._field_prefix)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def get(self, checkpoint_id: str, default: Any = None) -> Any:
+        data = self.store.hget(self.checkpoints(self.thread_id), self._field_prefix + checkpoint_id)
+        return _unpack_checkpoint(data) if data is not None else default
+
+    def __getitem__(self, checkpoint_id: str) -> Any:
+        saved = self.get(checkpoint_id)
+        if saved is None:
+            raise KeyError(checkpoint_id)
+        return saved
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(f[len(self._field_prefix):], _unpack_checkpoint(data))
+                for f, data in self.store.hgetall(self.checkpoints(self.thread_id)).items()
+                if f.startswith(self._field_prefix)]
+
+    def values(self) -> List[Any]:
+        return [saved for _, saved in self.items()]
+
+    def update(self, checkpoints: Dict[str, Any]) -> None:
+        for checkpoint_id, saved in checkpoints.items():
+            self.store.hset(self.checkpoints(self.thread_id), self._field_prefix + checkpoint_id, _pack_checkpoint(saved))
+        self.store.hset(self.threads, self.thread_id, b"1")
+
+
+class _Namespaces(_Keys):
+    """storage[thread_id]: checkpoint ns -> _Checkpoints."""
+
+    def __init__(self, store: Any, prefix: str, thread_id: str):
+        super().__init__(store, prefix)
+        self.thread_id = thread_id
+
+    def __getitem__(self, checkpoint_ns: str) -> _Checkpoints:
+        return _Checkpoints(self.store, self.prefix, self.thread_id, checkpoint_ns)
+
+    def keys(self) -> List[str]:
+        return list(dict.fromkeys(f.split(SEP, 1)[0] for f in self.store.hkeys(self.checkpoints(self.thread_id))))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def values(self) -> List[_Checkpoints]:
+        return [self[ns] for ns in self.keys()]
+
+    def items(self) -> List[Tuple[str, _Checkpoints]]:
+        return [(ns, self[ns]) for ns in self.keys()]
+
+
+class SharedStorage(_Keys):
+    """Replacement for MemorySaver.storage: thread id -> _Namespaces."""
+
+    def __getitem__(self, thread_id: str) -> _Namespaces:
+        return _Namespaces(self.store, self.prefix, thread_id)
+
+    def __contains__(self, thread_id: str) -> bool:
+        return self.store.hexists(self.threads, thread_id)
+
+    def get(self, thread_id: str, default: Any = None) -> Any:
+        return self[thread_id] if thread_id in self else default
+
+    def keys(self) -> List[str]:
+        return self.thread_ids()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def items(self) -> List[Tuple[str, _Namespaces]]:
+        return [(thread_id, self[thread_id]) for thread_id in self.keys()]
+
+
+class SharedBlobs(_Keys):
+    """Replacement for MemorySaver.blobs: (thread id, ns, channel, version) -> (type, bytes)."""
+
+    def _locate(self, key: Tuple[str, str, str, Any]) -> Tuple[str, str]:
+        thread_id, checkpoint_ns, channel, version = key
+        return self.blobs(thread_id), SEP.join((checkpoint_ns, channel, str(version)))
+
+    def __contains__(self, key: Tuple[str, str, str, Any]) -> bool:
+        return self.store.hexists(*self._locate(key))
+
+    def get(self, key: Tuple[str, str, str, Any], default: Any = None) -> Any:
+        data = self.store.hget(*self._locate(key))
+        if data is None:
+            return default
+        value_type, value = _unpack(data)
+        return value_type.decode(), value
+
+    def __getitem__(self, key: Tuple[str, str, str, Any]) -> Tuple[str, bytes]:
+        blob = self.get(key)
+        if blob is None:
+            raise KeyError(key)
+        return blob
+
+    def __setitem__(self, key: Tuple[str, str, str, Any], blob: Tuple[str, bytes]) -> None:
+        self.store.hset(*self._locate(key), _pack(blob[0].encode(), blob[1]))
+
+    def thread_items(self, thread_id: str) -> List[Tuple[Tuple[str, str, str, str], Tuple[str, bytes]]]:
+        """items() of one thread, in a single store round trip."""
+        result = []
+        for field, data in self.store.hgetall(self.blobs(thread_id)).items():
+            checkpoint_ns, channel, version = field.split(SEP, 2)
+            value_type, value = _unpack(data)
+            result.append(((thread_id, checkpoint_ns, channel, version), (value_type.decode(), value)))
+        return result
+
+    def items(self) -> List[Tuple[Tuple[str, str, str, str], Tuple[str, bytes]]]:
+        return [item for thread_id in self.thread_ids() for item in self.thread_items(thread_id)]
+
+    def keys(self) -> List[Tuple[str, str, str, str]]:
+        return [key for key, _ in self.items()]
+
+
+class _CheckpointWrites(_Keys):
+    """writes[(thread id, ns, checkpoint id)]: (task id, idx) -> (task id, channel, value, task path)."""
+
+    def __init__(self, store: Any, prefix: str, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        super().__init__(store, prefix)
+        self.thread_id = thread_id
+        self.checkpoint_ns = checkpoint_ns
+        self.checkpoint_id = checkpoint_id
+        self.key = self.writes(thread_id, checkpoint_ns, checkpoint_id)
+
+    def __contains__(self, inner_key: Tuple[str, int]) -> bool:
+        return self.store.hexists(self.key, f"{inner_key[0]}{SEP}{inner_key[1]}")
+
+    def __setitem__(self, inner_key: Tuple[str, int], write: Tuple[str, str, Tuple[str, bytes], str]) -> None:
+        self.store.hset(self.key, f"{inner_key[0]}{SEP}{inner_key[1]}", _pack_write(write))
+        self.store.hset(self.write_index(self.thread_id), f"{self.checkpoint_ns}{SEP}{self.checkpoint_id}", b"1")
+
+    def __len__(self) -> int:
+        return self.store.hlen(self.key)
+
+    def values(self) -> List[Tuple[str, str, Tuple[str, bytes], str]]:
+        rows = []
+        for field, data in self.store.hgetall(self.key).items():
+            task_id, idx = field.rsplit(SEP, 1)
+            rows.append(((task_id, int(idx)), _unpack_write(data)))
+        # Hashes have no order; keep each task's writes in index order
+        return [write for _, write in sorted(rows)]
+
+
+class SharedWrites(_Keys):
+    """Replacement for MemorySaver.writes: (thread id, ns, checkpoint id) -> _CheckpointWrites."""
+
+    def __getitem__(self, outer_key: Tuple[str, str, str]) -> _CheckpointWrites:
+        return _CheckpointWrites(self.store, self.prefix, *outer_key)
+
+    def get(self, outer_key: Tuple[str, str, str], default: Any = None) -> Any:
+        return self[outer_key]
+
+    def thread_keys(self, thread_id: str) -> List[Tuple[str, str, str]]:
+        return [(thread_id, *field.split(SEP, 1)) for field in self.store.hkeys(self.write_index(thread_id))]
+
+    def keys(self) -> List[Tuple[str, str, str]]:
+        return [key for thread_id in self.thread_ids() for key in self.thread_keys(thread_id)]
+
+    def thread_items(self, thread_id: str) -> List[Tuple[Tuple[str, str, str], Dict[Tuple[str, int], Any]]]:
+        """items() of one thread, reading only that thread's keys."""
+        return [(key, {i: write for i, write in enumerate(self[key].values())}) for key in self.thread_keys(thread_id)]
+
+    def items(self) -> List[Tuple[Tuple[str, str, str], Dict[Tuple[str, int], Any]]]:
+        return [item for thread_id in self.thread_ids() for item in self.thread_items(thread_id)]
+
+
+def delete_thread(store: Any, prefix: str, thread_id: str) -> None:
+    keys = _Keys(store, prefix)
+    write_keys = [keys.writes(thread_id, *field.split(SEP, 1)) for field in store.hkeys(keys.write_index(thread_id))]
+    store.delete(keys.checkpoints(thread_id), keys.blobs(thread_id), keys.write_index(thread_id), *write_keys)
+    store.hdel(keys.threads, thread_id)
+
+
+def latest_checkpoint_token(store: Any, prefix: str, thread_id: str, checkpoint_ns: str = "") -> Tuple[Optional[str], int]:
+    """(latest checkpoint id, its pending write count): changes whenever the thread's state does."""
+    checkpoint_ids = _Checkpoints(store, prefix, thread_id, checkpoint_ns).keys()
+    if not checkpoint_ids:
+        return None, 0
+    latest = max(checkpoint_ids)
+    return latest, store.hlen(_Keys(store, prefix).writes(thread_id, checkpoint_ns, latest))
@@ -0,0 +1,202 @@
+"""Checkpointers for the project's graphs.
+
+`MemorySaver` already stores only the channels that changed in a step, but the
+`messages` channel changes on every step and is stored as the whole list. The
+cost per step therefore grows with the conversation length, so a conversation
+costs O(n²) in memory and serialization. `DeltaMemorySaver` stores
+append-only list channels as deltas instead: only the messages appended since
+the previous version are serialized, together with a reference to that
+version. Every `snapshot_every` versions it stores the full list again, which
+bounds the chain a read has to replay. When a step rewrites history instead
+of appending (a message replaced or removed) it also falls back to a full
+snapshot. The last stored version per channel is remembered for at most
+`max_heads` channels (least recently written first out); subgraph namespaces
+carry task ids, so they would otherwise pile up. A forgotten channel just gets
+a full snapshot on its next write.
+
+`SharedMemorySaver` keeps the same logic on a store shared by several worker
+processes or hosts, either SQLite or a Redis-protocol server. Any worker can
+then continue any conversation.
+
+Configuration (environment variables), read by `checkpointer_from_env`:
+    CHECKPOINTER_MODE          "full" (default) or "delta"
+    CHECKPOINT_SNAPSHOT_EVERY  versions between full snapshots in delta mode (default: 20)
+    CHECKPOINT_DELTA_HEADS     channels whose last version delta mode remembers (default: 10000)
+    CHECKPOINTER_BACKEND       "memory" (default, one process), "sqlite" or "redis"
+    CHECKPOINTER_SQLITE_PATH   SQLite file of the sqlite backend (default: checkpoints.sqlite)
+    CHECKPOINTER_REDIS_URL     server of the redis backend (default: redis://localhost:6379/0)
+    CHECKPOINTER_KEY_PREFIX    key namespace in the shared store (default: pocket)
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata
+from langgraph.checkpoint.memory import MemorySaver
+
+from checkpoint_stores import (
+    RedisStore, SharedBlobs, SharedStorage, SharedWrites, SQLiteStore, delete_thread, latest_checkpoint_token,
+)
+
+DEFAULT_SNAPSHOT_EVERY = 20
+DEFAULT_MAX_HEADS = 10_000
+DEFAULT_SQLITE_PATH = "checkpoints.sqlite"
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+DEFAULT_KEY_PREFIX = "pocket"
+DELTA_CHANNELS = ("messages",)
+
+# Blob type of a delta: f"{DELTA_TYPE}|{base version}|{serialized type of the appended items}"
+DELTA_TYPE = "delta"
+
+
+def _digest(item: Any) -> int:
+    """Cheap in-process fingerprint used to check that a list only grew at the end."""
+    content = getattr(item, "content", None)
+    if content is None:
+        return hash(repr(item))
+    return hash((
+        getattr(item, "type", None),
+        getattr(item, "id", None),
+        content if isinstance(content, str) else repr(content),
+        repr(getattr(item, "tool_calls", None) or ()),
+    ))
+
+
+class _Head(NamedTuple):
+    version: str
+    digests: List[int]
+    depth: int  # deltas since the last full snapshot
+
+
+class DeltaMemorySaver(MemorySaver):
+    """MemorySaver that stores append-only list channels as deltas over their previous version."""
+
+    def __init__(self, *, snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+                 delta_channels: Sequence[str] = DELTA_CHANNELS, max_heads: int = DEFAULT_MAX_HEADS, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.snapshot_every = snapshot_every
+        self.delta_channels = tuple(delta_channels)
+        self.max_heads = max_heads
+        # (thread id, checkpoint ns, channel) -> last stored version of the channel, least recently written first
+        self._heads: "OrderedDict[Tuple[str, str, str], _Head]" = OrderedDict()
+        self._heads_lock = threading.Lock()
+
+    def _encode(self, thread_id: str, checkpoint_ns: str, channel: str, version: str, items: list) -> Tuple[str, bytes]:
+        key = (thread_id, checkpoint_ns, channel)
+        digests = [_digest(item) for item in items]
+        with self._heads_lock:
+            head = self._heads.get(key)
+        base_len = len(head.digests) if head else 0
+        if (head is not None and head.depth + 1 < self.snapshot_every
+                and len(items) >= base_len and digests[:base_len] == head.digests):
+            inner_type, data = self.serde.dumps_typed(items[base_len:])
+            blob = (f"{DELTA_TYPE}|{head.version}|{inner_type}", data)
+            depth = head.depth + 1
+        else:
+            blob = self.serde.dumps_typed(items)
+            depth = 0
+        with self._heads_lock:
+            self._heads[key] = _Head(str(version), digests, depth)
+            self._heads.move_to_end(key)
+            while len(self._heads) > self.max_heads:
+                self._heads.popitem(last=False)
+        return blob
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        values = checkpoint["channel_values"]
+        deltas = {
+            channel: self._encode(thread_id, checkpoint_ns, channel, new_versions[channel], values[channel])
+            for channel in self.delta_channels
+            if channel in new_versions and isinstance(values.get(channel), list)
+        }
+        # Blobs go in before the checkpoint that references them (readers may be other workers)
+        for channel, blob in deltas.items():
+            self.blobs[(thread_id, checkpoint_ns, channel, new_versions[channel])] = blob
+        # Everything else is stored exactly like MemorySaver does
+        return super().put(config, checkpoint, metadata, {k: v for k, v in new_versions.items() if k not in deltas})
+
+    def _resolve(self, thread_id: str, checkpoint_ns: str, channel: str, blob: Tuple[str, bytes]) -> Any:
+        appended = []
+        while blob[0].startswith(DELTA_TYPE + "|"):
+            _, base_version, inner_type = blob[0].split("|", 2)
+            appended.append((inner_type, blob[1]))
+            blob = self.blobs[(thread_id, checkpoint_ns, channel, base_version)]
+        items = self.serde.loads_typed(blob)
+        for typed in reversed(appended):
+            items.extend(self.serde.loads_typed(typed))
+        return items
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        channel_values: Dict[str, Any] = {}
+        for channel, version in versions.items():
+            blob = self.blobs.get((thread_id, checkpoint_ns, channel, version))
+            if blob is not None and blob[0] != "empty":
+                channel_values[channel] = self._resolve(thread_id, checkpoint_ns, channel, blob)
+        return channel_values
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self._heads_lock:
+            for key in [key for key in self._heads if key[0] == thread_id]:
+                del self._heads[key]
+
+
+class SharedMemorySaver(MemorySaver):
+    """MemorySaver whose storage lives in a store shared by every worker (see checkpoint_stores.py).
+
+    Any worker can serve any turn of a conversation: nothing about a thread is
+    kept in the process, every read goes to the store.
+    """
+
+    def __init__(self, *, store: Any, prefix: str = DEFAULT_KEY_PREFIX, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.store = store
+        self.prefix = prefix
+        self.storage = SharedStorage(store, prefix)
+        self.writes = SharedWrites(store, prefix)
+        self.blobs = SharedBlobs(store, prefix)
+
+    def delete_thread(self, thread_id: str) -> None:
+        delete_thread(self.store, self.prefix, thread_id)
+
+    def state_token(self, thread_id: str) -> Any:
+        """Cheap value that changes whenever the thread's latest state does (used by SessionSnapshots)."""
+        return latest_checkpoint_token(self.store, self.prefix, thread_id)
+
+
+class SharedDeltaMemorySaver(DeltaMemorySaver, SharedMemorySaver):
+    """Delta storage on a shared store.
+
+    The last stored version per channel is only a per-process hint. A delta
+    always names its base version and is written only when the list extends
+    that base, so deltas written by different workers stay consistent.
+    """
+
+
+def checkpointer_from_env() -> MemorySaver:
+    """Checkpointer selected by CHECKPOINTER_BACKEND and CHECKPOINTER_MODE (see module docstring)."""
+    mode = os.getenv("CHECKPOINTER_MODE", "full")
+    if mode not in ("full", "delta"):
+        raise ValueError(f"Unknown CHECKPOINTER_MODE '{mode}', expected 'full' or 'delta'")
+    kwargs = {
+        "snapshot_every": int(os.getenv("CHECKPOINT_SNAPSHOT_EVERY", DEFAULT_SNAPSHOT_EVERY)),
+        "max_heads": int(os.getenv("CHECKPOINT_DELTA_HEADS", DEFAULT_MAX_HEADS)),
+    } if mode == "delta" else {}
+
+    backend = os.getenv("CHECKPOINTER_BACKEND", "memory")
+    if backend == "memory":
+        return DeltaMemorySaver(**kwargs) if mode == "delta" else MemorySaver()
+    if backend == "sqlite":
+        store = SQLiteStore(os.getenv("CHECKPOINTER_SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    elif backend == "redis":
+        store = RedisStore(os.getenv("CHECKPOINTER_REDIS_URL", DEFAULT_REDIS_URL))
+    else:
+        raise ValueError(f"Unknown CHECKPOINTER_BACKEND '{backend}', expected 'memory', 'sqlite' or 'redis'")
+    prefix = os.getenv("CHECKPOINTER_KEY_PREFIX", DEFAULT_KEY_PREFIX)
+    saver_class = SharedDeltaMemorySaver if mode == "delta" else SharedMemorySaver
+    return saver_class(store=store, prefix=prefix, **kwargs)
@@ -0,0 +1,114 @@
+"""Circuit breaker for the model provider.
+
+While the provider is healthy the circuit is closed and calls go through.
+After `failure_threshold` consecutive upstream failures (timeouts, connection
+errors, 5xx) it opens. Every call then fails at once with `CircuitOpenError`
+instead of waiting on a degraded upstream and piling up hung requests. After
+`reset_timeout` seconds the circuit is half-open: up to `half_open_calls`
+trial calls go through. A success closes the circuit; a failure opens it again
+for another `reset_timeout`.
+
+Configuration (environment variables, read by llm_gateway.py):
+    LLM_CIRCUIT_BREAKER            "0" disables the breaker
+    LLM_CIRCUIT_FAILURES           consecutive failures that open the circuit (default: 5)
+    LLM_CIRCUIT_RESET_SECONDS      seconds the circuit stays open before a trial call (default: 30)
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_HALF_OPEN_CALLS = 1
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, safe to share between threads."""
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 half_open_calls: int = DEFAULT_HALF_OPEN_CALLS, name: str = "llm"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0  # trial calls in flight while half-open
+        self._metrics = {"calls": 0, "successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _current_state(self) -> str:
+        # Called with the lock held
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """Let a call through, or raise CircuitOpenError while the upstream is considered unhealthy."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED or (state == HALF_OPEN and self._trials < self.half_open_calls):
+                if state == HALF_OPEN:
+                    self._trials += 1
+                self._metrics["calls"] += 1
+                return
+            self._metrics["rejected"] += 1
+            retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(
+            f"The {self.name} upstream is unavailable after {self.failure_threshold} consecutive failures; "
+            f"failing fast, retry in {retry_after:.0f}s",
+            retry_after=retry_after,
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._metrics["successes"] += 1
+            self._failures = 0
+            self._state = CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._metrics["failures"] += 1
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._metrics["opened"] += 1
+
+    def release(self) -> None:
+        """Give back a half-open trial slot when the call ended with an error that says nothing about the upstream."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "state": self._current_state(), "consecutive_failures": self._failures}
+
+
+def breaker_from_env() -> Optional[CircuitBreaker]:
+    if os.getenv("LLM_CIRCUIT_BREAKER", "1") == "0":
+        return None
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", DEFAULT_FAILURE_THRESHOLD)),
+        reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", DEFAULT_RESET_TIMEOUT)),
+    )
@@ -1,7 +1,8 @@
 import os
+import uuid
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
 from typing_extensions import TypedDict
 from IPython.display import Image, display
@@ -21,19 +22,67 @@ from langgraph.graph import MessagesState, START
 # We'll also have one "fake" tool - a "ask_human" tool
 # Here we define any ACTUAL tools
 from langchain_core.tools import tool
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import ToolNode #--> THIS STOPPED WORKING!
 
+# All model calls go through the shared rate limiter
+from llm_gateway import invoke_model
+# Each node's model backend (OpenAI, an OpenAI-compatible local server or a fake) comes from MODEL_BACKENDS
+from model_backends import chat_model
+# Cheap turns (questions, extraction) and the recipe can go to different model tiers (MODEL_ROUTING)
+from model_routing import invoke_routed
+# The system prompt is injected at call time instead of being stored in every checkpoint
+from prompt_registry import registry, with_system_prompt
+from checkpointers import checkpointer_from_env
+from session_snapshot import SessionSnapshots
+from speculation import Speculator, speculation_key
+from cocktail_knowledge import load_knowledge
+
+
+# Classic recipes and ingredients, indexed once at startup (see cocktail_knowledge.py)
+knowledge = load_knowledge()
+
+
+@tool
+def lookup_cocktails(name: Optional[str] = None, ingredients: Optional[List[str]] = None,
+                     flavors: Optional[List[str]] = None, technique: Optional[str] = None,
+                     exclude: Optional[List[str]] = None) -> str:
+    """Look up classic cocktail recipes with exact measurements, technique, glass and garnish.
+
+    Args:
+        name: cocktail name, typos are fine (e.g. "negroni", "pina colada")
+        ingredients: ingredients every recipe must contain (e.g. ["gin", "lemon"])
+        flavors: flavor profiles: sweet, sour, dry, fruity, bitter, herbal, spicy, smoky, creamy, refreshing, strong
+        technique: shaken, stirred, built, muddled or blended
+        exclude: ingredients to avoid (e.g. ["egg white"])
+    """
+    if name:
+        recipes = knowledge.search_names(name)
+        return "\n".join(r.format() for r in recipes) if recipes else f"No classic cocktail named '{name}'."
+    filters = dict(ingredients=ingredients or [], flavors=flavors or [], technique=technique, exclude=exclude or [])
+    recipes = knowledge.find(**filters)
+    if recipes:
+        return "\n".join(r.format() for r in recipes)
+    closest = knowledge.find(**filters, partial=True)
+    if not closest:
+        return "No classic cocktail matches."
+    return "No classic cocktail matches every filter. Closest:\n" + "\n".join(r.format() for r in closest)
+
 
 @tool
-def my_tool(query: str):
-    """Tool for later use"""
-    # This is a placeholder for the actual implementation
-    # Don't let the LLM know this though 😊
-    return f"{query}"
+def ingredient_substitutes(ingredient: str) -> str:
+    """Substitutes for a cocktail ingredient (e.g. "egg white", "campari", "lime juice")."""
+    info = knowledge.substitutes(ingredient)
+    if info is None:
+        return f"No substitutes known for '{ingredient}'."
+    return f"{info.name} ({info.category}): substitute with {', '.join(info.substitutes)}."
 
 
-tools = [my_tool]
+tools = [lookup_cocktails, ingredient_substitutes]
 tool_node = ToolNode(tools)
+# Real tool calls of one model turn run in parallel, at most this many at a time
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", 4))
 
 
 # We are going "bind" all tools to the model
@@ -50,8 +99,9 @@ class LLMResponse(BaseModel):
     next_question: str = Field(description = "response from the LLM containing the next question to the user.")
     review: str = Field(description = "Boolean value to decide whether to go to review node or not. ")
 
-model = ChatOpenAI(model = "gpt-4o-mini")
-model = model.bind_tools(tools + [AskHuman])
+AGENT_TOOLS = tools + [AskHuman]
+model = chat_model("call_model")
+model = model.bind_tools(AGENT_TOOLS)
 SYSTEM_PROMPT = """You are a professional cocktail designer.
 
 CRITICAL INSTRUCTION: ALWAYS use the AskHuman tool to ask questions. NEVER ask questions directly in your response text.
@@ -66,6 +116,8 @@ Ask these questions ONE AT A TIME using the AskHuman tool:
 CORRECT USAGE: Use the AskHuman tool with the 'question' parameter.
 INCORRECT USAGE: Directly asking, "What type of cocktail do you prefer?"
 
+Use the lookup_cocktails and ingredient_substitutes tools to ground your recipe in the measurements and ratios of classic cocktails, and to replace ingredients the user dislikes.
+
 After gathering all the necessary details, you MUST use the AskHuman tool to inform the user that you have collected all the essential information to prepare the cocktail and ask if you may proceed with generating the cocktail recipe. \
 
 If the user confirms, YOU MUST use the AskHuman tool to provide the unique cocktail recipe; if the user requests changes, ask follow-up questions using the AskHuman tool to clarify their modifications.
@@ -84,6 +136,52 @@ you MUST ALWAYS use the AskHuman tool when interacting with and presenting your
 
 Once the user approves your generated cocktail, present a kind message including the final cocktail recipe, do not use any tool calls.
 """
+SYSTEM_PROMPT_ID = "cocktail_designer"
+registry.register(SYSTEM_PROMPT_ID, SYSTEM_PROMPT)
+
+# The four questions of SYSTEM_PROMPT, by preference slot.
+# With QUESTIONNAIRE_MODE=template they are asked by the `questionnaire` node without calling the model,
+# which is then only called for the confirmation and the recipe.
+QUESTIONNAIRE = [
+    ("taste", "Do you prefer a sweeter, sour, drier, or fruity cocktail?"),
+    ("method", "Would you like your cocktail shaken, muddled, or stirred?"),
+    ("spirit", "Which type of distilled alcohol do you favor (e.g., whisky, gin, vodka, etc.) or any fermented beverages?"),
+    ("ingredients", "Any additional ingredients that you would like or dislike?"),
+]
+QUESTIONNAIRE_MODE = os.getenv("QUESTIONNAIRE_MODE", "llm")  # "llm" or "template"
+# With PREFERENCE_EXTRACTION=1 every questionnaire answer goes through a structured-output call that
+# fills all the slots it mentions, and the questions of the slots already filled are skipped
+PREFERENCE_EXTRACTION = os.getenv("PREFERENCE_EXTRACTION", "0") != "0"
+
+
+class Preferences(BaseModel):
+    """Cocktail preferences stated in the user's answer"""
+    taste: Optional[str] = Field(default=None, description="Preferred taste: sweeter, sour, drier or fruity")
+    method: Optional[str] = Field(default=None, description="Preparation method: shaken, muddled or stirred")
+    spirit: Optional[str] = Field(default=None, description="Favoured distilled alcohol or fermented beverage")
+    ingredients: Optional[str] = Field(default=None, description="Additional ingredients the user would like or dislike, or restrictions")
+
+EXTRACTION_PROMPT = """You extract cocktail preferences from the user's answer to the question: "{question}"
+Fill every field the answer mentions, including fields the question did not ask about.
+Leave a field empty when the answer says nothing about it; never guess."""
+
+extraction_model = chat_model("extract_preferences", model=os.getenv("EXTRACTION_MODEL", "gpt-4o-mini"))
+
+# With SPECULATIVE_RECIPES=1, once the questionnaire asks its last question the model turns that follow
+# the likely answers are generated in the background: the confirmation, then the recipe after "Yes".
+# A turn is reused only if the real prompt matches (see speculation.py).
+SPECULATIVE_RECIPES = os.getenv("SPECULATIVE_RECIPES", "0") != "0"
+LIKELY_ANSWERS = {"ingredients": ["No restrictions"]}
+LIKELY_CONFIRMATIONS = ["Yes"]
+speculator = Speculator(workers=int(os.getenv("SPECULATION_WORKERS", 4)))
+
+
+class State(MessagesState):
+    # Reference to the system prompt in the prompt registry (the text itself is not persisted)
+    prompt_id: str
+    prompt_version: str
+    # Answers collected by the questionnaire node, by slot of QUESTIONNAIRE
+    preferences: Dict[str, str]
 
 # Define nodes and conditional edges
 
@@ -97,70 +195,221 @@ def should_continue(state):
     # If there is no function call, then we finish
     if not last_message.tool_calls:
         return END
+    # Real tools run first (all of them in one step); AskHuman calls of the same turn are asked afterwards
+    elif any(call["name"] != "AskHuman" for call in last_message.tool_calls):
+        return "action"
     # If tool call is asking Human, we return that node
     # You could also add logic here to let some system know that there's something that requires Human input
     # For example, send a slack message, etc
-    elif last_message.tool_calls[0]["name"] == "AskHuman":
-        return "ask_human"
-    # Otherwise if there is, we continue
     else:
-        return "action"
+        return "ask_human"
+
+
+def _last_ai_message(messages):
+    return next(m for m in reversed(messages) if m.type == "ai")
+
+
+def _ask_human_calls(message):
+    return [call for call in message.tool_calls if call["name"] == "AskHuman"]
+
+
+def after_action(state):
+    # Once the real tools have answered, ask the questions the model asked in the same turn
+    return "ask_human" if _ask_human_calls(_last_ai_message(state["messages"])) else "agent"
+
+
+def _with_preferences(messages, preferences):
+    """`messages` with the collected preferences stated after the system prompt (not persisted)"""
+    if not preferences:
+        return messages
+    lines = "\n".join(f"- {question} {preferences[slot]}" for slot, question in QUESTIONNAIRE if slot in preferences)
+    note = SystemMessage(content=f"The user's answers to the preference questions, do not ask them again:\n{lines}")
+    if messages and messages[0].type == "system":
+        return [messages[0], note, *messages[1:]]
+    return [note, *messages]
+
+
+def _model_prompt(state, messages, preferences):
+    """What the model is sent for `messages`: system prompt and collected preferences added at call time"""
+    messages = with_system_prompt(messages, state.get("prompt_id"), state.get("prompt_version"))
+    return _with_preferences(messages, preferences)
+
+
+def _turn_kind(state, preferences):
+    """"question" while the questionnaire is still being asked, "recipe" for the turns after it"""
+    asked = sum(len(_ask_human_calls(m)) for m in state["messages"] if m.type == "ai")
+    return "recipe" if len(preferences or {}) >= len(QUESTIONNAIRE) or asked >= len(QUESTIONNAIRE) else "question"
+
+
+def _invoke_designer(messages, config, override, kind, hedge=None):
+    """One designer model turn: `override` (configurable["model"]) if set, else the tier routed for `kind`"""
+    if override is not None:
+        return invoke_model(override, messages, config, hedge=hedge)
+    return invoke_routed("call_model", messages, config, model, kind=kind, tools=AGENT_TOOLS, hedge=hedge)
 
 
 # Define the function that calls the model
-def call_model(state):
-    messages = state["messages"]
-    response = model.invoke(messages)
+def call_model(state, config: RunnableConfig):
+    messages = _model_prompt(state, state["messages"], state.get("preferences"))
+    # A turn generated in advance for exactly this prompt (SPECULATIVE_RECIPES), if any
+    response = speculator.take(config["configurable"]["thread_id"], messages)
+    if response is None:
+        # configurable["model"] lets one run use another model (e.g. the fake model of the API warm-up)
+        response = _invoke_designer(messages, config, config["configurable"].get("model"),
+                                    _turn_kind(state, state.get("preferences")), hedge="call_model")
     # We return a list, because this will get added to the existing list
     #print(f"Inside model, response from model: {response}")
     return {"messages": [response]}
 
 
+# Run every real tool call of the last model turn; ToolNode runs them in parallel
+def call_tools(state, config: RunnableConfig):
+    calls = [call for call in _last_ai_message(state["messages"]).tool_calls if call["name"] != "AskHuman"]
+    # Unknown tool names get an error ToolMessage, so every tool_call_id is answered
+    return tool_node.invoke({"messages": [AIMessage(content="", tool_calls=calls)]},
+                            {**config, "max_concurrency": TOOL_MAX_CONCURRENCY})
+
+
 # We define a fake node to ask the human
 def ask_human(state):
     #print("\nInside ask_human node, the last mesage is:\n", state["messages"][-1])
-    tool_call_id = state["messages"][-1].tool_calls[0]["id"]
-   
-    tool_call_arguments = state["messages"][-1].tool_calls[0]["args"]["question"]
-    #print(f"Question for user (arguments): {tool_call_arguments}")
-    question_for_user = interrupt(tool_call_arguments)
-    tool_message = [{"tool_call_id": tool_call_id, "type": "tool", "content": question_for_user}]
+    calls = _ask_human_calls(_last_ai_message(state["messages"]))
+    # Several questions in one turn are asked together, in a single interrupt
+    question_for_user = interrupt("\n\n".join(call["args"]["question"] for call in calls))
+    tool_message = [{"tool_call_id": call["id"], "type": "tool", "content": question_for_user} for call in calls]
     return {"messages": tool_message}
 
 
+def _questionnaire_slot(message):
+    """Slot asked by a questionnaire message, None for any other message"""
+    return (getattr(message, "response_metadata", None) or {}).get("questionnaire_slot")
 
-# Build the graph!
 
-# Define a new graph
-workflow = StateGraph(MessagesState)
+def extract_preferences(question: str, answer: str, config: RunnableConfig) -> Dict[str, str]:
+    """Slots filled by `answer`, whichever question it was given to"""
+    messages = [SystemMessage(content=EXTRACTION_PROMPT.format(question=question)), HumanMessage(content=answer)]
+    # configurable["model"] replaces the extraction model too (fake models extract offline)
+    override = config["configurable"].get("model")
+    if override is not None:
+        extracted = invoke_model(override.with_structured_output(Preferences), messages, config)
+    else:
+        extractor = extraction_model.with_structured_output(Preferences)
+        extracted = invoke_routed("extract_preferences", messages, config, extractor, schema=Preferences)
+    return {slot: value for slot, value in extracted.model_dump().items() if value and value.strip()}
 
-# Define the three nodes we will cycle between
-workflow.add_node("agent", call_model)
-workflow.add_node("action", tool_node)
-workflow.add_node("ask_human", ask_human)
 
-# Set the entrypoint as `agent`
-# This means that this node is the first one called
-workflow.add_edge(START, "agent")
+# Templated question stage: records the answer to the previous question and asks the next one
+def questionnaire(state, config: RunnableConfig):
+    messages = state["messages"]
+    preferences = dict(state.get("preferences") or {})
+    # After ask_human the last two messages are the question and its answer
+    slot = _questionnaire_slot(messages[-2]) if len(messages) > 1 and messages[-1].type == "tool" else None
+    if slot is not None:
+        answer = messages[-1].content
+        extracted = {}
+        if config["configurable"].get("preference_extraction", PREFERENCE_EXTRACTION):
+            extracted = extract_preferences(messages[-2].tool_calls[0]["args"]["question"], answer, config)
+        # The asked slot keeps the user's own words unless the extraction found it; slots already filled are kept
+        preferences[slot] = extracted.pop(slot, None) or answer
+        for other, value in extracted.items():
+            preferences.setdefault(other, value)
+
+    pending = [(slot, question) for slot, question in QUESTIONNAIRE if slot not in preferences]
+    if not pending:
+        return {"preferences": preferences}
+    slot, question = pending[0]
+    # Same shape as the model's AskHuman calls, so ask_human, the API and the model's context don't change
+    tool_call = {"name": "AskHuman", "args": {"question": question}, "id": f"call_questionnaire_{slot}_{uuid.uuid4().hex[:8]}"}
+    message = AIMessage(content="", tool_calls=[tool_call], response_metadata={"questionnaire_slot": slot})
+    if len(pending) == 1 and config["configurable"].get("speculative_recipes", SPECULATIVE_RECIPES):
+        speculate_recipe(state, message, slot, preferences, config)
+    return {"messages": [message], "preferences": preferences}
+
+
+def speculate_recipe(state, question: AIMessage, slot: str, preferences: Dict[str, str], config: RunnableConfig) -> None:
+    """Start the model turns that follow the likely answers to `question`, the questionnaire's last one"""
+    thread_id = config["configurable"]["thread_id"]
+    override = config["configurable"].get("model")
+    background = {"configurable": {"thread_id": thread_id, "priority": "background"}}
+
+    def call(messages):
+        # Every likely answer completes the questionnaire, so these are recipe turns
+        return _invoke_designer(messages, background, override, "recipe")
+
+    for answer in LIKELY_ANSWERS.get(slot, []):
+        history = [*state["messages"], question, ToolMessage(content=answer, tool_call_id=question.tool_calls[0]["id"])]
+        answered = {**preferences, slot: answer}
+        prompt = _model_prompt(state, history, answered)
+
+        def confirm(response, history=history, answered=answered, parent=speculation_key(prompt)):
+            # The model asks to proceed: speculate the recipe that follows a "Yes"
+            if not response.tool_calls or response.tool_calls[0]["name"] != "AskHuman":
+                return
+            for confirmation in LIKELY_CONFIRMATIONS:
+                reply = ToolMessage(content=confirmation, tool_call_id=response.tool_calls[0]["id"])
+                speculator.submit(thread_id, _model_prompt(state, [*history, response, reply], answered), call, parent=parent)
+
+        speculator.submit(thread_id, prompt, call, then=confirm)
+
+
+def after_questionnaire(state):
+    # A new question was asked -> wait for the answer, otherwise every slot is filled
+    return "ask_human" if _questionnaire_slot(state["messages"][-1]) else "agent"
+
+
+def after_ask_human(state):
+    # Answers to questionnaire questions go back to the questionnaire, anything else to the model
+    return "questionnaire" if _questionnaire_slot(state["messages"][-2]) else "agent"
+
 
-# We now add a conditional edge
-workflow.add_conditional_edges(
-    # First, we define the start node. We use `agent`.
-    # This means these are the edges taken after the `agent` node is called.
-    "agent",
-    # Next, we pass in the function that will determine which node is called next.
-    should_continue,
-)
 
-# We now add a normal edge from `tools` to `agent`.
-# This means that after `tools` is called, `agent` node is called next.
-workflow.add_edge("action", "agent")
+# Build the graph!
+
+def build_workflow(questionnaire_mode: str = QUESTIONNAIRE_MODE) -> StateGraph:
+    """Graph of the cocktail designer. "template" asks QUESTIONNAIRE without the model, "llm" lets the model ask"""
+    if questionnaire_mode not in ("llm", "template"):
+        raise ValueError(f"Unknown QUESTIONNAIRE_MODE '{questionnaire_mode}', expected 'llm' or 'template'")
+
+    # Define a new graph
+    workflow = StateGraph(State)
+
+    # Define the three nodes we will cycle between
+    workflow.add_node("agent", call_model)
+    workflow.add_node("action", call_tools)
+    workflow.add_node("ask_human", ask_human)
+
+    if questionnaire_mode == "template":
+        # The questionnaire asks the four questions first, then hands over to the model
+        workflow.add_node("questionnaire", questionnaire)
+        workflow.add_edge(START, "questionnaire")
+        workflow.add_conditional_edges("questionnaire", after_questionnaire, ["ask_human", "agent"])
+        workflow.add_conditional_edges("ask_human", after_ask_human, ["questionnaire", "agent"])
+    else:
+        # Set the entrypoint as `agent`
+        # This means that this node is the first one called
+        workflow.add_edge(START, "agent")
+        # After we get back the human response, we go back to the agent
+        workflow.add_edge("ask_human", "agent")
 
-# After we get back the human response, we go back to the agent
-workflow.add_edge("ask_human", "agent")
+    # We now add a conditional edge
+    workflow.add_conditional_edges(
+        # First, we define the start node. We use `agent`.
+        # This means these are the edges taken after the `agent` node is called.
+        "agent",
+        # Next, we pass in the function that will determine which node is called next.
+        should_continue,
+    )
 
+    # After `action`, the `agent` node is called next, unless the same turn also asked the human
+    workflow.add_conditional_edges("action", after_action, ["ask_human", "agent"])
+    return workflow
 
-memory = MemorySaver()
+
+workflow = build_workflow()
+
+
+# MemorySaver, or DeltaMemorySaver with CHECKPOINTER_MODE=delta
+memory = checkpointer_from_env()
 
 # Finally, we compile it!
 # This compiles it into a LangChain Runnable,
@@ -174,16 +423,13 @@ def start_agent(agent: langgraph.graph.state.CompiledStateGraph, config: dict):
 
       run = agent.invoke(
       {
-            "messages": [ (
-                  "system",
-                  SYSTEM_PROMPT
-                  
-                  ) ,
+            "messages": [
                   (
                   "user",
                   "Help me build a cocktail!",  # "Use the search tool to ask the user where they are, then look up the weather there"
                   )
-            ]
+            ],
+            **registry.ref(SYSTEM_PROMPT_ID),
       },
       config,
       stream_mode="values",
@@ -195,19 +441,14 @@ def start_agent(agent: langgraph.graph.state.CompiledStateGraph, config: dict):
 if __name__ == "__main__":
       print(" Meet your pocket Mixologist ")
       agent = compile_agent()
+      sessions = SessionSnapshots(agent)
       config = {"configurable": {"thread_id": "2"}}
       response = start_agent(agent, config)
 
       while True:
-            state = agent.get_state(config)
-            has_interrupt = False
-            interrupt_value = None
-            for task in state.tasks:
-                  if hasattr(task, 'interrupts') and task.interrupts:
-                        has_interrupt = True
-                        interrupt_value = task.interrupts[0].value
-                        break
-            if has_interrupt:
+            snapshot = sessions.get(config)
+            interrupt_value = snapshot.interrupt_value
+            if interrupt_value is not None:
                   # Show the interrupt value to the user (likely a question)
                   print(f"Agent asks: {interrupt_value}")
                   
@@ -224,10 +465,11 @@ if __name__ == "__main__":
                        if agent_message.type == "ai":
                            # For AI messages, check if there are tool calls
                            if hasattr(agent_message, 'tool_calls') and agent_message.tool_calls:
-                               print(f"AI USING TOOL: {agent_message.tool_calls[0]['name']}")
-                               # If it's an AskHuman tool, display the question
-                               if agent_message.tool_calls[0]['name'] == "AskHuman":
-                                   print(f"QUESTION: {agent_message.tool_calls[0]['args']['question']}")
+                               for tool_call in agent_message.tool_calls:
+                                   print(f"AI USING TOOL: {tool_call['name']}")
+                                   # If it's an AskHuman tool, display the question
+                                   if tool_call['name'] == "AskHuman":
+                                       print(f"QUESTION: {tool_call['args']['question']}")
                            else:
                                # For regular AI messages with no tool calls
                                print(f"AI MESSAGE: {agent_message.content}")
@@ -243,7 +485,7 @@ if __name__ == "__main__":
                   
             else:
                   # No interrupt, just waiting for normal user input
-                  if not(agent.get_state(config).next):
+                  if snapshot.is_finished:
                        print(" \n\n ---APPLICATION HAS ENDED---")
                        break
                   else:
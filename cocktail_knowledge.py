@@ -0,0 +1,214 @@
+"""Local knowledge base of classic cocktails and ingredients, for the cocktail agent's tools.
+
+The dataset (cocktail_knowledge.json) holds classic specs with measurements,
+technique, glass, garnish and flavor profile, plus an ingredient table with
+categories and substitutions. `load_knowledge` builds the index once per
+process (the agent loads it at import) and every lookup then runs in memory
+without I/O:
+
+- inverted indexes from ingredient (full name, each word of the name and the
+  ingredient's category, so "rum", "lime" and "scotch" all match), flavor and
+  technique to frozensets of recipe ids; filters intersect their sets
+- fuzzy name lookup: exact match on normalized names and aliases first, then
+  a character-trigram index narrows the candidates for a difflib ranking
+
+`python knowledge_benchmark.py` measures the lookup latency.
+
+Configuration (environment variables):
+    COCKTAIL_KNOWLEDGE_PATH  dataset file (default: cocktail_knowledge.json next to this module)
+"""
+import difflib
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cocktail_knowledge.json")
+FUZZY_CUTOFF = 0.6
+MAX_RESOLVED = 10_000  # ingredient spellings remembered by resolve_ingredient
+
+
+def normalize(text: str) -> str:
+    """Lowercase ASCII words: "Piña  Colada!" -> "pina colada"."""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z0-9#&]+", " ", text.lower()).split())
+
+
+def _trigrams(text: str) -> FrozenSet[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class Recipe(NamedTuple):
+    name: str
+    ingredients: Tuple[Tuple[str, float, str], ...]  # (ingredient, amount, unit)
+    technique: str
+    glass: str
+    garnish: str
+    flavors: Tuple[str, ...]
+
+    def format(self) -> str:
+        amounts = ", ".join(f"{amount:g} {unit} {ingredient}" for ingredient, amount, unit in self.ingredients)
+        return (f"{self.name} ({self.technique}, {self.glass} glass, garnish: {self.garnish}; "
+                f"{'/'.join(self.flavors)}): {amounts}")
+
+
+class Ingredient(NamedTuple):
+    name: str
+    category: str
+    flavors: Tuple[str, ...]
+    substitutes: Tuple[str, ...]
+
+
+class CocktailKnowledge:
+    """Read-only indexes over the cocktail dataset."""
+
+    def __init__(self, recipes: Sequence[Recipe], ingredients: Dict[str, Ingredient], aliases: Dict[str, str],
+                 recipe_aliases: Sequence[Sequence[str]] = ()):
+        self.recipes = tuple(recipes)
+        self.ingredients = ingredients
+        self._aliases = {normalize(alias): normalize(target) for alias, target in aliases.items()}
+        self._resolved: Dict[str, Optional[str]] = {}
+
+        by_ingredient, by_flavor, by_technique = defaultdict(set), defaultdict(set), defaultdict(set)
+        self._by_name: Dict[str, int] = {}
+        trigrams = defaultdict(set)
+        for recipe_id, recipe in enumerate(self.recipes):
+            for ingredient, _, _ in recipe.ingredients:
+                for key in self._ingredient_keys(ingredient):
+                    by_ingredient[key].add(recipe_id)
+            for flavor in recipe.flavors:
+                by_flavor[flavor].add(recipe_id)
+            by_technique[recipe.technique].add(recipe_id)
+        self._by_ingredient = {key: frozenset(ids) for key, ids in by_ingredient.items()}
+        self._by_flavor = {key: frozenset(ids) for key, ids in by_flavor.items()}
+        self._by_technique = {key: frozenset(ids) for key, ids in by_technique.items()}
+
+        self._names: List[Tuple[str, int]] = []  # (normalized name or alias, recipe id)
+        for recipe_id, recipe in enumerate(self.recipes):
+            aliases_of_recipe = recipe_aliases[recipe_id] if recipe_id < len(recipe_aliases) else ()
+            for name in [normalize(recipe.name), *(normalize(alias) for alias in aliases_of_recipe)]:
+                self._by_name.setdefault(name, recipe_id)
+                for trigram in _trigrams(name):
+                    trigrams[trigram].add(len(self._names))
+                self._names.append((name, recipe_id))
+        self._name_trigrams = {key: frozenset(ids) for key, ids in trigrams.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CocktailKnowledge":
+        recipes = []
+        for entry in data["recipes"]:
+            recipes.append(Recipe(
+                name=entry["name"],
+                ingredients=tuple((normalize(i), float(amount), unit) for i, amount, unit in entry["ingredients"]),
+                technique=normalize(entry["technique"]),
+                glass=entry["glass"],
+                garnish=entry["garnish"],
+                flavors=tuple(normalize(f) for f in entry["flavors"]),
+            ))
+        ingredients = {
+            normalize(name): Ingredient(normalize(name), normalize(info["category"]), tuple(info["flavors"]),
+                                        tuple(info["substitutes"]))
+            for name, info in data["ingredients"].items()
+        }
+        return cls(recipes, ingredients, data.get("aliases", {}),
+                   [entry.get("aliases", []) for entry in data["recipes"]])
+
+    def _ingredient_keys(self, ingredient: str) -> Iterable[str]:
+        yield ingredient
+        yield from (word for word in ingredient.split() if len(word) > 2)
+        info = self.ingredients.get(ingredient)
+        if info is not None:
+            yield info.category
+
+    # ----------------------------------
+    # Lookups
+    # ----------------------------------
+    def resolve_ingredient(self, query: str) -> Optional[str]:
+        """Index key for an ingredient as the user wrote it (aliases, then close spellings), or None."""
+        if query in self._resolved:
+            return self._resolved[query]
+        key = normalize(query)
+        key = self._aliases.get(key, key)
+        if key not in self._by_ingredient:
+            # Spelling mistakes go through difflib once, then hit the memo
+            close = difflib.get_close_matches(key, self._by_ingredient.keys(), n=1, cutoff=0.8)
+            key = close[0] if close else None
+        if len(self._resolved) < MAX_RESOLVED:
+            self._resolved[query] = key
+        return key
+
+    def lookup(self, name: str) -> Optional[Recipe]:
+        """Recipe by name, tolerating typos ("negorni", "pina colada")."""
+        matches = self.search_names(name, limit=1)
+        return matches[0] if matches else None
+
+    def search_names(self, name: str, limit: int = 3) -> List[Recipe]:
+        key = normalize(name)
+        if key in self._by_name:
+            return [self.recipes[self._by_name[key]]]
+        # Candidates share at least a third of the query's trigrams; difflib ranks only those
+        counts: Dict[int, int] = defaultdict(int)
+        query_trigrams = _trigrams(key)
+        for trigram in query_trigrams:
+            for name_id in self._name_trigrams.get(trigram, ()):
+                counts[name_id] += 1
+        candidates = [name_id for name_id, count in counts.items() if count * 3 >= len(query_trigrams)]
+        scored = sorted(((difflib.SequenceMatcher(None, key, self._names[i][0]).ratio(), self._names[i][1])
+                         for i in candidates), reverse=True)
+        found: List[int] = []
+        for score, recipe_id in scored:
+            if score >= FUZZY_CUTOFF and recipe_id not in found:
+                found.append(recipe_id)
+        return [self.recipes[i] for i in found[:limit]]
+
+    def find(self, ingredients: Sequence[str] = (), flavors: Sequence[str] = (), technique: Optional[str] = None,
+             exclude: Sequence[str] = (), limit: int = 5, partial: bool = False) -> List[Recipe]:
+        """Recipes having every ingredient, flavor and the technique asked for, and none of `exclude`.
+
+        With `partial`, when nothing matches every filter the recipes matching
+        the most filters are returned instead. Unknown ingredients never match.
+        """
+        postings: List[FrozenSet[int]] = []
+        for ingredient in ingredients:
+            key = self.resolve_ingredient(ingredient)
+            postings.append(self._by_ingredient[key] if key else frozenset())
+        postings += [self._by_flavor.get(normalize(flavor), frozenset()) for flavor in flavors]
+        if technique:
+            postings.append(self._by_technique.get(normalize(technique), frozenset()))
+        excluded = frozenset().union(*(self._by_ingredient.get(self.resolve_ingredient(i) or "", frozenset())
+                                       for i in exclude))
+
+        if not postings:
+            return [r for i, r in enumerate(self.recipes) if i not in excluded][:limit]
+        matches = frozenset.intersection(*postings) - excluded
+        if matches or not partial:
+            ranked = sorted(matches)
+        else:
+            scores: Dict[int, int] = defaultdict(int)
+            for ids in postings:
+                for recipe_id in ids - excluded:
+                    scores[recipe_id] += 1
+            ranked = sorted(scores, key=lambda recipe_id: (-scores[recipe_id], recipe_id))
+        return [self.recipes[i] for i in ranked[:limit]]
+
+    def substitutes(self, ingredient: str) -> Optional[Ingredient]:
+        key = normalize(ingredient)
+        key = self._aliases.get(key, key)
+        if key not in self.ingredients:
+            close = difflib.get_close_matches(key, self.ingredients.keys(), n=1, cutoff=0.8)
+            if not close:
+                return None
+            key = close[0]
+        return self.ingredients[key]
+
+
+@lru_cache(maxsize=None)
+def load_knowledge(path: Optional[str] = None) -> CocktailKnowledge:
+    """Load the dataset and build its indexes; cached, so the work is done once per process and path."""
+    path = path or os.getenv("COCKTAIL_KNOWLEDGE_PATH", DEFAULT_PATH)
+    with open(path, encoding="utf-8") as f:
+        return CocktailKnowledge.from_dict(json.load(f))
@@ -0,0 +1,299 @@
+"""Streaming export of finished conversations to compressed archives.
+
+Finished cocktail and triage threads otherwise only live in the checkpointer.
+`ConversationExporter` walks the threads of a compiled graph and writes the
+finished ones to batch files, gzip-compressed JSONL (default) or Parquet
+(needs pyarrow). Each line or row holds one thread: its latest state values
+and its messages.
+
+The export is a generator pipeline: thread ids -> finished states -> records
+-> batch files. One thread is read at a time, JSONL records are written to the
+gzip stream as they are produced, and a Parquet batch holds at most
+`batch_size` records. Memory stays bounded whatever the number of threads.
+
+A thread is finished when the graph isn't waiting on it (no pending node or
+interrupt), the graph's own check passes (a recipe or a final answer was
+given) and it has been idle for `min_idle` seconds.
+
+Progress is checkpointed in a SQLite file next to the batches. A batch file is
+written under a temporary name and renamed once complete, and only then are
+its threads recorded as exported, with the checkpoint id they were exported
+at. A crashed or repeated run therefore skips what was already exported, and
+re-exports a thread only if it changed since. With `evict`, a thread is
+deleted from the checkpointer once its batch is recorded, unless it changed
+in the meantime.
+
+Example (a shared CHECKPOINTER_BACKEND, so the exporter sees the workers' threads):
+    python conversation_export.py --graph cocktail --out exports --format jsonl --evict
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, messages_to_dict
+from pydantic import BaseModel
+
+from checkpoint_introspection import list_threads
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MIN_IDLE = 300.0
+FORMATS = ("jsonl", "parquet")
+PROGRESS_FILE = "export_progress.sqlite"
+
+
+def _cocktail_finished(values: Dict[str, Any]) -> bool:
+    # The graph ended on a model turn without tool calls: the recipe (or a goodbye) was given
+    messages = values.get("messages") or []
+    return bool(messages) and messages[-1].type == "ai" and not messages[-1].tool_calls
+
+
+def _triage_finished(values: Dict[str, Any]) -> bool:
+    return bool(values.get("final_answer") or values.get("document_paths") or values.get("document_jobs"))
+
+
+FINISHED = {"cocktail": _cocktail_finished, "medical": _triage_finished}
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseMessage):
+        return messages_to_dict([value])[0]
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _age(created_at: Optional[str]) -> float:
+    """Seconds since an ISO checkpoint timestamp."""
+    if not created_at:
+        return float("inf")
+    return time.time() - datetime.fromisoformat(created_at).timestamp()
+
+
+class ExportProgress:
+    """Exported threads and written batches, in a SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS threads (graph TEXT, thread_id TEXT, checkpoint_id TEXT, batch TEXT,"
+                " exported_at REAL, PRIMARY KEY (graph, thread_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS batches (path TEXT PRIMARY KEY, graph TEXT, records INTEGER, created_at REAL)"
+            )
+
+    def exported_checkpoint(self, graph: str, thread_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT checkpoint_id FROM threads WHERE graph = ? AND thread_id = ?",
+                                     (graph, thread_id)).fetchone()
+        return row[0] if row else None
+
+    def record_batch(self, graph: str, path: str, threads: List[Tuple[str, str]]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?)", (path, graph, len(threads), now))
+            self._conn.executemany("INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?)",
+                                   [(graph, thread_id, checkpoint_id, path, now) for thread_id, checkpoint_id in threads])
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            threads = dict(self._conn.execute("SELECT graph, COUNT(*) FROM threads GROUP BY graph").fetchall())
+            batches = dict(self._conn.execute("SELECT graph, COUNT(*) FROM batches GROUP BY graph").fetchall())
+        return {"threads": threads, "batches": batches}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class _JsonlBatch:
+    """Gzip JSONL batch file; records go to the compressed stream as they come."""
+
+    suffix = ".jsonl.gz"
+
+    def __init__(self, path: str):
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetBatch:
+    """Parquet batch file, one row per thread; nested fields are stored as JSON strings."""
+
+    suffix = ".parquet"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rows: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._rows.append({k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+                           for k, v in record.items()})
+
+    def close(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.Table.from_pylist(self._rows), self.path, compression="zstd")
+        self._rows = []
+
+
+WRITERS = {"jsonl": _JsonlBatch, "parquet": _ParquetBatch}
+
+
+def _require_pyarrow() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("The parquet export format needs pyarrow (pip install pyarrow)") from e
+
+
+class ConversationExporter:
+    """Exports the finished threads of one compiled graph (see the module docstring)."""
+
+    def __init__(self, agent: Any, graph: str, out_dir: str, format: str = "jsonl",
+                 batch_size: int = DEFAULT_BATCH_SIZE, min_idle: float = DEFAULT_MIN_IDLE, evict: bool = False,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format '{format}', expected one of {FORMATS}")
+        if graph not in FINISHED:
+            raise ValueError(f"Unknown graph '{graph}', expected one of {tuple(FINISHED)}")
+        if format == "parquet":
+            _require_pyarrow()
+        self.agent = agent
+        self.graph = graph
+        self.out_dir = out_dir
+        self.format = format
+        self.batch_size = batch_size
+        self.min_idle = min_idle
+        self.evict = evict
+        self.on_evict = on_evict
+        self.report: Dict[str, Any] = {}
+        os.makedirs(out_dir, exist_ok=True)
+        self.progress = ExportProgress(os.path.join(out_dir, PROGRESS_FILE))
+
+    def finished_threads(self) -> Iterator[Tuple[str, Any]]:
+        """(thread id, state snapshot) of every finished thread not exported at its current checkpoint."""
+        for thread_id in list_threads(self.agent.checkpointer):
+            snapshot = self.agent.get_state({"configurable": {"thread_id": thread_id}})
+            checkpoint_id = snapshot.config["configurable"].get("checkpoint_id")
+            if snapshot.next or _age(snapshot.created_at) < self.min_idle:
+                continue
+            if not FINISHED[self.graph](snapshot.values):
+                continue
+            if self.progress.exported_checkpoint(self.graph, thread_id) == checkpoint_id:
+                # Exported by an earlier run without eviction
+                if self.evict:
+                    self._evict(thread_id, checkpoint_id)
+                continue
+            yield thread_id, snapshot
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        for thread_id, snapshot in self.finished_threads():
+            values = dict(snapshot.values)
+            messages = values.pop("messages", [])
+            yield {
+                "graph": self.graph,
+                "thread_id": thread_id,
+                "checkpoint_id": snapshot.config["configurable"].get("checkpoint_id"),
+                "updated_at": snapshot.created_at,
+                "message_count": len(messages),
+                "messages": messages_to_dict(messages),
+                "values": _jsonable(values),
+            }
+
+    def run(self) -> Dict[str, Any]:
+        """Export every finished thread; returns the batch files written and the thread counts."""
+        report = self.report = {"graph": self.graph, "format": self.format, "batches": [], "threads": 0, "evicted": 0,
+                                "evict_skipped": 0}
+        batch, path, threads = None, None, []
+        try:
+            for record in self.records():
+                if batch is None:
+                    name = f"{self.graph}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+                    path = os.path.join(self.out_dir, name + WRITERS[self.format].suffix)
+                    batch = WRITERS[self.format](path + ".tmp")
+                batch.write(record)
+                threads.append((record["thread_id"], record["checkpoint_id"]))
+                if len(threads) >= self.batch_size:
+                    self._finish_batch(batch, path, threads, report)
+                    batch, threads = None, []
+            if batch is not None:
+                self._finish_batch(batch, path, threads, report)
+        except BaseException:
+            # The unfinished batch is dropped; its threads aren't recorded, so the next run exports them
+            if batch is not None and os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            raise
+        return report
+
+    def _finish_batch(self, batch: Any, path: str, threads: List[Tuple[str, str]], report: Dict[str, Any]) -> None:
+        batch.close()
+        os.replace(path + ".tmp", path)
+        self.progress.record_batch(self.graph, path, threads)
+        report["batches"].append(path)
+        report["threads"] += len(threads)
+        if self.evict:
+            for thread_id, checkpoint_id in threads:
+                self._evict(thread_id, checkpoint_id)
+
+    def _evict(self, thread_id: str, checkpoint_id: str) -> None:
+        # A thread that got a new turn after it was read keeps its checkpoints
+        latest = self.agent.checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+        if latest is None or latest.config["configurable"].get("checkpoint_id") != checkpoint_id:
+            self.report["evict_skipped"] += 1
+            return
+        self.agent.checkpointer.delete_thread(thread_id)
+        if self.on_evict is not None:
+            self.on_evict(thread_id)
+        self.report["evicted"] += 1
+
+    def close(self) -> None:
+        self.progress.close()
+
+
+def _compile(graph: str) -> Any:
+    if graph == "medical":
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "medical-assistant"))
+        from agent import compile_agent
+    else:
+        from cocktail_agent import compile_agent
+    return compile_agent()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export finished conversations to compressed batch files")
+    parser.add_argument("--graph", choices=tuple(FINISHED), default="cocktail", help="graph whose threads are exported")
+    parser.add_argument("--out", default="exports", help="directory of the batch files and the progress file")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl", help="gzip JSONL or Parquet (needs pyarrow)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="threads per batch file")
+    parser.add_argument("--min-idle", type=float, default=DEFAULT_MIN_IDLE, help="seconds a thread must be idle")
+    parser.add_argument("--evict", action="store_true", help="delete exported threads from the checkpointer")
+    args = parser.parse_args()
+
+    exporter = ConversationExporter(_compile(args.graph), args.graph, args.out, format=args.format,
+                                    batch_size=args.batch_size, min_idle=args.min_idle, evict=args.evict)
+    try:
+        print(json.dumps(exporter.run(), indent=2))
+    finally:
+        exporter.close()
@@ -0,0 +1,200 @@
+"""Offline chat model backends for load tests, warm-up and local development.
+
+`ScriptedCocktailModel` plays the cocktail designer without calling OpenAI: it
+asks the four questions of SYSTEM_PROMPT through AskHuman, asks to proceed,
+presents a recipe and finishes once the user approves. As a structured-output
+model it extracts cocktail preferences by keyword. `RecordedChatModel`
+replays AI messages captured from real conversations with `RecordingChatModel`.
+Both can inject latency so queueing and tail-latency behaviour can be tested
+without network access: a fixed or uniform latency on every call, plus an
+optional straggler delay on a random share of the calls (to exercise hedging).
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import Field
+
+COCKTAIL_QUESTIONS = [
+    "Do you prefer a sweeter, sour, drier, or fruity cocktail?",
+    "Would you like your cocktail shaken, muddled, or stirred?",
+    "Which type of distilled alcohol do you favor (e.g., whisky, gin, vodka, etc.) or any fermented beverages?",
+    "Any additional ingredients that you would like or dislike?",
+]
+
+FAKE_RECIPE = """**Velvet Ember**
+
+Ingredients:
+- 50 ml gin
+- 25 ml fresh lemon juice
+- 20 ml honey syrup (2:1)
+- 2 dashes aromatic bitters
+
+Preparation:
+1. Add all ingredients to a shaker with ice.
+2. Shake hard for 12 seconds.
+3. Double strain into a chilled coupe.
+
+Serving suggestion: coupe glass, garnished with a lemon twist."""
+
+# Keywords found by the fake structured-output extraction, by preference slot (cocktail_agent.Preferences)
+PREFERENCE_KEYWORDS = {
+    "taste": ["sweet", "sour", "dry", "fruity", "bitter"],
+    "method": ["shaken", "muddled", "stirred"],
+    "spirit": ["whisky", "whiskey", "bourbon", "gin", "vodka", "rum", "tequila", "mezcal", "brandy", "cognac", "sake", "wine", "beer"],
+}
+
+
+def _latency(latency: Union[float, Tuple[float, float]]) -> float:
+    if isinstance(latency, (tuple, list)):
+        return random.uniform(*latency)
+    return latency
+
+
+def _usage(messages: List[BaseMessage], reply: str) -> dict:
+    # Same ~4 characters per token rule as llm_gateway.estimate_tokens
+    input_tokens = sum(len(str(m.content)) for m in messages) // 4
+    output_tokens = len(reply) // 4
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+class _FakeChatModel(BaseChatModel):
+    """Base class: tools are accepted and ignored, latency is slept before answering."""
+
+    latency: Union[float, Tuple[float, float]] = 0.0
+    # Share of calls that take `straggler_latency` extra seconds
+    straggler_rate: float = 0.0
+    straggler_latency: float = 0.0
+
+    def _sleep(self) -> None:
+        delay = _latency(self.latency)
+        if self.straggler_rate and random.random() < self.straggler_rate:
+            delay += self.straggler_latency
+        time.sleep(delay)
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self
+
+    def with_structured_output(self, schema: Any, **kwargs: Any):
+        """Keyword extraction into `schema`: fields named in PREFERENCE_KEYWORDS get the first keyword of the last user message"""
+        def extract(messages: List[BaseMessage]) -> Any:
+            self._sleep()
+            text = next((str(m.content) for m in reversed(messages) if m.type == "human"), "").lower()
+            found = {}
+            for field, keywords in PREFERENCE_KEYWORDS.items():
+                match = next((k for k in keywords if re.search(rf"\b{k}", text)), None)
+                if match and field in schema.model_fields:
+                    found[field] = match
+            parsed = schema(**found)
+            if not kwargs.get("include_raw"):
+                return parsed
+            # Same shape as LangChain's include_raw output, so callers can read the usage
+            reply = parsed.model_dump_json()
+            raw = AIMessage(content=reply, usage_metadata=_usage(messages, reply))
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        return RunnableLambda(extract)
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        raise NotImplementedError
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self._sleep()
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+
+class ScriptedCocktailModel(_FakeChatModel):
+    """Deterministic stand-in for the cocktail designer model.
+
+    With `revisions` > 0 the user is treated as asking for changes that many
+    times, so the recipe is presented again before the final message.
+    """
+
+    revisions: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-cocktail"
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        # Every user answer comes back as a tool message for an AskHuman call
+        tool_messages = [m for m in messages if m.type == "tool"]
+        answers = len(tool_messages)
+        # In the graph's questionnaire mode the questions were asked (or skipped) before the model's first turn
+        questionnaire = {call["id"] for m in messages if m.type == "ai" and m.response_metadata.get("questionnaire_slot")
+                         for call in m.tool_calls}
+        if questionnaire:
+            answers = len(COCKTAIL_QUESTIONS) + sum(1 for m in tool_messages if m.tool_call_id not in questionnaire)
+        if answers < len(COCKTAIL_QUESTIONS):
+            question = COCKTAIL_QUESTIONS[answers]
+        elif answers == len(COCKTAIL_QUESTIONS):
+            question = "I have all the information I need. May I proceed with creating your cocktail recipe?"
+        elif answers <= len(COCKTAIL_QUESTIONS) + 1 + self.revisions:
+            revision = answers - len(COCKTAIL_QUESTIONS) - 1
+            heading = f"Revision {revision}: " if revision else ""
+            question = f"{heading}{FAKE_RECIPE}\n\nDo you approve this cocktail?"
+        else:
+            content = f"Wonderful, enjoy your cocktail!\n\n{FAKE_RECIPE}"
+            return AIMessage(content=content, usage_metadata=_usage(messages, content))
+        tool_call = {"name": "AskHuman", "args": {"question": question}, "id": f"call_{uuid.uuid4().hex[:12]}"}
+        return AIMessage(content="", tool_calls=[tool_call], usage_metadata=_usage(messages, question))
+
+
+class RecordedChatModel(_FakeChatModel):
+    """Replays recorded AI messages by turn: the N-th AI message of a conversation is replayed for turn N."""
+
+    responses: List[BaseMessage] = Field(default_factory=list)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "RecordedChatModel":
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return cls(responses=messages_from_dict(records), **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded"
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        turn = sum(1 for m in messages if m.type == "ai")
+        recorded = self.responses[min(turn, len(self.responses) - 1)]
+        # Fresh tool call ids so replays never collide with earlier turns
+        tool_calls = [{**call, "id": f"call_{uuid.uuid4().hex[:12]}"} for call in getattr(recorded, "tool_calls", [])]
+        return AIMessage(content=recorded.content, tool_calls=tool_calls,
+                         usage_metadata=getattr(recorded, "usage_metadata", None) or _usage(messages, str(recorded.content)))
+
+
+class RecordingChatModel:
+    """Wraps a real model and appends every response to a JSONL file usable by RecordedChatModel."""
+
+    def __init__(self, model: Any, path: str):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def invoke(self, messages: Any, *args: Any, **kwargs: Any) -> Any:
+        response = self.model.invoke(messages, *args, **kwargs)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(message_to_dict(response)) + "\n")
+        return response
+
+
+def build_backend(name: str, latency: Union[float, Tuple[float, float]] = 0.0, recording: Optional[str] = None,
+                  straggler_rate: float = 0.0, straggler_latency: float = 0.0):
+    """Build an offline backend by name: "fake" (scripted) or "recorded" (needs `recording`)."""
+    stragglers = {"straggler_rate": straggler_rate, "straggler_latency": straggler_latency}
+    if name == "fake":
+        return ScriptedCocktailModel(latency=latency, **stragglers)
+    if name == "recorded":
+        if not recording:
+            raise ValueError("The recorded backend needs a recording file")
+        return RecordedChatModel.from_file(recording, latency=latency, **stragglers)
+    raise ValueError(f"Unknown backend '{name}', expected 'fake' or 'recorded'")
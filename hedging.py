@@ -0,0 +1,145 @@
+"""Hedged model calls: send a duplicate when the first one is unusually slow.
+
+Most model calls finish well within their usual latency; the tail comes from
+a few stragglers. `Hedger.call` starts the call and waits up to a
+percentile of the recent latencies of calls of the same kind (p95 by
+default). If the call hasn't returned by then, an identical duplicate (the
+"hedge") is fired. Whichever finishes first is used. The other is cancelled
+if it has not started yet, or otherwise left to finish in the background and
+its response dropped (blocking HTTP calls can't be interrupted).
+
+Hedges cost extra requests, so at most `max_rate` of the calls may be hedged;
+above that the caller just waits for its first call. Errors are not hedged:
+a call that fails before the delay raises at once, and a hedge only replaces
+a failed call if it succeeds itself.
+
+Configuration (environment variables, read by llm_gateway.py):
+    LLM_HEDGE                "1" enables hedging of the calls that ask for it (default: off)
+    LLM_HEDGE_PERCENTILE     latency percentile used as the hedge delay (default: 95)
+    LLM_HEDGE_MAX_RATE       maximum fraction of calls that get a hedge (default: 0.1)
+    LLM_HEDGE_INITIAL_DELAY  delay in seconds until enough latencies are known (default: 2.0)
+    LLM_HEDGE_MIN_DELAY      lower bound of the delay in seconds (default: 0.05)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_MAX_RATE = 0.1
+DEFAULT_INITIAL_DELAY = 2.0
+DEFAULT_MIN_DELAY = 0.05
+DEFAULT_MIN_SAMPLES = 20  # latencies needed before the percentile replaces the initial delay
+DEFAULT_SAMPLES = 1000  # recent latencies kept per kind of call
+DEFAULT_WORKERS = 64
+
+
+def _percentile(samples, percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Hedger:
+    """Runs calls with a latency-percentile hedge, tracking latencies per kind of call."""
+
+    def __init__(self, percentile: float = DEFAULT_PERCENTILE, max_rate: float = DEFAULT_MAX_RATE,
+                 initial_delay: float = DEFAULT_INITIAL_DELAY, min_delay: float = DEFAULT_MIN_DELAY,
+                 min_samples: int = DEFAULT_MIN_SAMPLES, samples: int = DEFAULT_SAMPLES,
+                 workers: int = DEFAULT_WORKERS):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        # Both attempts run on the pool so the caller can return whichever finishes first
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedging")
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=samples))
+        self._metrics = {"calls": 0, "hedges_fired": 0, "hedges_won": 0, "hedges_capped": 0}
+
+    def delay(self, kind: str) -> float:
+        """Seconds to wait for a call of `kind` before hedging it."""
+        with self._lock:
+            latencies = list(self._latencies[kind])
+        if len(latencies) < self.min_samples:
+            return max(self.min_delay, self.initial_delay)
+        return max(self.min_delay, _percentile(latencies, self.percentile))
+
+    def call(self, fn: Callable[[], Any], kind: str = "default") -> Any:
+        """Return `fn()`, hedged with a second `fn()` if the first is slower than `delay(kind)`."""
+        delay = self.delay(kind)
+        with self._lock:
+            self._metrics["calls"] += 1
+        primary = self._submit(fn, kind)
+        try:
+            return primary.result(timeout=delay)
+        except TimeoutError:
+            pass
+
+        with self._lock:
+            allowed = self._metrics["hedges_fired"] < self.max_rate * self._metrics["calls"]
+            self._metrics["hedges_fired" if allowed else "hedges_capped"] += 1
+        if not allowed:
+            return primary.result()
+
+        hedge = self._submit(fn, kind)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None:
+                for loser in pending:
+                    loser.cancel()
+                if winner is hedge:
+                    with self._lock:
+                        self._metrics["hedges_won"] += 1
+                return winner.result()
+        # Both attempts failed: report the original call's error
+        raise primary.exception()
+
+    def _submit(self, fn: Callable[[], Any], kind: str) -> Future:
+        # Each attempt runs in a copy of the caller's context (tracing, callbacks)
+        context = contextvars.copy_context()
+
+        def timed() -> Any:
+            started = time.monotonic()
+            result = fn()
+            with self._lock:
+                self._latencies[kind].append(time.monotonic() - started)
+            return result
+
+        return self._executor.submit(context.run, timed)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            calls, fired = self._metrics["calls"], self._metrics["hedges_fired"]
+            kinds = {kind: list(latencies) for kind, latencies in self._latencies.items()}
+            snapshot = {
+                **self._metrics,
+                "hedge_rate": fired / calls if calls else None,
+                "win_rate": self._metrics["hedges_won"] / fired if fired else None,
+            }
+        snapshot["kinds"] = {
+            kind: {
+                "samples": len(latencies),
+                "p50": _percentile(latencies, 50) if latencies else None,
+                "p99": _percentile(latencies, 99) if latencies else None,
+                "delay": self.delay(kind),
+            }
+            for kind, latencies in kinds.items()
+        }
+        return snapshot
+
+
+def hedger_from_env() -> Optional[Hedger]:
+    if os.getenv("LLM_HEDGE", "0") != "1":
+        return None
+    return Hedger(
+        percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", DEFAULT_PERCENTILE)),
+        max_rate=float(os.getenv("LLM_HEDGE_MAX_RATE", DEFAULT_MAX_RATE)),
+        initial_delay=float(os.getenv("LLM_HEDGE_INITIAL_DELAY", DEFAULT_INITIAL_DELAY)),
+        min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", DEFAULT_MIN_DELAY)),
+    )
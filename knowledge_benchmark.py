@@ -0,0 +1,56 @@
+"""Benchmark the cocktail knowledge base: index build time and lookup latency.
+
+Each query kind is timed `--repeat` times and reported as median and p99
+latency in microseconds. Lookups are pure in-memory work, so the numbers
+cover the index itself, not I/O.
+
+Example:
+    python knowledge_benchmark.py --repeat 20000
+"""
+import argparse
+import time
+
+from cocktail_knowledge import CocktailKnowledge, load_knowledge
+
+QUERIES = {
+    "name (exact)": lambda k: k.lookup("Negroni"),
+    "name (typo)": lambda k: k.lookup("espreso martni"),
+    "name (alias)": lambda k: k.lookup("piña colada"),
+    "ingredient": lambda k: k.find(ingredients=["gin"]),
+    "ingredients + flavor": lambda k: k.find(ingredients=["whisky", "lemon"], flavors=["sour"]),
+    "technique + exclude": lambda k: k.find(ingredients=["rum"], technique="shaken", exclude=["egg white"]),
+    "partial match": lambda k: k.find(ingredients=["mezcal", "campari"], partial=True),
+    "substitutes": lambda k: k.substitutes("Cointreau"),
+}
+
+
+def _percentile(samples: list, percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def time_query(knowledge: CocktailKnowledge, query, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        query(knowledge)
+        samples.append((time.perf_counter_ns() - started) / 1000)
+    return samples
+
+
+def main(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    knowledge = load_knowledge(args.path)
+    print(f"Index built in {(time.perf_counter() - started) * 1000:.1f} ms "
+          f"({len(knowledge.recipes)} recipes, {len(knowledge.ingredients)} ingredients)\n")
+    print(f"{'query':<24}{'p50 us':>10}{'p99 us':>10}")
+    for name, query in QUERIES.items():
+        samples = time_query(knowledge, query, args.repeat)
+        print(f"{name:<24}{_percentile(samples, 50):>10.1f}{_percentile(samples, 99):>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cocktail knowledge base lookup latency")
+    parser.add_argument("--repeat", type=int, default=10_000, help="timed calls per query kind")
+    parser.add_argument("--path", default=None, help="dataset file (default: COCKTAIL_KNOWLEDGE_PATH or the bundled one)")
+    main(parser.parse_args())
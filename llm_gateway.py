@@ -0,0 +1,649 @@
+"""Shared entry point for every LLM call made by the agents.
+
+All graph nodes (`call_model` in cocktail_agent.py, `llm_router`, `emergencial`
+and `diagnostico_diferencial` in medical-assistant/agent.py) invoke their model
+through `invoke_model`, which waits for a slot in a request (RPM) and token
+(TPM) budget before calling the provider. Waiting callers are served round-robin
+across sessions (graph threads), so one long conversation can't starve the
+others, and the budget can optionally be shared between processes through a
+SQLite file.
+
+Calls are also assigned a priority lane (see `LANES`). Higher lanes are always
+served first, part of the budget is held back for the "emergencial" lane, and
+when the queue overflows the lowest lanes are shed first with
+`LaneOverloadedError`. Per-lane wait and call latency are reported by
+`get_metrics`.
+
+Identical calls (same model, parameters, lane and message content) that
+overlap in time are coalesced: only the first one reaches the provider and
+every duplicate gets a copy of its response (see single_flight.py). A
+duplicate whose leader ran out of deadline makes the call on its own budget.
+
+Latency-critical nodes can ask for hedging (`hedge=<kind of call>`): when
+`LLM_HEDGE=1`, a call slower than the usual latency of its kind gets a
+duplicate and the first response wins (see hedging.py).
+
+Every call is bounded in time. `LLM_CALL_TIMEOUT` caps a single provider call,
+and a run can carry a deadline (`with_deadline`, set by the API from the HTTP
+request) that bounds the queue wait and the call itself. A call that can't
+finish before its deadline raises `DeadlineExceededError`; one that exceeds
+the per-call timeout raises `ModelTimeoutError`. Timed calls run on a pool of
+`LLM_CALL_WORKERS` threads; a call that can't even start on it in time raises
+`CallPoolSaturatedError`, which is local backpressure, not an upstream failure.
+Upstream failures (timeouts,
+connection errors, 5xx) feed a circuit breaker. While it is open, calls fail
+at once with `CircuitOpenError` (see circuit_breaker.py).
+
+Configuration (environment variables):
+    LLM_RATE_LIMIT        "0" disables the scheduler (calls go straight through)
+    LLM_RPM / LLM_TPM     requests and tokens per minute (defaults: 500 / 200000)
+    LLM_RATE_LIMIT_DB     path of a SQLite file to share the budget across processes
+    LLM_EXPECTED_COMPLETION_TOKENS  completion tokens reserved per call before the
+                          real usage is known (default: 512)
+    LLM_PRIORITY_RESERVE  fraction of each bucket only the top lane may use (default: 0.2)
+    LLM_MAX_QUEUE_DEPTH   waiting calls before lower lanes are shed (default: 100)
+    LLM_SINGLE_FLIGHT     "0" disables coalescing of identical in-flight calls
+    LLM_HEDGE             "1" enables hedging (tuning variables in hedging.py)
+    LLM_CALL_TIMEOUT      seconds a single model call may take, "0" for no limit (default: 60); also
+                          the HTTP timeout of backends that don't set their own (model_backends.py)
+    LLM_CALL_WORKERS      threads running model calls under a timeout, i.e. the cap on concurrent
+                          timed calls per process (default: 64)
+    LLM_CIRCUIT_BREAKER   "0" disables the circuit breaker (tuning variables in circuit_breaker.py)
+"""
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from statistics import quantiles
+from typing import Any, Dict, List, Optional, Tuple
+
+from circuit_breaker import CircuitOpenError, breaker_from_env
+from hedging import hedger_from_env
+from single_flight import SingleFlight
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+DEFAULT_EXPECTED_COMPLETION_TOKENS = 512
+DEFAULT_SESSION = "default"
+DEFAULT_PRIORITY_RESERVE = 0.2
+DEFAULT_MAX_QUEUE_DEPTH = 100
+DEFAULT_CALL_TIMEOUT = 60.0
+DEFAULT_CALL_WORKERS = 64  # threads running model calls under a timeout
+
+# Priority lanes, highest first
+LANES = ("emergencial", "interactive", "background")
+DEFAULT_LANE = "interactive"
+
+# (bucket name, refill rate per minute, amount to take, level the bucket must not go below)
+BucketRequest = Tuple[str, float, float, float]
+
+
+class LaneOverloadedError(RuntimeError):
+    """Raised when a call is shed from a low-priority lane because the queue is full."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a run's deadline passes before its model call could finish."""
+
+
+class ModelTimeoutError(TimeoutError):
+    """Raised when a single model call takes longer than `LLM_CALL_TIMEOUT`."""
+
+
+class CallPoolSaturatedError(TimeoutError):
+    """Raised when a model call couldn't start in time because every `LLM_CALL_WORKERS` thread is busy."""
+
+
+# ----------------------------------
+# Token bucket stores
+# ----------------------------------
+class LocalBucketStore:
+    """In-process token buckets. Each bucket holds at most one minute of budget."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # name -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def _level(self, name: str, rate: float, now: float) -> float:
+        tokens, updated_at = self._buckets.get(name, (rate, now))
+        return min(rate, tokens + (now - updated_at) * rate / 60.0)
+
+    def try_acquire(self, requests: List[BucketRequest]) -> float:
+        """Take `amount` from every bucket atomically.
+
+        Returns:
+            float: 0 if the budget was taken, otherwise the seconds to wait before retrying
+        """
+        with self._lock:
+            return self._try_acquire(requests)
+
+    def adjust(self, name: str, rate: float, delta: float) -> None:
+        """Give back (`delta` > 0) or charge (`delta` < 0) budget after the fact."""
+        with self._lock:
+            self._adjust(name, rate, delta)
+
+    def _try_acquire(self, requests: List[BucketRequest]) -> float:
+        now = time.time()
+        levels = {name: self._level(name, rate, now) for name, rate, _, _ in requests}
+        wait = 0.0
+        for name, rate, amount, floor in requests:
+            # A request bigger than the usable bucket only waits for a full bucket
+            missing = min(amount, rate - floor) + floor - levels[name]
+            if missing > 0:
+                wait = max(wait, missing * 60.0 / rate)
+        if wait > 0:
+            return wait
+        for name, rate, amount, _ in requests:
+            self._buckets[name] = (levels[name] - amount, now)
+        return 0.0
+
+    def _adjust(self, name: str, rate: float, delta: float) -> None:
+        now = time.time()
+        self._buckets[name] = (min(rate, self._level(name, rate, now) + delta), now)
+
+
+class SQLiteBucketStore(LocalBucketStore):
+    """Token buckets kept in a SQLite file so several processes share one budget."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, serializing all processes
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT name, tokens, updated_at FROM buckets").fetchall()
+            self._buckets = {name: (tokens, updated_at) for name, tokens, updated_at in rows}
+            result = fn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                [(name, tokens, updated_at) for name, (tokens, updated_at) in self._buckets.items()],
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def try_acquire(self, requests: List[BucketRequest]) -> float:
+        with self._lock:
+            return self._transaction(lambda: self._try_acquire(requests))
+
+    def adjust(self, name: str, rate: float, delta: float) -> None:
+        with self._lock:
+            self._transaction(lambda: self._adjust(name, rate, delta))
+
+
+# ----------------------------------
+# Fair scheduler
+# ----------------------------------
+class _Ticket:
+    __slots__ = ("session_id", "lane", "tokens", "enqueued_at", "shed")
+
+    def __init__(self, session_id: str, lane: str, tokens: int):
+        self.session_id = session_id
+        self.lane = lane
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.shed = False
+
+
+class _LaneStats:
+    """Wait and end-to-end call latency of one lane (recent samples kept for percentiles)."""
+
+    def __init__(self, samples: int = 1000):
+        self.granted = 0
+        self.shed = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.waits = deque(maxlen=samples)
+        self.latencies = deque(maxlen=samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "granted": self.granted,
+            "shed": self.shed,
+            "wait_seconds_avg": self.wait_seconds_total / self.granted if self.granted else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_p95": _percentile(self.waits, 95),
+            "latency_seconds_p50": _percentile(self.latencies, 50),
+            "latency_seconds_p95": _percentile(self.latencies, 95),
+        }
+
+
+def _percentile(samples, percent: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return quantiles(samples, n=100, method="inclusive")[percent - 1]
+
+
+class RateLimiter:
+    """Request/token budget scheduler with priority lanes and per-session fairness.
+
+    Every caller enqueues a ticket in its session's FIFO queue within its lane.
+    Only the ticket at the head of the session whose turn it is, in the highest
+    non-empty lane, may draw from the buckets; once it does, that session moves
+    to the back of its lane's rotation. Lanes below the top one may not draw
+    the buckets below `reserve` of their capacity, which keeps headroom for
+    emergencial calls even while the budget is saturated.
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM, store: Optional[LocalBucketStore] = None,
+                 reserve: float = DEFAULT_PRIORITY_RESERVE, max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.store = store or LocalBucketStore()
+        self.reserve = reserve
+        self.max_queue_depth = max_queue_depth
+        self._cond = threading.Condition()
+        self._lanes: Dict[str, "OrderedDict[str, deque]"] = {lane: OrderedDict() for lane in LANES}
+        self._lane_stats = {lane: _LaneStats() for lane in LANES}
+        self._metrics = {
+            "granted": 0,
+            "shed": 0,
+            "deadline_exceeded": 0,
+            "rate_limit_errors": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "estimated_tokens": 0,
+            "actual_tokens": 0,
+            "queue_depth_max": 0,
+        }
+
+    def _is_next(self, ticket: _Ticket) -> bool:
+        queues = next(queues for queues in self._lanes.values() if queues)
+        session_id = next(iter(queues))
+        return session_id == ticket.session_id and queues[session_id][0] is ticket
+
+    def _dequeue(self, ticket: _Ticket) -> None:
+        queues = self._lanes[ticket.lane]
+        queue = queues[ticket.session_id]
+        queue.remove(ticket)
+        if not queue:
+            del queues[ticket.session_id]
+        else:
+            # Sessions with more work go to the back of the rotation
+            queues.move_to_end(ticket.session_id)
+
+    def _admit(self, lane: str) -> None:
+        """Make room for a new call in `lane`, shedding the newest call of the lowest lower lane."""
+        if self.queue_depth() < self.max_queue_depth:
+            return
+        for victim_lane in reversed(LANES[LANES.index(lane) + 1:]):
+            waiting = [t for queue in self._lanes[victim_lane].values() for t in queue if not t.shed]
+            if waiting:
+                max(waiting, key=lambda t: t.enqueued_at).shed = True
+                # Wake the shed caller now rather than when its wait times out
+                self._cond.notify_all()
+                return
+        if lane != LANES[0]:
+            # Nothing lower to shed: reject the incoming call, the top lane is always admitted
+            self._lane_stats[lane].shed += 1
+            self._metrics["shed"] += 1
+            raise LaneOverloadedError(f"LLM queue is full ({self.queue_depth()} waiting), rejecting {lane} call")
+
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        """Calls waiting for the budget; shed calls still leaving the queue don't count."""
+        lanes = [lane] if lane else LANES
+        return sum(1 for name in lanes for queue in self._lanes[name].values() for t in queue if not t.shed)
+
+    def acquire(self, session_id: str, tokens: int, lane: str = DEFAULT_LANE, deadline: Optional[float] = None) -> float:
+        """Block until the call fits in the budget.
+
+        Returns:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            LaneOverloadedError: If the call was shed to make room for higher lanes
+            DeadlineExceededError: If `deadline` (a `time.time()` value) passed while waiting
+        """
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown LLM lane '{lane}', expected one of {LANES}")
+        ticket = _Ticket(session_id, lane, tokens)
+        reserve = 0.0 if lane == LANES[0] else self.reserve
+        requests = [
+            ("requests", self.rpm, 1, self.rpm * reserve),
+            ("tokens", self.tpm, tokens, self.tpm * reserve),
+        ]
+        with self._cond:
+            self._admit(lane)
+            self._lanes[lane].setdefault(session_id, deque()).append(ticket)
+            self._metrics["queue_depth_max"] = max(self._metrics["queue_depth_max"], self.queue_depth())
+            try:
+                while not ticket.shed:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        self._metrics["deadline_exceeded"] += 1
+                        raise DeadlineExceededError(f"Deadline passed after waiting {time.monotonic() - ticket.enqueued_at:.1f}s for the LLM budget")
+                    if self._is_next(ticket):
+                        wait = self.store.try_acquire(requests)
+                        if wait == 0:
+                            break
+                        self._cond.wait(timeout=wait if remaining is None else min(wait, remaining))
+                    else:
+                        # Woken up when the head of the rotation changes
+                        self._cond.wait(timeout=1.0 if remaining is None else min(1.0, remaining))
+            finally:
+                self._dequeue(ticket)
+                self._cond.notify_all()
+
+            stats = self._lane_stats[lane]
+            if ticket.shed:
+                stats.shed += 1
+                self._metrics["shed"] += 1
+                raise LaneOverloadedError(f"{lane} call shed to make room for higher-priority LLM work")
+
+            waited = time.monotonic() - ticket.enqueued_at
+            self._metrics["granted"] += 1
+            self._metrics["estimated_tokens"] += tokens
+            self._metrics["wait_seconds_total"] += waited
+            self._metrics["wait_seconds_max"] = max(self._metrics["wait_seconds_max"], waited)
+            stats.granted += 1
+            stats.wait_seconds_total += waited
+            stats.wait_seconds_max = max(stats.wait_seconds_max, waited)
+            stats.waits.append(waited)
+        return waited
+
+    def record_latency(self, lane: str, seconds: float) -> None:
+        """Record the end-to-end latency (queue + model call) of a call in `lane`."""
+        with self._cond:
+            self._lane_stats[lane].latencies.append(seconds)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        if actual_tokens is None:
+            return
+        self.store.adjust("tokens", self.tpm, estimated_tokens - actual_tokens)
+        with self._cond:
+            self._metrics["actual_tokens"] += actual_tokens
+
+    def penalize(self) -> None:
+        """Drain the request bucket after a provider 429 so callers back off together."""
+        self.store.adjust("requests", self.rpm, -self.rpm)
+        with self._cond:
+            self._metrics["rate_limit_errors"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            granted = self._metrics["granted"]
+            return {
+                **self._metrics,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queue_depth": self.queue_depth(),
+                "queued_sessions": sum(len(queues) for queues in self._lanes.values()),
+                "wait_seconds_avg": self._metrics["wait_seconds_total"] / granted if granted else 0.0,
+                "lanes": {
+                    lane: {"queue_depth": self.queue_depth(lane), **self._lane_stats[lane].snapshot()}
+                    for lane in LANES
+                },
+            }
+
+
+def limiter_from_env() -> Optional[RateLimiter]:
+    if os.getenv("LLM_RATE_LIMIT", "1") == "0":
+        return None
+    db_path = os.getenv("LLM_RATE_LIMIT_DB")
+    return RateLimiter(
+        rpm=float(os.getenv("LLM_RPM", DEFAULT_RPM)),
+        tpm=float(os.getenv("LLM_TPM", DEFAULT_TPM)),
+        store=SQLiteBucketStore(db_path) if db_path else LocalBucketStore(),
+        reserve=float(os.getenv("LLM_PRIORITY_RESERVE", DEFAULT_PRIORITY_RESERVE)),
+        max_queue_depth=int(os.getenv("LLM_MAX_QUEUE_DEPTH", DEFAULT_MAX_QUEUE_DEPTH)),
+    )
+
+
+limiter = limiter_from_env()
+in_flight = SingleFlight() if os.getenv("LLM_SINGLE_FLIGHT", "1") != "0" else None
+hedger = hedger_from_env()
+breaker = breaker_from_env()
+call_workers = int(os.getenv("LLM_CALL_WORKERS", DEFAULT_CALL_WORKERS))
+_timeout_executor = ThreadPoolExecutor(max_workers=call_workers, thread_name_prefix="llm-call")
+_timeout_lock = threading.Lock()
+# calls_running includes timed-out calls whose HTTP request is still holding its thread
+_timeout_metrics = {"call_timeouts": 0, "deadline_exceeded": 0, "pool_saturated": 0, "calls_running": 0}
+
+
+# ----------------------------------
+# Model invocation
+# ----------------------------------
+def _message_text(message: Any) -> str:
+    if isinstance(message, str):
+        return message
+    if isinstance(message, tuple):
+        return str(message[-1])
+    if isinstance(message, dict):
+        return str(message.get("content", ""))
+    return f"{getattr(message, 'content', message)}{getattr(message, 'tool_calls', '') or ''}"
+
+
+def estimate_tokens(messages: Any) -> int:
+    """Rough token count of a prompt (~4 characters per token) plus the expected completion."""
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()
+    if isinstance(messages, (str, tuple, dict)) or not hasattr(messages, "__iter__"):
+        messages = [messages]
+    characters = sum(len(_message_text(message)) for message in messages)
+    completion = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", DEFAULT_EXPECTED_COMPLETION_TOKENS))
+    return characters // 4 + completion
+
+
+def _actual_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def session_from_config(config: Optional[dict]) -> str:
+    return ((config or {}).get("configurable") or {}).get("thread_id") or DEFAULT_SESSION
+
+
+def with_deadline(config: dict, seconds: Optional[float]) -> dict:
+    """Copy of `config` whose model calls must all finish within `seconds` from now (None: no deadline)."""
+    if seconds is None:
+        return config
+    return {**config, "configurable": {**config.get("configurable", {}), "deadline": time.time() + seconds}}
+
+
+def deadline_from_config(config: Optional[dict]) -> Optional[float]:
+    """Wall-clock (`time.time()`) deadline of the run, if it has one."""
+    return ((config or {}).get("configurable") or {}).get("deadline")
+
+
+def _call_timeout() -> Optional[float]:
+    timeout = float(os.getenv("LLM_CALL_TIMEOUT", DEFAULT_CALL_TIMEOUT))
+    return timeout if timeout > 0 else None
+
+
+def _count_timeout(kind: str) -> None:
+    with _timeout_lock:
+        _timeout_metrics[kind] += 1
+
+
+def _is_upstream_error(error: Exception) -> bool:
+    """Errors that say the provider is unhealthy (timeouts, connection failures, 5xx), as opposed to the request."""
+    if isinstance(error, (DeadlineExceededError, LaneOverloadedError, CallPoolSaturatedError)):
+        return False
+    if isinstance(error, TimeoutError):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return type(error).__name__.endswith(("TimeoutError", "ConnectionError", "InternalServerError"))
+
+
+def lane_from_config(config: Optional[dict], lane: Optional[str] = None) -> str:
+    """Lane of a call: the run's `priority` setting wins over the node's default lane."""
+    return ((config or {}).get("configurable") or {}).get("priority") or lane or DEFAULT_LANE
+
+
+def _content_fingerprint(value: Any) -> Any:
+    """JSON-able view of a prompt that ignores message and tool-call ids."""
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, (list, tuple)):
+        return [_content_fingerprint(item) for item in value]
+    if hasattr(value, "content") and hasattr(value, "type"):
+        return {
+            "type": value.type,
+            "content": value.content,
+            "tool_calls": [(c["name"], c["args"]) for c in getattr(value, "tool_calls", None) or []],
+        }
+    return value
+
+
+def fingerprint(model: Any, messages: Any, lane: str) -> str:
+    """Hash identifying a call by model, bound parameters, lane and prompt content."""
+    from langchain_core.load import dumpd
+
+    payload = {"model": dumpd(model), "lane": lane, "messages": _content_fingerprint(messages)}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def invoke_model(model: Any, messages: Any, config: Optional[dict] = None, lane: Optional[str] = None,
+                 hedge: Optional[str] = None) -> Any:
+    """Call `model.invoke(messages)` once the shared budget allows it.
+
+    Args:
+        model: Any LangChain runnable (chat model, bound tools, structured output)
+        messages: Input passed to `model.invoke`
+        config: The node's RunnableConfig; its thread_id is the fairness session and
+            `configurable["priority"]` overrides the lane of every call in the run
+        lane: Default priority lane of the calling node (see `LANES`)
+        hedge: Kind of call (e.g. the node name) whose latencies set the hedge delay;
+            hedging applies only when this is given and `LLM_HEDGE=1`
+
+    Returns:
+        The model response
+    """
+    lane = lane_from_config(config, lane)
+    if hedger is not None and hedge:
+        # Each attempt (the call and its hedge) takes its own share of the budget
+        call = lambda: hedger.call(lambda: _invoke(model, messages, config, lane), kind=hedge)
+    else:
+        call = lambda: _invoke(model, messages, config, lane)
+    if in_flight is None:
+        return call()
+    # Retries, double-clicks and reruns share the call already in flight. The leader's
+    # deadline is its own: when it runs out (or finds no free call thread), followers
+    # with a longer budget make the call themselves
+    key = fingerprint(model, messages, lane)
+    return in_flight.do(key, call, retry_on=(DeadlineExceededError, CallPoolSaturatedError))
+
+
+def _invoke(model: Any, messages: Any, config: Optional[dict], lane: str) -> Any:
+    deadline = deadline_from_config(config)
+    if deadline is not None and deadline <= time.time():
+        _count_timeout("deadline_exceeded")
+        raise DeadlineExceededError("Deadline passed before the model call started")
+    if breaker is not None:
+        breaker.before_call()
+    try:
+        response = _invoke_within_budget(model, messages, config, lane, deadline)
+    except Exception as e:
+        if breaker is not None:
+            if _is_upstream_error(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+        raise
+    if breaker is not None:
+        breaker.record_success()
+    return response
+
+
+def _invoke_within_budget(model: Any, messages: Any, config: Optional[dict], lane: str, deadline: Optional[float]) -> Any:
+    if limiter is None:
+        return _invoke_with_timeout(model, messages, deadline)
+
+    started_at = time.monotonic()
+    estimated = estimate_tokens(messages)
+    limiter.acquire(session_from_config(config), estimated, lane, deadline=deadline)
+    try:
+        response = _invoke_with_timeout(model, messages, deadline)
+    except Exception as e:
+        if _is_rate_limit_error(e):
+            limiter.penalize()
+        raise
+    limiter.reconcile(estimated, _actual_tokens(response))
+    limiter.record_latency(lane, time.monotonic() - started_at)
+    return response
+
+
+def _invoke_with_timeout(model: Any, messages: Any, deadline: Optional[float]) -> Any:
+    """`model.invoke(messages)`, abandoned after the call timeout or at the deadline, whichever comes first.
+
+    A blocking HTTP call can't be interrupted: a timed-out call keeps its
+    thread until the client's own timeout, and its response is dropped. The
+    call timeout counts from when the call starts on the pool; waiting for a
+    free thread only counts against the deadline.
+    """
+    timeout = _call_timeout()
+    remaining = None if deadline is None else deadline - time.time()
+    limits = [limit for limit in (timeout, remaining) if limit is not None]
+    if not limits:
+        return model.invoke(messages)
+    if remaining is not None and remaining <= 0:
+        _count_timeout("deadline_exceeded")
+        raise DeadlineExceededError("Deadline passed while waiting for the LLM budget")
+
+    started = threading.Event()
+
+    def call():
+        started.set()
+        _count_timeout("calls_running")
+        try:
+            return model.invoke(messages)
+        finally:
+            with _timeout_lock:
+                _timeout_metrics["calls_running"] -= 1
+
+    future = _timeout_executor.submit(contextvars.copy_context().run, call)
+    if not started.wait(timeout=min(limits)) and future.cancel():
+        # Every thread is busy (typically with calls to a slow upstream): backpressure, not an upstream failure
+        _count_timeout("pool_saturated")
+        raise CallPoolSaturatedError(f"No free model call thread within {min(limits):.1f}s "
+                                     f"({call_workers} busy, see LLM_CALL_WORKERS)")
+    remaining = None if deadline is None else deadline - time.time()
+    limits = [limit for limit in (timeout, remaining) if limit is not None]
+    try:
+        return future.result(timeout=max(0.0, min(limits)))
+    except FutureTimeoutError:
+        if remaining is not None and (timeout is None or remaining < timeout):
+            _count_timeout("deadline_exceeded")
+            raise DeadlineExceededError(f"Model call cut at the run's deadline after {remaining:.1f}s") from None
+        _count_timeout("call_timeouts")
+        raise ModelTimeoutError(f"Model call took longer than {timeout:g}s") from None
+
+
+def get_metrics() -> Dict[str, Any]:
+    """Snapshot of the scheduler metrics (queue depth, waits, token usage, coalescing, hedging, timeouts)."""
+    with _timeout_lock:
+        timeouts = {**_timeout_metrics, "call_timeout_seconds": _call_timeout(), "call_workers": call_workers}
+    return {
+        "rate_limiter": limiter.metrics() if limiter else None,
+        "single_flight": in_flight.metrics() if in_flight else None,
+        "hedging": hedger.metrics() if hedger else None,
+        "timeouts": timeouts,
+        "circuit_breaker": breaker.metrics() if breaker else None,
+    }
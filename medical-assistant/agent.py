@@ -2,6 +2,8 @@
 # SECTION: IMPORTS
 # ----------------------------------
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal, Optional, Dict, List
 from datetime import datetime
 from devtools import pprint
@@ -13,11 +15,25 @@ from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI, OpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.types import Command, interrupt
 from langgraph.checkpoint.memory import MemorySaver
 
+# Shared modules live in the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_backends import chat_model
+from model_routing import invoke_routed
+from prompt_registry import registry, with_system_prompt
+from checkpointers import checkpointer_from_env
+from session_snapshot import SessionSnapshots
+
+# Geradores de PDF da Wisecare
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "wisecare-prescription"))
+from python_wrapper import generate_prescription, generate_exam_request, generate_medical_certificate
+from document_queue import default_queue
+
 # ----------------------------------
 # SECTION: ENVIRONMENT VARIABLES
 # ----------------------------------
@@ -33,8 +49,12 @@ os.environ['LANGSMITH_PROJECT'] = os.getenv('LANGSMITH_PROJECT')
 # ----------------------------------
 VALID_DECISION_OPTIONS = {"emergencial", "diagnostico_diferencial", "ask_human", "gerar_documentos"}
 
-global INTERACTION_COUNT
-INTERACTION_COUNT = 0
+# Maximum number of ask_human rounds before the case is escalated to emergencial
+MAX_INTERACTIONS = 3
+
+# Com DOCUMENT_QUEUE=1 os PDFs são enfileirados (wisecare-prescription/document_queue.py)
+# e o grafo responde com os ids dos jobs sem esperar a geração
+DOCUMENT_QUEUE = os.getenv("DOCUMENT_QUEUE", "0") == "1"
 
 # ----------------------------------
 # SECTION: STRUCTURED CLASSES
@@ -209,20 +229,66 @@ class MedicalCertificate(BaseModel):
     doctor: Doctor = Field(description="Informações do médico responsável pela emissão do atestado, incluindo nome, CRM e UF")
     appointmentTookPlaceIn: AppointmentTookPlaceIn = Field(description="Dados do local onde a consulta foi realizada, incluindo endereço completo")
 
+# ----------------------------------
+# SECTION: STRUCTURED CLASSES FOR COMBINED DOCUMENT EXTRACTION
+# ----------------------------------
+DocumentType = Literal["receita", "pedido_exame", "atestado"]
+
+# Dados do médico citados no caso (campos ausentes usam os valores padrão de Doctor)
+class LLMDoctor(BaseModel):
+    name: Optional[str] = Field(default=None, description="Nome do médico, se informado")
+    crm: Optional[str] = Field(default=None, description="CRM do médico, se informado")
+    uf: Optional[str] = Field(default=None, description="UF do CRM do médico, se informada")
+
+# Campos próprios de cada documento (os dados do paciente e do médico são compartilhados)
+class LLMPrescriptionDocument(BaseModel):
+    prescriptions: list[PrescriptionItem] = Field(
+        description="Lista de medicamentos prescritos",
+        default_factory=list
+    )
+
+class LLMExamRequestDocument(BaseModel):
+    clinicalIndication: str = Field(description="Motivo do pedido de exame, exatamente como informado pelo médico")
+    request: str = Field(description="Exames solicitados, exatamente como informados pelo médico")
+
+class LLMMedicalCertificateDocument(BaseModel):
+    period: str = Field(description="Período de afastamento ou repouso (ex: '7 dias', '2 semanas')")
+    notes: str = Field(description="Motivo do atestado, conforme informado pelo médico")
+
+# Saída do LLM com todos os documentos de uma consulta em uma única chamada
+class LLMConsultDocuments(BaseModel):
+    """Documentos pedidos em uma consulta; os documentos não solicitados ficam nulos."""
+    patient: LLMPatient
+    doctor: Optional[LLMDoctor] = Field(default=None, description="Dados do médico, apenas se informados")
+    receita: Optional[LLMPrescriptionDocument] = Field(default=None, description="Preencher somente se uma receita foi solicitada")
+    pedido_exame: Optional[LLMExamRequestDocument] = Field(default=None, description="Preencher somente se um pedido de exame foi solicitado")
+    atestado: Optional[LLMMedicalCertificateDocument] = Field(default=None, description="Preencher somente se um atestado foi solicitado")
+
 # ----------------------------------
 # SECTION: STATE DEFINITION
 # ----------------------------------
 class State(MessagesState):
     initial_human_input: Optional[str]
-    decision: Literal["emergencial", "diagnostico_diferencial", "ask_human", "receita_medica"]
+    decision: Literal["emergencial", "diagnostico_diferencial", "ask_human", "gerar_documentos"]
     case_synthesis: Optional[str]
     question_to_human: Optional[str]
     final_answer: Optional[str]
+    # Number of ask_human rounds in this thread (kept per thread so concurrent cases don't interfere)
+    interaction_count: int
+    # Router prompt reference in the prompt registry (the built-in text itself is not persisted)
+    prompt_id: Optional[str]
+    prompt_version: Optional[str]
+    # Texto de um ROUTER_PROMPT customizado, persistido para que outro worker ou um restart o encontre
+    prompt_text: Optional[str]
+    # Documento gerado -> caminho do PDF (preenchido pelo subgrafo gerar_documentos)
+    document_paths: Optional[Dict[str, str]]
+    # Documento enfileirado -> id do job (com DOCUMENT_QUEUE=1)
+    document_jobs: Optional[Dict[str, str]]
 
 # ----------------------------------
 # SECTION: LLM MODEL FOR ROUTER LLM
 # ----------------------------------
-model = ChatOpenAI(model="gpt-4o-mini")
+model = chat_model("llm_router")
 model = model.with_structured_output(RouterResponse)
 
 # ----------------------------------
@@ -326,6 +392,8 @@ Resposta:
 LEMBRE-SE: Caso haja qualquer dúvida sobre a suficiência das informações fornecidas pelo usuário, escolha a opção "ask_human". Utilize "ask_human" no máximo 3 vezes.
 
 Agora, analise o caso apresentado pelo usuário:"""
+ROUTER_PROMPT_ID = "medical_router"
+registry.register(ROUTER_PROMPT_ID, ROUTER_PROMPT)
 
 ROUTER_PROMPT_OLD = """Você é um LLM Router em um sistema médico multiagente. Sua função é avaliar se as informações fornecidas pelo usuário (médicos auxiliando pacientes) são SUFICIENTES para tomar uma decisão segura ou se é necessário solicitar mais dados.
 CONTEXTO DO SISTEMA:
@@ -548,17 +616,40 @@ Exemplo de saída válida:
     "notes": "Repouso devido a quadro de síndrome gripal"
 }}"""
 
+GENERATE_DOCUMENTS_PROMPT = """Você é responsável por extrair, em uma única resposta estruturada, os dados de TODOS os documentos médicos solicitados pelo médico (usuário), sem adicionar ou inventar nenhuma informação.
+
+SÍNTESE DO CASO:
+{input}
+
+HISTÓRICO DA CONVERSA (se disponível):
+{conversation_history}
+
+INSTRUÇÕES:
+1. "patient": nome, idade e gênero do paciente, compartilhados por todos os documentos. Use "" para dados não informados.
+2. "doctor": preencha apenas se o médico informou seu nome, CRM ou UF.
+3. Preencha SOMENTE os documentos solicitados e deixe os demais nulos:
+   - "receita" (receita médica, prescrição): para cada medicamento indicado, nome, dosagem e posologia. Utilize exclusivamente os medicamentos informados pelo médico.
+   - "pedido_exame" (pedido de exames): "clinicalIndication" com APENAS a indicação clínica fornecida e "request" com o pedido exatamente como informado.
+   - "atestado" (atestado, declaração de afastamento): "period" com o período de afastamento e "notes" com o motivo, como informados.
+4. NÃO INVENTE NENHUMA INFORMAÇÃO que não esteja explicitamente mencionada no input ou histórico.
+5. NÃO ADICIONE interpretações clínicas, hipóteses diagnósticas ou sugestões que não foram explicitamente fornecidas."""
+
 # ----------------------------------
 # NODES AND CONDITIONAL EDGES
 # ----------------------------------
 
 # LLM router n
-def llm_router(state: State):
+def llm_router(state: State, config: RunnableConfig):
       if state["messages"] and state["messages"][-1].type == "human":
             human_input = state["messages"][-1].content
             print("\nHuman input: ", human_input)
 
-            response = model.invoke(state["messages"])
+            # Routing turns decide whether a case is an emergency, so they share the emergencial lane
+            messages = with_system_prompt(state["messages"], state.get("prompt_id"), state.get("prompt_version"),
+                                          text=state.get("prompt_text"))
+            # Com MODEL_ROUTING, uma saída inválida do tier barato é refeita no tier seguinte
+            response = invoke_routed("llm_router", messages, config, model, schema=RouterResponse,
+                                     lane="emergencial", hedge="llm_router")
 
             print("THIS IS THE ROUTER RESPONSE:")
             pprint(response)
@@ -583,46 +674,201 @@ def llm_router(state: State):
       return state
 
 # Emergencial
-def emergencial(state: State):
-      global INTERACTION_COUNT
+def emergencial(state: State, config: RunnableConfig):
       print('INSIDE EMERGENCIAL')
       if state["case_synthesis"]:
             input = state["case_synthesis"]
             print(f"Using case_synthesis: {input}")
       else:
-            input = next((msg for msg in reversed(state["messages"]) if msg.type == "ai"), state["messages"][1:])
+            input = next((msg for msg in reversed(state["messages"]) if msg.type == "ai"),
+                         [msg for msg in state["messages"] if msg.type != "system"])
             print(f"Falling back on the last message from the LLM router: {input}")
 
-      response = ChatOpenAI(model="gpt-4o-mini").invoke(EMERGENCIAL_PROMPT.format(input=input))
+      response = invoke_routed("emergencial", EMERGENCIAL_PROMPT.format(input=input), config, chat_model("emergencial"),
+                               lane="emergencial")
       state["final_answer"] = response.content
       # Add final answer to the chat history
       state["messages"].append(AIMessage(content=response.content))
       # Reset count
-      INTERACTION_COUNT = 0 
+      state["interaction_count"] = 0
       
       return state
 
 # Diagnositico Diferencial
-def diagnostico_diferencial(state: State):
-      global INTERACTION_COUNT
+def diagnostico_diferencial(state: State, config: RunnableConfig):
       print("INSIDE DIAGNOSTICO DIFERENCIAL")
       if state["case_synthesis"]:
             input = state["case_synthesis"]
             print(f"Using case_synthesis: {input}")
       else:
-            input = next((msg for msg in reversed(state["messages"]) if msg.type == "ai"), state["messages"][1:])
+            input = next((msg for msg in reversed(state["messages"]) if msg.type == "ai"),
+                         [msg for msg in state["messages"] if msg.type != "system"])
             print(f"Falling back on the last message from the LLM router: {input}")
       
-      response = ChatOpenAI(model="gpt-4o-mini").invoke(DIAGNOSTICO_DIFERENCIAL_PROMPT.format(input=input))
+      response = invoke_routed("diagnostico_diferencial", DIAGNOSTICO_DIFERENCIAL_PROMPT.format(input=input), config,
+                               chat_model("diagnostico_diferencial"))
       state["final_answer"] = response.content
       # Add final answer to the chat history
       state["messages"].append(AIMessage(content=response.content))
 
       # Reset count
-      INTERACTION_COUNT = 0 
+      state["interaction_count"] = 0
       
       return state
 
+# ----------------------------------
+# DOCUMENT GENERATION SUBGRAPH
+# ----------------------------------
+# Modelo usado para extrair os dados dos documentos a partir do caso
+document_model = chat_model("gerar_documentos", temperature=0)
+
+class DocumentState(State):
+    # Payloads validados e erros de validação por documento (internos ao subgrafo)
+    document_payloads: Dict[str, dict]
+    document_errors: Dict[str, str]
+
+def _document_context(state: State) -> Dict[str, str]:
+      """Input e histórico da conversa para o prompt de geração de documentos."""
+      history = "\n".join(f"{msg.type}: {msg.content}" for msg in state["messages"]
+                          if msg.type in ("human", "ai") and msg.content)
+      return {"input": state.get("case_synthesis") or state.get("initial_human_input") or "",
+              "conversation_history": history}
+
+def extract_documents(context: Dict[str, str], config: RunnableConfig) -> LLMConsultDocuments:
+      """Extrai todos os documentos pedidos em uma consulta com uma única chamada ao modelo."""
+      return invoke_routed("gerar_documentos", GENERATE_DOCUMENTS_PROMPT.format(**context), config,
+                           document_model.with_structured_output(LLMConsultDocuments), schema=LLMConsultDocuments)
+
+def _require(document: str, **fields: Optional[str]) -> None:
+      missing = [name for name, value in fields.items() if not (value or "").strip()]
+      if missing:
+            raise ValueError(f"campos ausentes para {document}: {', '.join(missing)}")
+
+def _doctor(extraction: LLMConsultDocuments) -> Doctor:
+      informed = extraction.doctor.model_dump(exclude_none=True) if extraction.doctor else {}
+      return Doctor(**{field: value for field, value in informed.items() if value.strip()})
+
+def _payload_receita(extraction: LLMConsultDocuments) -> dict:
+      _require("receita", nome_do_paciente=extraction.patient.name)
+      if not extraction.receita.prescriptions:
+            raise ValueError("nenhum medicamento informado para a receita")
+      for item in extraction.receita.prescriptions:
+            _require("receita", medicamento=item.name, dosagem=item.dosage, posologia=item.posology)
+      return Prescription(
+            consultant=extraction.patient.model_dump(),
+            prescriptions=[item.model_dump() for item in extraction.receita.prescriptions],
+            doctor=_doctor(extraction).model_dump(),
+            appointmentTookPlaceIn=AppointmentTookPlaceIn().model_dump(),
+      ).model_dump()
+
+def _payload_pedido_exame(extraction: LLMConsultDocuments) -> dict:
+      document = extraction.pedido_exame
+      _require("pedido_exame", nome_do_paciente=extraction.patient.name,
+               clinicalIndication=document.clinicalIndication, request=document.request)
+      return ExamRequest(
+            consultant=extraction.patient.name,
+            clinicalIndication=document.clinicalIndication,
+            request=document.request,
+            doctor=_doctor(extraction),
+            appointmentTookPlaceIn=AppointmentTookPlaceIn(),
+            dateOfEmission=datetime.today().strftime("%d/%m/%Y"),
+      ).model_dump()
+
+def _payload_atestado(extraction: LLMConsultDocuments) -> dict:
+      document = extraction.atestado
+      _require("atestado", nome_do_paciente=extraction.patient.name, period=document.period, notes=document.notes)
+      return MedicalCertificate(
+            consultant=extraction.patient.name,
+            period=document.period,
+            notes=document.notes,
+            doctor=_doctor(extraction),
+            appointmentTookPlaceIn=AppointmentTookPlaceIn(),
+      ).model_dump()
+
+# Tipo de documento -> (montagem do payload, gerador do PDF, tipo de job na fila)
+DOCUMENTS = {
+      "receita": (_payload_receita, generate_prescription, "prescription"),
+      "pedido_exame": (_payload_pedido_exame, generate_exam_request, "exam_request"),
+      "atestado": (_payload_atestado, generate_medical_certificate, "medical_certificate"),
+}
+
+# Fila de documentos com seus workers, iniciada apenas com DOCUMENT_QUEUE=1
+document_queue = default_queue().start() if DOCUMENT_QUEUE else None
+
+def build_document_payloads(extraction: LLMConsultDocuments):
+      """Valida cada documento solicitado separadamente.
+
+      Returns:
+            (payloads, errors): payload da Wisecare por documento válido e a mensagem
+            de erro de cada documento inválido; um documento inválido não descarta os outros.
+      """
+      payloads, errors = {}, {}
+      for document, (build_payload, _, _) in DOCUMENTS.items():
+            if getattr(extraction, document) is None:
+                  continue
+            try:
+                  payloads[document] = build_payload(extraction)
+            except ValueError as e:  # inclui pydantic.ValidationError
+                  print(f"Invalid {document}: {e}")
+                  errors[document] = str(e)
+      return payloads, errors
+
+# Extrai e valida todos os documentos pedidos
+def extrair_documentos(state: DocumentState, config: RunnableConfig):
+      print("INSIDE EXTRAIR DOCUMENTOS")
+      extraction = extract_documents(_document_context(state), config)
+      state["document_payloads"], state["document_errors"] = build_document_payloads(extraction)
+      print("Documents to generate:", list(state["document_payloads"]))
+      return state
+
+# Enfileira os documentos e responde com os ids dos jobs, sem esperar pelos PDFs
+def _enfileirar_pdfs(state: DocumentState, payloads: Dict[str, dict], errors: Dict[str, str]):
+      skin_info = SkinInfo().model_dump()
+      jobs = {document: document_queue.submit(DOCUMENTS[document][2], payload, skin_info=skin_info)
+              for document, payload in payloads.items()}
+      lines = [f"- {document}: job {job_id}" for document, job_id in jobs.items()]
+      lines += [f"- {document}: erro ao gerar ({error})" for document, error in errors.items()]
+      state["document_jobs"] = jobs
+      return "Documentos em geração:\n" + "\n".join(lines)
+
+# Gera todos os documentos em paralelo: o tempo total é o do documento mais lento
+def _gerar_pdfs_em_paralelo(state: DocumentState, payloads: Dict[str, dict], errors: Dict[str, str]):
+      paths = {}
+      if payloads:
+            skin_info = SkinInfo().model_dump()
+            with ThreadPoolExecutor(max_workers=len(payloads), thread_name_prefix="documentos") as executor:
+                  futures = {document: executor.submit(DOCUMENTS[document][1], payload, skin_info=skin_info)
+                             for document, payload in payloads.items()}
+                  for document, future in futures.items():
+                        # Uma falha não descarta os documentos que foram gerados
+                        try:
+                              paths[document] = future.result()
+                        except Exception as e:
+                              print(f"Failed to generate {document}: {e}")
+                              errors[document] = str(e)
+
+      lines = [f"- {document}: {path}" for document, path in paths.items()]
+      lines += [f"- {document}: erro ao gerar ({error})" for document, error in errors.items()]
+      state["document_paths"] = paths
+      return "Documentos gerados:\n" + "\n".join(lines)
+
+def gerar_pdfs(state: DocumentState, config: RunnableConfig):
+      print("INSIDE GERAR PDFS")
+      payloads = state.get("document_payloads") or {}
+      errors = dict(state.get("document_errors") or {})
+      if not payloads and not errors:
+            answer = "Nenhum documento foi identificado no pedido."
+      elif document_queue is not None:
+            answer = _enfileirar_pdfs(state, payloads, errors)
+      else:
+            answer = _gerar_pdfs_em_paralelo(state, payloads, errors)
+      state["final_answer"] = answer
+      state["messages"].append(AIMessage(content=answer))
+      # Reset count
+      state["interaction_count"] = 0
+
+      return state
+
 # Human Node
 def ask_human(state: State):
       print(" INSIDE ask_human node")
@@ -644,7 +890,8 @@ def ask_human(state: State):
                     "role": "human",
                     "content": user_input,
                 }
-            ]
+            ],
+            "interaction_count": state.get("interaction_count", 0) + 1,
             }
         ,
         goto="llm_router",
@@ -652,7 +899,7 @@ def ask_human(state: State):
 
 # Conditional edge:
 def router(state: State):
-    global INTERACTION_COUNT
+    interaction_count = state.get("interaction_count", 0)
     decision = state.get("decision")
     if not isinstance(decision, str):
         raise ValueError(f"state['decision'] must be a string, but got {decision} of type {type(decision).__name__}")
@@ -660,13 +907,12 @@ def router(state: State):
     if decision not in VALID_DECISION_OPTIONS:
         raise ValueError(f"state['decision'] must be one of {VALID_DECISION_OPTIONS}, but got '{decision}'")
     
-    if INTERACTION_COUNT >= 3:
-         print(f"\n\n ****Warning: interaction number greater than {INTERACTION_COUNT}, routing to emergencial**** \n\n")
+    if interaction_count >= MAX_INTERACTIONS:
+         print(f"\n\n ****Warning: interaction number greater than {interaction_count}, routing to emergencial**** \n\n")
          return "emergencial"
     
     elif decision == "ask_human":
-        INTERACTION_COUNT += 1 
-        print(f"INSIDE ROUTER selected ask_human.\nINTERACTION COUNT: {INTERACTION_COUNT}")
+        print(f"INSIDE ROUTER selected ask_human.\nINTERACTION COUNT: {interaction_count + 1}")
         return "ask_human"
     elif decision == "diagnostico_diferencial":
         print("INSIDE ROUTER selected \"diagnostico_diferencial\"")
@@ -682,19 +928,30 @@ def router(state: State):
 # ----------------------------------
 # BUILDING AND COMPILING THE GRAPH
 # ----------------------------------
+# Subgrafo de geração de documentos
+document_workflow = StateGraph(DocumentState)
+document_workflow.add_node("extrair_documentos", extrair_documentos)
+document_workflow.add_node("gerar_pdfs", gerar_pdfs)
+document_workflow.add_edge(START, "extrair_documentos")
+document_workflow.add_edge("extrair_documentos", "gerar_pdfs")
+document_workflow.add_edge("gerar_pdfs", END)
+
 workflow = StateGraph(State)
 workflow.add_node("ask_human", ask_human)
 workflow.add_node("llm_router", llm_router)  
 workflow.add_node("diagnostico_diferencial", diagnostico_diferencial)
 workflow.add_node("emergencial", emergencial)
+workflow.add_node("gerar_documentos", document_workflow.compile())
 
 workflow.add_edge(START, "llm_router")
 workflow.add_edge("ask_human", "llm_router")
 workflow.add_edge("diagnostico_diferencial", END)
 workflow.add_edge("emergencial", END)
+workflow.add_edge("gerar_documentos", END)
 workflow.add_conditional_edges("llm_router", router)
 
-memory = MemorySaver()
+# MemorySaver, or DeltaMemorySaver with CHECKPOINTER_MODE=delta
+memory = checkpointer_from_env()
 
 #agent = workflow.compile(checkpointer=memory)
 #display(Image(app.get_graph().draw_mermaid_png()))
@@ -702,22 +959,34 @@ memory = MemorySaver()
 def compile_agent():
      return workflow.compile(checkpointer=memory)
 
-def start_agent(agent: CompiledStateGraph, user_input: str, config: dict, ROUTER_PROMPT: str = ROUTER_PROMPT):
-
-      for event in agent.stream(
-            {
+def build_initial_input(user_input: str, ROUTER_PROMPT: str = ROUTER_PROMPT) -> dict:
+      """Initial graph input for a new case description.
+
+      The router prompt is referenced by id and version and injected when the
+      router model is called. A custom ROUTER_PROMPT gets its own version and
+      its text is stored in the thread's state, since other workers and later
+      restarts only know the built-in prompt.
+      """
+      version = registry.register(ROUTER_PROMPT_ID, ROUTER_PROMPT, latest=False)
+      custom = {"prompt_text": ROUTER_PROMPT} if version != registry.latest(ROUTER_PROMPT_ID)[0] else {}
+      return {
             "messages": [
-                  (
-                  "system",
-                  ROUTER_PROMPT
-                  ),
                   (
                   "user",
                   user_input, 
                   )
             ],
-            "initial_human_input": user_input
-            },
+            "initial_human_input": user_input,
+            "interaction_count": 0,
+            "prompt_id": ROUTER_PROMPT_ID,
+            "prompt_version": version,
+            **custom,
+            }
+
+def start_agent(agent: CompiledStateGraph, user_input: str, config: dict, ROUTER_PROMPT: str = ROUTER_PROMPT):
+
+      for event in agent.stream(
+            build_initial_input(user_input, ROUTER_PROMPT),
             config,
             stream_mode="values",
             ):
@@ -761,17 +1030,12 @@ if __name__ == "__main__" :
       user_input = ambiguous_inputs[0]
 
       start_agent(agent, user_input = user_input, config = config)
+      sessions = SessionSnapshots(agent)
 
       while True:
-            state = agent.get_state(config)
-            has_interrupt = False
-            interrupt_value = None
-            for task in state.tasks:
-                  if hasattr(task, 'interrupts') and task.interrupts:
-                        has_interrupt = True
-                        interrupt_value = task.interrupts[0].value
-                        break
-            if has_interrupt:
+            snapshot = sessions.get(config)
+            interrupt_value = snapshot.interrupt_value
+            if interrupt_value is not None:
                   # Show the interrupt value to the user (likely a question)
                   print(f"Agent asks: {interrupt_value}")
                   
@@ -785,7 +1049,7 @@ if __name__ == "__main__" :
              
             else:
                   # No interrupt, just waiting for normal user input
-                  if not(agent.get_state(config).next):
+                  if snapshot.is_finished:
                        print(" \n\n ---APPLICATION HAS ENDED---")
                        break
                   else:
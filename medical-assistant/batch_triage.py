@@ -0,0 +1,172 @@
+# ----------------------------------
+# SECTION: IMPORTS
+# ----------------------------------
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional, Set
+
+from agent import compile_agent, build_initial_input
+
+# ----------------------------------
+# SECTION: GLOBAL VARIABLES AND PARAMETERS
+# ----------------------------------
+DEFAULT_MAX_CONCURRENCY = 8
+TEXT_FIELDS = ("text", "description", "case", "descricao")
+ID_FIELDS = ("case_id", "id")
+
+# Statuses that count as "done" when resuming; errors are retried on the next run
+FINAL_STATUSES = {"done", "parked"}
+
+# ----------------------------------
+# SECTION: INPUT AND PROGRESS
+# ----------------------------------
+def read_cases(input_path: str) -> Iterator[Dict[str, str]]:
+    """Yield `{"case_id", "text"}` dicts from a JSONL or CSV intake file.
+
+    Rows are expected to have a text column (`text`, `description`, `case` or
+    `descricao`) and optionally an id column (`case_id` or `id`). Rows without
+    an id get their line number, so re-running the same file stays resumable.
+    """
+    if input_path.endswith(".csv"):
+        with open(input_path, newline="", encoding="utf-8") as f:
+            rows = ((i, row) for i, row in enumerate(csv.DictReader(f), start=1))
+            yield from _normalize(rows)
+    else:
+        with open(input_path, encoding="utf-8") as f:
+            rows = ((i, json.loads(line)) for i, line in enumerate(f, start=1) if line.strip())
+            yield from _normalize(rows)
+
+def _normalize(rows) -> Iterator[Dict[str, str]]:
+    for line_number, row in rows:
+        text = next((row[k] for k in TEXT_FIELDS if row.get(k)), None)
+        if not text:
+            print(f"Skipping line {line_number}: no case text in {list(row)}")
+            continue
+        case_id = next((str(row[k]) for k in ID_FIELDS if row.get(k)), str(line_number))
+        yield {"case_id": case_id, "text": text}
+
+def load_progress(*paths: str) -> Set[str]:
+    """Return the ids of cases already finished (done or parked) in previous runs."""
+    finished = set()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write can leave a truncated last line
+                    continue
+                if record.get("status") in FINAL_STATUSES:
+                    finished.add(record["case_id"])
+    return finished
+
+class ResultWriter:
+    """Append results to JSONL files as soon as each case finishes."""
+
+    def __init__(self, output_path: str, parked_path: str):
+        self._lock = threading.Lock()
+        self._output = open(output_path, "a", encoding="utf-8")
+        self._parked = open(parked_path, "a", encoding="utf-8")
+
+    def write(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._output.write(line)
+            self._output.flush()
+            if record["status"] == "parked":
+                self._parked.write(line)
+                self._parked.flush()
+
+    def close(self) -> None:
+        self._output.close()
+        self._parked.close()
+
+# ----------------------------------
+# SECTION: BATCH RUNNER
+# ----------------------------------
+def summarize_case(agent, case: Dict[str, str], config: dict, started_at: float, error: Optional[Exception] = None) -> Dict:
+    """Build the output record of a case from its final graph state."""
+    record = {"case_id": case["case_id"], "thread_id": config["configurable"]["thread_id"], "text": case["text"]}
+    if error is not None:
+        record.update(status="error", error=f"{type(error).__name__}: {error}")
+    else:
+        state = agent.get_state(config)
+        interrupt_value = next((task.interrupts[0].value for task in state.tasks if task.interrupts), None)
+        if interrupt_value is not None:
+            # The router needs more information: park the case with its question instead of blocking
+            record.update(status="parked", question_to_human=interrupt_value)
+        else:
+            record.update(status="done", final_answer=state.values.get("final_answer"))
+        record.update(
+            decision=state.values.get("decision"),
+            case_synthesis=state.values.get("case_synthesis"),
+        )
+    record["elapsed_seconds"] = round(time.time() - started_at, 3)
+    return record
+
+def run_batch(input_path: str, output_path: str, parked_path: Optional[str] = None,
+              max_concurrency: int = DEFAULT_MAX_CONCURRENCY, agent=None) -> Dict[str, int]:
+    """Run every pending case of `input_path` through the medical graph.
+
+    Cases are executed with `batch_as_completed`, so at most `max_concurrency`
+    graphs run at once and each result is written as soon as it finishes.
+    Cases that end on an `ask_human` interrupt are written with status
+    "parked" (also copied to `parked_path`) together with the router question,
+    so they can be answered later and re-submitted with the extra information.
+    Re-running with the same output file skips cases already done or parked.
+
+    Returns:
+        Dict[str, int]: Count of cases per status for this run
+    """
+    parked_path = parked_path or f"{os.path.splitext(output_path)[0]}.parked.jsonl"
+    agent = agent or compile_agent()
+
+    finished = load_progress(output_path)
+    cases = [case for case in read_cases(input_path) if case["case_id"] not in finished]
+    print(f"{len(finished)} cases already processed, {len(cases)} pending")
+    if not cases:
+        return {}
+
+    run_id = os.urandom(3).hex()
+    inputs = [build_initial_input(case["text"]) for case in cases]
+    configs = [
+        # Overnight pre-triage runs in the background lane so live consults are served first
+        {"configurable": {"thread_id": f"batch-{run_id}-{case['case_id']}", "priority": "background"},
+         "max_concurrency": max_concurrency}
+        for case in cases
+    ]
+
+    counts = {"done": 0, "parked": 0, "error": 0}
+    started_at = time.time()
+    writer = ResultWriter(output_path, parked_path)
+    try:
+        for index, output in agent.batch_as_completed(inputs, configs, return_exceptions=True):
+            error = output if isinstance(output, Exception) else None
+            record = summarize_case(agent, cases[index], configs[index], started_at, error)
+            writer.write(record)
+            counts[record["status"]] += 1
+            print(f"[{sum(counts.values())}/{len(cases)}] case {record['case_id']}: {record['status']} "
+                  f"(done={counts['done']} parked={counts['parked']} errors={counts['error']})")
+    finally:
+        writer.close()
+
+    elapsed = time.time() - started_at
+    print(f"Batch finished in {elapsed:.1f}s ({len(cases) / elapsed:.2f} cases/s). Parked cases: {parked_path}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-triage a queue of case descriptions with the medical graph.")
+    parser.add_argument("input", help="JSONL or CSV file with one case per row")
+    parser.add_argument("output", help="JSONL file where results are appended (also used to resume)")
+    parser.add_argument("--parked", default=None, help="JSONL file for cases waiting on ask_human")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    run_batch(args.input, args.output, parked_path=args.parked, max_concurrency=args.max_concurrency)
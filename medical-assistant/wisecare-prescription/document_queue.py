@@ -0,0 +1,370 @@
+"""Durable job queue for PDF generation, backed by a SQLite file.
+
+Generating a document through python_wrapper.py takes seconds (Node startup
+plus the WiseAPI create/sign/download round trips), so callers enqueue a job
+and poll for it instead of waiting. Jobs live in a SQLite table: they survive
+restarts. Any number of processes can submit to the same file and consume it.
+
+A job moves through `queued -> running -> succeeded | failed`. A failed
+attempt goes back to `queued` with an exponential backoff until
+`max_attempts` is reached. A worker holds a job under a lease, which it
+renews while the job runs; if the process dies, the lease expires and another
+worker picks the job up again. That counts as an attempt too, so a job that
+keeps killing its worker ends up `failed`.
+
+Every job records when it was submitted, started and finished, how many
+attempts it took and whether the PDF came from the PDF cache.
+
+Usage:
+    queue = default_queue()
+    queue.start()
+    job_id = queue.submit("prescription", payload, skin_info=skin_info)
+    queue.status(job_id)["status"]    # "queued", "running", "succeeded" or "failed"
+    queue.result(job_id, timeout=60)  # path of the PDF
+
+    # Dedicated worker process consuming the same file
+    python document_queue.py worker --workers 4
+
+Configuration (environment variables):
+    WISECARE_QUEUE_DB            path of the SQLite file (default: output/jobs.sqlite3)
+    WISECARE_QUEUE_WORKERS       worker threads per process (default: 2)
+    WISECARE_QUEUE_MAX_ATTEMPTS  attempts before a job fails (default: 3)
+    WISECARE_QUEUE_BACKOFF       delay before the first retry in seconds, doubled on each retry (default: 2)
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from python_wrapper import generate_prescription, generate_exam_request, generate_medical_certificate
+
+# Get the absolute path to the current directory
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(CURRENT_DIR, 'output', 'jobs.sqlite3')
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF = 2.0
+DEFAULT_LEASE = 300.0  # seconds a running job stays claimed without renewal before another worker may retry it
+POLL_INTERVAL = 0.5  # seconds between checks for jobs submitted by other processes
+
+# Document type -> generator from python_wrapper.py
+GENERATORS: Dict[str, Callable[..., Any]] = {
+    "prescription": generate_prescription,
+    "exam_request": generate_exam_request,
+    "medical_certificate": generate_medical_certificate,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    document_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    cache_hit INTEGER,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    run_seconds REAL
+)
+"""
+
+
+class JobFailedError(Exception):
+    """Raised by `DocumentQueue.result` when a job failed on every attempt."""
+
+
+class DocumentQueue:
+    """SQLite-backed queue of document jobs with a pool of worker threads.
+
+    Times are wall-clock (`time.time()`) because they are shared between processes.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, workers: int = DEFAULT_WORKERS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff: float = DEFAULT_BACKOFF,
+                 lease: float = DEFAULT_LEASE, generators: Optional[Dict[str, Callable[..., Any]]] = None):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.generators = generators or GENERATORS
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers poll while a worker writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ----------------------------------
+    # Client API
+    # ----------------------------------
+    def submit(self, document_type: str, payload: Dict[str, Any], skin_info: Optional[Dict[str, Any]] = None,
+               output_path: Optional[str] = None, max_attempts: Optional[int] = None) -> str:
+        """Enqueue a document and return its job id at once.
+
+        Args:
+            document_type: One of `GENERATORS` ("prescription", "exam_request", "medical_certificate")
+            payload: The document data passed to the generator
+            skin_info: Optional styling information for the PDF
+            output_path: Optional path to save the PDF
+            max_attempts: Attempts before the job fails (default: the queue's)
+
+        Returns:
+            str: Job id for `status` and `result`
+        """
+        if document_type not in self.generators:
+            raise ValueError(f"Unknown document type '{document_type}', expected one of {sorted(self.generators)}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, document_type, payload, status, max_attempts, run_after, submitted_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, document_type,
+             json.dumps({"payload": payload, "skinInfo": skin_info, "outputPath": output_path}, default=str),
+             max_attempts or self.max_attempts, now, now),
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """State, attempts, result or last error, and timing of a job; None if the id is unknown.
+
+        Timing: `queue_seconds` from submission to the start of the last
+        attempt, `run_seconds` of the last attempt and `total_seconds` from
+        submission to completion.
+        """
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "document_type": row["document_type"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "result": row["result"],
+            "error": row["error"],
+            "cache_hit": None if row["cache_hit"] is None else bool(row["cache_hit"]),
+            "submitted_at": row["submitted_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "queue_seconds": row["started_at"] - row["submitted_at"] if row["started_at"] else None,
+            "run_seconds": row["run_seconds"],
+            "total_seconds": row["finished_at"] - row["submitted_at"] if row["finished_at"] else None,
+        }
+
+    def result(self, job_id: str, timeout: Optional[float] = None) -> str:
+        """Wait for a job and return the path of its PDF.
+
+        Raises:
+            KeyError: The job id is unknown
+            JobFailedError: The job failed on every attempt
+            TimeoutError: The job did not finish within `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None:
+                raise KeyError(job_id)
+            if status["status"] == "succeeded":
+                return status["result"]
+            if status["status"] == "failed":
+                raise JobFailedError(f"Job {job_id} failed after {status['attempts']} attempts: {status['error']}")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {job_id} is still {status['status']} after {timeout}s")
+            wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+            time.sleep(wait)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Job counts per status and mean timings of the finished jobs."""
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        row = conn.execute(
+            "SELECT AVG(started_at - submitted_at), AVG(run_seconds), AVG(finished_at - submitted_at), "
+            "AVG(attempts), AVG(cache_hit) FROM jobs WHERE status = 'succeeded'"
+        ).fetchone()
+        return {
+            "jobs": {status: counts.get(status, 0) for status in ("queued", "running", "succeeded", "failed")},
+            "mean_queue_seconds": row[0],
+            "mean_run_seconds": row[1],
+            "mean_total_seconds": row[2],
+            "mean_attempts": row[3],
+            "cache_hit_rate": row[4],
+        }
+
+    # ----------------------------------
+    # Workers
+    # ----------------------------------
+    def start(self) -> "DocumentQueue":
+        """Start the worker threads of this process (idempotent)."""
+        if self._threads:
+            return self
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"document-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop taking new jobs; with `wait`, let running jobs finish first."""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Take the oldest ready job (or one whose worker lost its lease) and mark it running."""
+        conn = self._conn()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A lost lease used up its attempt: the worker process died running the job
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, finished_at = ?, "
+                "error = 'Worker lost its lease on the last attempt (its process died)' "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY run_after LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ? "
+                    "WHERE id = ?",
+                    (now, now + self.lease, row["id"]),
+                )
+            conn.execute("COMMIT")
+            return row
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _renew_lease(self, job_id: str, done: threading.Event) -> None:
+        # Heartbeat: a job that legitimately runs longer than the lease is not handed to another worker
+        while not done.wait(self.lease / 3):
+            self._conn().execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                                 (time.time() + self.lease, job_id))
+        if getattr(self._local, 'conn', None) is not None:
+            self._local.conn.close()
+
+    def _generate(self, row: sqlite3.Row) -> Any:
+        """Run the job's generator, renewing its lease until it returns."""
+        job = json.loads(row["payload"])
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._renew_lease, args=(row["id"], done),
+                                     name=f"document-lease-{row['id'][:8]}", daemon=True)
+        heartbeat.start()
+        try:
+            return self.generators[row["document_type"]](
+                job["payload"], output_path=job["outputPath"], skin_info=job["skinInfo"], return_cache_hit=True
+            )
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def _run(self, row: sqlite3.Row) -> None:
+        attempt = row["attempts"] + 1
+        started = time.monotonic()
+        try:
+            path, cache_hit = self._generate(row)
+        except Exception as e:
+            run_seconds = time.monotonic() - started
+            if attempt < row["max_attempts"]:
+                delay = self.backoff * 2 ** (attempt - 1)
+                print(f"Job {row['id']} failed (attempt {attempt}/{row['max_attempts']}), retrying in {delay:.1f}s: {e}")
+                self._conn().execute(
+                    "UPDATE jobs SET status = 'queued', run_after = ?, lease_until = NULL, error = ?, run_seconds = ? "
+                    "WHERE id = ?",
+                    (time.time() + delay, str(e), run_seconds, row["id"]),
+                )
+            else:
+                print(f"Job {row['id']} failed after {attempt} attempts: {e}")
+                self._conn().execute(
+                    "UPDATE jobs SET status = 'failed', lease_until = NULL, error = ?, run_seconds = ?, finished_at = ? "
+                    "WHERE id = ?",
+                    (str(e), run_seconds, time.time(), row["id"]),
+                )
+            return
+        self._conn().execute(
+            "UPDATE jobs SET status = 'succeeded', lease_until = NULL, result = ?, cache_hit = ?, error = NULL, "
+            "run_seconds = ?, finished_at = ? WHERE id = ?",
+            (path, int(cache_hit), time.monotonic() - started, time.time(), row["id"]),
+        )
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            row = self._claim()
+            if row is None:
+                # Woken up by a local submit, or polling for other processes' jobs and due retries
+                with self._wakeup:
+                    self._wakeup.wait(POLL_INTERVAL)
+                continue
+            self._run(row)
+
+
+def default_queue() -> DocumentQueue:
+    """Build the queue configured by the environment (workers are not started)."""
+    return DocumentQueue(
+        path=os.getenv('WISECARE_QUEUE_DB', DEFAULT_DB_PATH),
+        workers=int(os.getenv('WISECARE_QUEUE_WORKERS', DEFAULT_WORKERS)),
+        max_attempts=int(os.getenv('WISECARE_QUEUE_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)),
+        backoff=float(os.getenv('WISECARE_QUEUE_BACKOFF', DEFAULT_BACKOFF)),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or inspect the document job queue")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="consume jobs until interrupted")
+    worker_parser.add_argument("--workers", type=int, default=None, help="worker threads (default: WISECARE_QUEUE_WORKERS)")
+    status_parser = subparsers.add_parser("status", help="print a job's status")
+    status_parser.add_argument("job_id")
+    subparsers.add_parser("metrics", help="print job counts and mean timings")
+    args = parser.parse_args()
+
+    queue = default_queue()
+    if args.command == "worker":
+        if args.workers:
+            queue.workers = args.workers
+        queue.start()
+        print(f"Consuming {queue.path} with {queue.workers} workers (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            queue.stop()
+    elif args.command == "status":
+        print(json.dumps(queue.status(args.job_id), indent=2))
+    else:
+        print(json.dumps(queue.metrics(), indent=2))
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+# Get the absolute path to the current directory
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(CURRENT_DIR, 'output', 'cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_PIN_SECONDS = 300  # entries served this recently are never evicted
+
+
+def canonical_key(document_type: str, payload: Dict[str, Any], skin_info: Optional[Dict[str, Any]] = None) -> str:
+    """Build the content address of a document request.
+
+    The key is a SHA-256 over a canonical JSON encoding (sorted keys, no
+    whitespace) of the document type, the payload and the skin info, so the
+    same request always maps to the same PDF regardless of dict ordering.
+
+    Args:
+        document_type: Kind of document, e.g. "prescription"
+        payload: The document data sent to the generator
+        skin_info: Optional styling information for the PDF
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    canonical = json.dumps(
+        {"type": document_type, "payload": payload, "skinInfo": skin_info or None},
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class PdfCache:
+    """Content-addressed on-disk store for generated PDFs.
+
+    Each PDF is stored as `<cache_dir>/<key>.pdf`. Recency is tracked through
+    the file modification time, which is refreshed on every hit, and the least
+    recently used files are evicted once the store grows beyond `max_bytes`.
+    Hits return the entry itself, so entries used in the last `pin_seconds`
+    are kept even over budget while callers may still be reading them.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 pin_seconds: float = DEFAULT_PIN_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.pin_seconds = pin_seconds
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached PDF path for `key`, or None on a miss."""
+        path = self.path_for(key)
+        try:
+            # Touch the entry so it becomes the most recently used one
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, pdf_path: str, move: bool = False) -> str:
+        """Store a generated PDF under `key` and evict old entries if needed.
+
+        Args:
+            key: Content address from `canonical_key`
+            pdf_path: The generated PDF
+            move: Move `pdf_path` into the store instead of copying it
+
+        Returns:
+            str: Path of the cached PDF
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(key)
+        if os.path.abspath(pdf_path) != os.path.abspath(path):
+            moved = False
+            if move:
+                try:
+                    os.replace(pdf_path, path)
+                    moved = True
+                except OSError:
+                    pass  # e.g. the store is on another filesystem: copy instead
+            if not moved:
+                # Copy to a temporary name first so readers never see a partial PDF
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                shutil.copyfile(pdf_path, tmp_path)
+                os.replace(tmp_path, path)
+                if move:
+                    os.unlink(pdf_path)
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """Delete least recently used PDFs until the store fits in `max_bytes`."""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+                total += stat.st_size
+
+            entries.sort()
+            pinned_since = time.time() - self.pin_seconds
+            # Always keep the newest entry, even if it alone exceeds the budget, and the pinned ones
+            while total > self.max_bytes and len(entries) > 1 and entries[0][0] < pinned_since:
+                _, size, name = entries.pop(0)
+                try:
+                    os.unlink(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def fetch(self, key: str, output_path: Optional[str] = None) -> Optional[str]:
+        """Look up `key` and, on a hit, copy the PDF where the caller expects it.
+
+        Without `output_path` the cached PDF itself is returned; the hit pins
+        it for `pin_seconds`.
+
+        Args:
+            key: Content address from `canonical_key`
+            output_path: Optional path the caller asked the PDF to be saved to
+
+        Returns:
+            Optional[str]: Path to the PDF, or None on a miss
+        """
+        cached_path = self.get(key)
+        if cached_path is None or not output_path:
+            return cached_path
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        try:
+            shutil.copyfile(cached_path, output_path)
+        except FileNotFoundError:
+            # Evicted between the lookup and the copy: treat it as a miss
+            return None
+        return output_path
+
+
+def default_cache() -> Optional[PdfCache]:
+    """Build the cache configured by the environment.
+
+    `WISECARE_PDF_CACHE=0` disables caching, `WISECARE_PDF_CACHE_DIR` moves the
+    store, `WISECARE_PDF_CACHE_MAX_BYTES` bounds its size on disk and
+    `WISECARE_PDF_CACHE_PIN_SECONDS` sets how long a served PDF is kept.
+    """
+    if os.getenv('WISECARE_PDF_CACHE', '1') == '0':
+        return None
+    return PdfCache(
+        cache_dir=os.getenv('WISECARE_PDF_CACHE_DIR', DEFAULT_CACHE_DIR),
+        max_bytes=int(os.getenv('WISECARE_PDF_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        pin_seconds=float(os.getenv('WISECARE_PDF_CACHE_PIN_SECONDS', DEFAULT_PIN_SECONDS)),
+    )
+
+
+def lookup(cache: Optional[PdfCache], document_type: str, payload: Dict[str, Any],
+           skin_info: Optional[Dict[str, Any]], output_path: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Return `(key, path)` for a request; `path` is None on a miss or when caching is off."""
+    if cache is None:
+        return None, None
+    key = canonical_key(document_type, payload, skin_info)
+    return key, cache.fetch(key, output_path)
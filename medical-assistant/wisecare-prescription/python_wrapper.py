@@ -3,14 +3,24 @@ import subprocess
 import os
 import shutil
 import tempfile
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple, Union
 from datetime import datetime
 
+from pdf_cache import default_cache, lookup
+
 # Get the absolute path to the current directory
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PRESCRIPTION_NODE_DIR = os.path.join(CURRENT_DIR, 'prescription-node')
 
-def generate_prescription(prescription_payload: Dict[str, Any], output_path: Optional[str] = None, skin_info: Optional[Dict[str, Any]] = None) -> str:
+# Content-addressed store for generated PDFs (see pdf_cache.py)
+PDF_CACHE = default_cache()
+
+def _finish(output_path: str, cache_hit: bool, return_cache_hit: bool) -> Union[str, Tuple[str, bool]]:
+    """Shape the return value of the generators according to `return_cache_hit`."""
+    return (output_path, cache_hit) if return_cache_hit else output_path
+
+def generate_prescription(prescription_payload: Dict[str, Any], output_path: Optional[str] = None, skin_info: Optional[Dict[str, Any]] = None,
+                          use_cache: bool = True, return_cache_hit: bool = False) -> Union[str, Tuple[str, bool]]:
     """Generate a prescription PDF with custom payload.
     
     This uses the parameterized modularPrescription.ts script to generate a PDF.
@@ -18,11 +28,22 @@ def generate_prescription(prescription_payload: Dict[str, Any], output_path: Opt
     Args:
         prescription_payload: The prescription data
         output_path: Optional path to save the PDF
+        skin_info: Optional styling information for the PDF
+        use_cache: Serve identical requests from the PDF cache instead of regenerating them
+        return_cache_hit: Also return whether the PDF came from the cache
     
     Returns:
-        str: Path to the generated PDF
+        str: Path to the generated PDF, or `(path, cache_hit)` when `return_cache_hit` is set
     """
+    # Identical requests (UI retries, reprints) are served from the PDF cache
+    cache = PDF_CACHE if use_cache else None
+    cache_key, cached_path = lookup(cache, "prescription", prescription_payload, skin_info, output_path)
+    if cached_path:
+        print(f"Prescription served from cache: {cached_path}")
+        return _finish(cached_path, True, return_cache_hit)
+
     # Create unique output filename if not provided
+    caller_path = output_path
     if not output_path:
         output_path = os.path.join(CURRENT_DIR, f"output/prescription_{os.urandom(4).hex()}.pdf")
     
@@ -64,13 +85,19 @@ def generate_prescription(prescription_payload: Dict[str, Any], output_path: Opt
             raise Exception(f"Output file was not created at {output_path}")
         
         print(f"Prescription generated and saved to {output_path}")
-        return output_path
+        if cache is not None and caller_path:
+            cache.put(cache_key, output_path)
+        elif cache is not None:
+            # Nobody asked for this file: move it into the cache, where repeats are served from
+            output_path = cache.put(cache_key, output_path, move=True)
+        return _finish(output_path, False, return_cache_hit)
     finally:
         # Clean up temporary file
         if os.path.exists(payload_path):
             os.unlink(payload_path)
 
-def generate_exam_request(exam_request_payload: Dict[str, Any], output_path: Optional[str] = None, skin_info: Optional[Dict[str, Any]] = None) -> str:
+def generate_exam_request(exam_request_payload: Dict[str, Any], output_path: Optional[str] = None, skin_info: Optional[Dict[str, Any]] = None,
+                          use_cache: bool = True, return_cache_hit: bool = False) -> Union[str, Tuple[str, bool]]:
     """Generate an exam request PDF with custom payload.
     
     This function uses the parameterized modularExamRequest.ts script to generate a PDF.
@@ -79,11 +106,21 @@ def generate_exam_request(exam_request_payload: Dict[str, Any], output_path: Opt
         exam_request_payload: The exam request data
         output_path: Optional path to save the PDF
         skin_info: Optional styling information for the PDF
+        use_cache: Serve identical requests from the PDF cache instead of regenerating them
+        return_cache_hit: Also return whether the PDF came from the cache
     
     Returns:
-        str: Path to the generated PDF
+        str: Path to the generated PDF, or `(path, cache_hit)` when `return_cache_hit` is set
     """
+    # Identical requests (UI retries, reprints) are served from the PDF cache
+    cache = PDF_CACHE if use_cache else None
+    cache_key, cached_path = lookup(cache, "exam_request", exam_request_payload, skin_info, output_path)
+    if cached_path:
+        print(f"Exam request served from cache: {cached_path}")
+        return _finish(cached_path, True, return_cache_hit)
+
     # Create unique output filename if not provided
+    caller_path = output_path
     if not output_path:
         output_path = os.path.join(CURRENT_DIR, f"output/exam_request_{os.urandom(4).hex()}.pdf")
     
@@ -124,13 +161,19 @@ def generate_exam_request(exam_request_payload: Dict[str, Any], output_path: Opt
             raise Exception(f"Output file was not created at {output_path}")
         
         print(f"Exam request generated and saved to {output_path}")
-        return output_path
+        if cache is not None and caller_path:
+            cache.put(cache_key, output_path)
+        elif cache is not None:
+            # Nobody asked for this file: move it into the cache, where repeats are served from
+            output_path = cache.put(cache_key, output_path, move=True)
+        return _finish(output_path, False, return_cache_hit)
     finally:
         # Clean up temporary file
         if os.path.exists(payload_path):
             os.unlink(payload_path)
 
-def generate_medical_certificate(medical_certificate_payload: Dict[str, Any], output_path: Optional[str] = None, skin_info: Optional[Dict[str, Any]] = None) -> str:
+def generate_medical_certificate(medical_certificate_payload: Dict[str, Any], output_path: Optional[str] = None, skin_info: Optional[Dict[str, Any]] = None,
+                                 use_cache: bool = True, return_cache_hit: bool = False) -> Union[str, Tuple[str, bool]]:
     """Generate a medical certificate PDF with custom payload.
     
     This function uses the parameterized modularMedicalCertificate.ts script to generate a PDF.
@@ -139,11 +182,21 @@ def generate_medical_certificate(medical_certificate_payload: Dict[str, Any], ou
         medical_certificate_payload: The medical certificate data
         output_path: Optional path to save the PDF
         skin_info: Optional styling information for the PDF
+        use_cache: Serve identical requests from the PDF cache instead of regenerating them
+        return_cache_hit: Also return whether the PDF came from the cache
     
     Returns:
-        str: Path to the generated PDF
+        str: Path to the generated PDF, or `(path, cache_hit)` when `return_cache_hit` is set
     """
+    # Identical requests (UI retries, reprints) are served from the PDF cache
+    cache = PDF_CACHE if use_cache else None
+    cache_key, cached_path = lookup(cache, "medical_certificate", medical_certificate_payload, skin_info, output_path)
+    if cached_path:
+        print(f"Medical certificate served from cache: {cached_path}")
+        return _finish(cached_path, True, return_cache_hit)
+
     # Create unique output filename if not provided
+    caller_path = output_path
     if not output_path:
         output_path = os.path.join(CURRENT_DIR, f"output/medical_certificate_{os.urandom(4).hex()}.pdf")
     
@@ -184,7 +237,12 @@ def generate_medical_certificate(medical_certificate_payload: Dict[str, Any], ou
             raise Exception(f"Output file was not created at {output_path}")
         
         print(f"Medical certificate generated and saved to {output_path}")
-        return output_path
+        if cache is not None and caller_path:
+            cache.put(cache_key, output_path)
+        elif cache is not None:
+            # Nobody asked for this file: move it into the cache, where repeats are served from
+            output_path = cache.put(cache_key, output_path, move=True)
+        return _finish(output_path, False, return_cache_hit)
     finally:
         # Clean up temporary file
         if os.path.exists(payload_path):
@@ -308,9 +366,10 @@ if __name__ == "__main__":
     }
     
     # Generate medical certificate
-    medical_certificate_result = generate_medical_certificate(
+    medical_certificate_result, cache_hit = generate_medical_certificate(
         medical_certificate_payload=medical_certificate_payload,
         output_path="output/example_medical_certificate.pdf",
-        skin_info=skin_info  # Using the same skin_info defined earlier
+        skin_info=skin_info,  # Using the same skin_info defined earlier
+        return_cache_hit=True
     )
-    print(f"Medical certificate result: {medical_certificate_result}") 
\ No newline at end of file
+    print(f"Medical certificate result: {medical_certificate_result} (cache hit: {cache_hit})") 
\ No newline at end of file
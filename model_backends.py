@@ -0,0 +1,141 @@
+"""Chat model backend of each graph node, chosen from configuration.
+
+Every node that calls a model asks `chat_model(node)` for it instead of
+building `ChatOpenAI(model="gpt-4o-mini")` itself. The backend of a node is
+the "default" entry of the configuration, overridden by the node's own entry:
+
+    {
+      "default":     {"model": "gpt-4o-mini", "timeout": 30, "pool_size": 20},
+      "llm_router":  {"base_url": "http://localhost:8080/v1", "model": "qwen2.5-7b-instruct",
+                      "api_key": "local", "timeout": 5},
+      "call_model":  {"model": "gpt-4o"},
+      "emergencial": {"provider": "fake"}
+    }
+
+Fields:
+    provider     "openai" (the OpenAI API or any OpenAI-compatible server, e.g.
+                 llama.cpp or vLLM, through `base_url`), "fake" (scripted
+                 model from fake_llm.py) or "recorded" (replay of `recording`)
+    model        model name sent to the server
+    base_url     API base URL (default: the OpenAI API)
+    api_key      key sent to the server; `api_key_env` names an environment
+                 variable holding it instead (default: OPENAI_API_KEY)
+    timeout      seconds per HTTP request (default: LLM_CALL_TIMEOUT, so calls the
+                 gateway gave up on also end and free their thread)
+    max_retries  retries of failed requests by the OpenAI client
+    pool_size    maximum open connections to the server
+    temperature  sampling temperature
+    latency      injected latency of the fake and recorded providers (seconds)
+    recording    JSONL file of the recorded provider
+
+Nodes with the same backend share one model instance, and so one connection
+pool.
+
+Configuration (environment variables):
+    MODEL_BACKENDS  JSON object as above, or the path of a JSON file with it
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+
+DEFAULT_BACKEND = {
+    "provider": "openai",
+    "model": "gpt-4o-mini",
+    "base_url": None,
+    "api_key": None,
+    "api_key_env": "OPENAI_API_KEY",
+    "timeout": None,
+    "max_retries": 2,
+    "pool_size": None,
+    "temperature": None,
+    "latency": 0.0,
+    "recording": None,
+}
+PROVIDERS = ("openai", "fake", "recorded")
+
+
+def load_config(value: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Parse MODEL_BACKENDS (inline JSON or a file path); empty when unset."""
+    value = value if value is not None else os.getenv("MODEL_BACKENDS", "")
+    if not value.strip():
+        return {}
+    if not value.lstrip().startswith("{"):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+    config = json.loads(value)
+    for node, entry in config.items():
+        unknown = set(entry) - set(DEFAULT_BACKEND)
+        if unknown:
+            raise ValueError(f"Unknown model backend field(s) {sorted(unknown)} for '{node}'")
+        if entry.get("provider", "openai") not in PROVIDERS:
+            raise ValueError(f"Unknown provider '{entry['provider']}' for '{node}', expected one of {PROVIDERS}")
+    return config
+
+
+def build_chat_model(backend: Dict[str, Any]) -> Any:
+    """Chat model for a complete backend entry (every DEFAULT_BACKEND field set)."""
+    if backend["provider"] in ("fake", "recorded"):
+        from fake_llm import build_backend
+
+        return build_backend(backend["provider"], latency=backend["latency"], recording=backend["recording"])
+
+    from langchain_openai import ChatOpenAI
+
+    kwargs: Dict[str, Any] = {"model": backend["model"], "max_retries": backend["max_retries"]}
+    if backend["base_url"]:
+        kwargs["base_url"] = backend["base_url"]
+    api_key = backend["api_key"] or os.getenv(backend["api_key_env"])
+    if api_key:
+        kwargs["api_key"] = api_key
+    timeout = backend["timeout"]
+    if timeout is None:
+        timeout = float(os.getenv("LLM_CALL_TIMEOUT", "60")) or None
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    if backend["temperature"] is not None:
+        kwargs["temperature"] = backend["temperature"]
+    if backend["pool_size"]:
+        # The OpenAI client's own pool is sized for many hosts; bound it per backend
+        limits = httpx.Limits(max_connections=backend["pool_size"], max_keepalive_connections=backend["pool_size"])
+        kwargs["http_client"] = httpx.Client(limits=limits, timeout=timeout)
+        kwargs["http_async_client"] = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return ChatOpenAI(**kwargs)
+
+
+class ModelBackends:
+    """Per-node backend resolution with one shared model instance per distinct backend."""
+
+    def __init__(self, config: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.config = config if config is not None else load_config()
+        self._lock = threading.Lock()
+        self._models: Dict[str, Any] = {}
+
+    def backend(self, node: str, **defaults: Any) -> Dict[str, Any]:
+        """Backend entry of `node`: built-in defaults < the caller's `defaults` < "default" < the node's entry."""
+        return {**DEFAULT_BACKEND, **defaults, **self.config.get("default", {}), **self.config.get(node, {})}
+
+    def chat_model(self, node: str, **defaults: Any) -> Any:
+        return self.build(self.backend(node, **defaults))
+
+    def build(self, backend: Dict[str, Any]) -> Any:
+        """Model instance of a complete backend entry, shared with every identical entry."""
+        key = json.dumps(backend, sort_keys=True)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = build_chat_model(backend)
+            return self._models[key]
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        """Configured backends without secrets, for logs and admin endpoints."""
+        return {node: {k: v for k, v in entry.items() if k != "api_key"} for node, entry in self.config.items()}
+
+
+backends = ModelBackends()
+
+
+def chat_model(node: str, **defaults: Any) -> Any:
+    """Chat model configured for `node` (see the module docstring); `defaults` apply unless configured."""
+    return backends.chat_model(node, **defaults)
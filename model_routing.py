@@ -0,0 +1,230 @@
+"""Cost- and latency-aware model tiers for the graph nodes.
+
+Not every model call needs the strongest model. Asking "shaken or stirred?",
+extracting a preference or routing a triage turn is work for a small, fast
+model. Writing the recipe or a differential diagnosis is not. The routing
+policy names a few model tiers and sends each node, or each kind of turn of a
+node, to one of them:
+
+    {
+      "tiers": {
+        "fast":   {"model": "gpt-4o-mini", "input_cost": 0.15, "output_cost": 0.60},
+        "strong": {"model": "gpt-4o", "input_cost": 2.50, "output_cost": 10.00, "timeout": 60}
+      },
+      "routes": {
+        "call_model:question":     "fast",
+        "call_model:recipe":       "strong",
+        "extract_preferences":     "fast",
+        "llm_router":              "fast",
+        "emergencial":             "strong",
+        "diagnostico_diferencial": "strong",
+        "gerar_documentos":        "fast"
+      },
+      "escalation": ["fast", "strong"]
+    }
+
+A tier takes every model_backends.py field (provider, model, base_url,
+timeout, ...) over the "default" entry of MODEL_BACKENDS, plus its prices in
+USD per million input and output tokens. A call of `node` with turn `kind` uses
+the route "node:kind", else "node", else "default". A node without a route
+keeps the model it was given (its MODEL_BACKENDS entry), so an empty policy
+changes nothing.
+
+Structured-output calls (`schema=`) escalate: when a tier's output does not
+parse or validate against the schema, the call is retried on the next tier of
+`escalation`. Only the last tier's failure reaches the caller.
+
+Calls, latency percentiles, tokens, cost, validation failures and escalations
+are recorded per tier and reported by `ModelRouter.metrics`.
+
+Configuration (environment variables):
+    MODEL_ROUTING  JSON object as above, or the path of a JSON file with it
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Sequence
+
+from llm_gateway import invoke_model
+from model_backends import DEFAULT_BACKEND, backends
+
+PRICE_FIELDS = ("input_cost", "output_cost")  # USD per million tokens
+DEFAULT_SAMPLES = 1000  # recent latencies kept per tier
+
+
+class StructuredOutputError(ValueError):
+    """Raised when no tier produced output that validates against the schema."""
+
+
+def _percentile(samples, percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def load_policy(value: Optional[str] = None) -> Dict[str, Any]:
+    """Parse MODEL_ROUTING (inline JSON or a file path); empty when unset."""
+    value = value if value is not None else os.getenv("MODEL_ROUTING", "")
+    if not value.strip():
+        return {}
+    if not value.lstrip().startswith("{"):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+    policy = json.loads(value)
+    unknown = set(policy) - {"tiers", "routes", "escalation"}
+    if unknown:
+        raise ValueError(f"Unknown model routing key(s) {sorted(unknown)}")
+    tiers = policy.setdefault("tiers", {})
+    for name, tier in tiers.items():
+        unknown = set(tier) - set(DEFAULT_BACKEND) - set(PRICE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown model tier field(s) {sorted(unknown)} for '{name}'")
+    for route, tier in policy.setdefault("routes", {}).items():
+        if tier not in tiers:
+            raise ValueError(f"Route '{route}' uses unknown tier '{tier}'")
+    for tier in policy.setdefault("escalation", []):
+        if tier not in tiers:
+            raise ValueError(f"Escalation uses unknown tier '{tier}'")
+    return policy
+
+
+class ModelRouter:
+    """Sends each call to the model tier of its route and records what every tier costs."""
+
+    def __init__(self, policy: Optional[Dict[str, Any]] = None, samples: int = DEFAULT_SAMPLES):
+        self.policy = policy if policy is not None else load_policy()
+        self.tiers: Dict[str, Dict[str, Any]] = self.policy.get("tiers", {})
+        self.routes: Dict[str, str] = self.policy.get("routes", {})
+        self.escalation: List[str] = self.policy.get("escalation", [])
+        self._lock = threading.Lock()
+        self._prepared: Dict[tuple, Any] = {}
+        self._latencies = defaultdict(lambda: deque(maxlen=samples))
+        self._metrics = defaultdict(lambda: {"calls": 0, "errors": 0, "validation_failures": 0, "escalations": 0,
+                                             "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+        self._route_calls: Dict[str, int] = defaultdict(int)
+
+    def tier_for(self, node: str, kind: Optional[str] = None) -> Optional[str]:
+        """Tier of a call of `node` for a turn of `kind`, None when the node isn't routed."""
+        for route in ([f"{node}:{kind}"] if kind else []) + [node, "default"]:
+            if route in self.routes:
+                return self.routes[route]
+        return None
+
+    def chat_model(self, tier: str) -> Any:
+        """Model of `tier`: its backend fields over MODEL_BACKENDS' "default" entry."""
+        fields = {k: v for k, v in self.tiers[tier].items() if k not in PRICE_FIELDS}
+        return backends.build({**DEFAULT_BACKEND, **backends.config.get("default", {}), **fields})
+
+    def _tiers_from(self, tier: str) -> List[str]:
+        # The tier itself, then the stronger ones it escalates to
+        if tier not in self.escalation:
+            return [tier]
+        return self.escalation[self.escalation.index(tier):]
+
+    def _prepare(self, tier: str, tools: Optional[Sequence[Any]], schema: Any) -> Any:
+        key = (tier, tuple(id(t) for t in tools or ()), schema)
+        with self._lock:
+            if key not in self._prepared:
+                model = self.chat_model(tier)
+                if tools:
+                    model = model.bind_tools(list(tools))
+                if schema is not None:
+                    # include_raw reports a parsing failure instead of raising it, with the usage
+                    model = model.with_structured_output(schema, include_raw=True)
+                self._prepared[key] = model
+            return self._prepared[key]
+
+    def invoke(self, node: str, messages: Any, config: Optional[dict], default: Any, kind: Optional[str] = None,
+               tools: Optional[Sequence[Any]] = None, schema: Any = None, lane: Optional[str] = None,
+               hedge: Optional[str] = None) -> Any:
+        """Call the model routed for `node` (and `kind` of turn), through llm_gateway.invoke_model.
+
+        Args:
+            node: Graph node making the call
+            messages: Input passed to the model
+            config: The node's RunnableConfig
+            default: Model used, as is, when the node isn't routed (already bound to
+                `tools` or structured by `schema`)
+            kind: Kind of turn, for routes of the form "node:kind"
+            tools: Tools bound to the tier's model
+            schema: Structured output schema; its calls escalate on invalid output
+            lane: Priority lane (see llm_gateway.LANES)
+            hedge: Kind of call for hedging; the tier is appended so each tier keeps its own latencies
+
+        Returns:
+            The model response, or the parsed `schema` instance
+        """
+        tier = self.tier_for(node, kind)
+        if tier is None:
+            return invoke_model(default, messages, config, lane=lane, hedge=hedge)
+        with self._lock:
+            self._route_calls[f"{node}:{kind}" if kind else node] += 1
+
+        attempts = self._tiers_from(tier) if schema is not None else [tier]
+        for attempt, tier in enumerate(attempts):
+            model = self._prepare(tier, tools, schema)
+            started = time.monotonic()
+            try:
+                response = invoke_model(model, messages, config, lane=lane, hedge=f"{hedge}:{tier}" if hedge else None)
+            except Exception:
+                self._record(tier, time.monotonic() - started, error=True)
+                raise
+            if schema is None:
+                self._record(tier, time.monotonic() - started, response=response)
+                return response
+
+            self._record(tier, time.monotonic() - started, response=response["raw"])
+            if response["parsing_error"] is None and response["parsed"] is not None:
+                return response["parsed"]
+            last = attempt == len(attempts) - 1
+            self._record_failure(tier, escalated=not last)
+            if last:
+                raise StructuredOutputError(
+                    f"No valid {getattr(schema, '__name__', schema)} from tier(s) {attempts} for '{node}': "
+                    f"{response['parsing_error'] or 'empty output'}"
+                ) from response["parsing_error"]
+
+    def _record(self, tier: str, latency: float, response: Any = None, error: bool = False) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        prices = self.tiers[tier]
+        cost = (input_tokens * prices.get("input_cost", 0.0) + output_tokens * prices.get("output_cost", 0.0)) / 1e6
+        with self._lock:
+            metrics = self._metrics[tier]
+            metrics["calls"] += 1
+            metrics["errors"] += int(error)
+            metrics["input_tokens"] += input_tokens
+            metrics["output_tokens"] += output_tokens
+            metrics["cost_usd"] += cost
+            if not error:
+                self._latencies[tier].append(latency)
+
+    def _record_failure(self, tier: str, escalated: bool) -> None:
+        with self._lock:
+            self._metrics[tier]["validation_failures"] += 1
+            self._metrics[tier]["escalations"] += int(escalated)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {tier: {**metrics, "latencies": list(self._latencies[tier])} for tier, metrics in self._metrics.items()}
+            routes = dict(self._route_calls)
+        for tier in tiers.values():
+            latencies = tier.pop("latencies")
+            tier["p50"] = _percentile(latencies, 50) if latencies else None
+            tier["p95"] = _percentile(latencies, 95) if latencies else None
+            tier["cost_usd"] = round(tier["cost_usd"], 6)
+        return {"tiers": tiers, "routes": routes, "policy": self.describe()}
+
+    def describe(self) -> Dict[str, Any]:
+        """Routing policy without secrets, for logs and admin endpoints."""
+        tiers = {name: {k: v for k, v in tier.items() if k != "api_key"} for name, tier in self.tiers.items()}
+        return {"tiers": tiers, "routes": self.routes, "escalation": self.escalation}
+
+
+router = ModelRouter()
+
+
+def invoke_routed(node: str, messages: Any, config: Optional[dict], default: Any, **kwargs: Any) -> Any:
+    """Call the model tier routed for `node` (see the module docstring and `ModelRouter.invoke`)."""
+    return router.invoke(node, messages, config, default, **kwargs)
@@ -0,0 +1,125 @@
+"""Request-level admission for the API's graph runs.
+
+Every conversation request runs the graph on a worker thread. `RequestAdmission`
+bounds how many do so at once and queues the rest on the event loop, without
+holding a thread while they wait. Waiting requests are served by priority lane
+(the `X-Priority` header, the same lanes as llm_gateway.LANES), first come
+first served within a lane. Once `max_queue` requests are waiting, a new
+request sheds the newest waiting request of the lowest lane below its own;
+if there is none it is rejected, unless it is in the top lane. Shed and
+rejected requests get `LaneOverloadedError` (503), requests whose deadline
+passes while waiting get `DeadlineExceededError` (504).
+
+Configuration (environment variables):
+    API_MAX_CONCURRENCY  graph runs at once per worker process (default: 32)
+    API_MAX_QUEUE        requests waiting for a run before lower lanes are shed (default: 100)
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from llm_gateway import LANES, DeadlineExceededError, LaneOverloadedError
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_MAX_QUEUE = 100
+
+
+class RequestAdmission:
+    """Concurrency limit with lane-priority queueing; used from the event loop only."""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._metrics = {lane: {"admitted": 0, "shed": 0, "deadline_exceeded": 0, "wait_seconds_max": 0.0}
+                         for lane in LANES}
+
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        lanes = [lane] if lane else LANES
+        return sum(1 for name in lanes for waiter in self._waiting[name] if not waiter.done())
+
+    def _admit(self, lane: str) -> None:
+        """Make room for a waiting request in `lane`, shedding the newest request of the lowest lower lane."""
+        if self.queue_depth() < self.max_queue:
+            return
+        for victim_lane in reversed(LANES[LANES.index(lane) + 1:]):
+            waiting = [waiter for waiter in self._waiting[victim_lane] if not waiter.done()]
+            if waiting:
+                self._waiting[victim_lane].remove(waiting[-1])
+                waiting[-1].set_exception(LaneOverloadedError(f"{victim_lane} request shed to make room for higher-priority requests"))
+                self._metrics[victim_lane]["shed"] += 1
+                return
+        if lane != LANES[0]:
+            self._metrics[lane]["shed"] += 1
+            raise LaneOverloadedError(f"Request queue is full ({self.queue_depth()} waiting), rejecting {lane} request")
+
+    async def acquire(self, lane: str, timeout: Optional[float] = None) -> float:
+        """Wait for a run slot; returns the seconds waited."""
+        started = time.monotonic()
+        if self.running < self.max_concurrency and not self.queue_depth():
+            self.running += 1
+            self._metrics[lane]["admitted"] += 1
+            return 0.0
+        self._admit(lane)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting[lane].append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._give_back(waiter)
+            self._metrics[lane]["deadline_exceeded"] += 1
+            raise DeadlineExceededError(f"Deadline passed after waiting {time.monotonic() - started:.1f}s for a request slot")
+        except asyncio.CancelledError:
+            # The client went away
+            self._give_back(waiter)
+            raise
+        finally:
+            if waiter in self._waiting[lane]:
+                self._waiting[lane].remove(waiter)
+        waited = time.monotonic() - started
+        self._metrics[lane]["admitted"] += 1
+        self._metrics[lane]["wait_seconds_max"] = max(self._metrics[lane]["wait_seconds_max"], waited)
+        return waited
+
+    def _give_back(self, waiter: asyncio.Future) -> None:
+        # A slot handed over just as the waiter gave up goes to the next request instead of being lost
+        if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+            self.release()
+
+    def release(self) -> None:
+        """Hand the slot to the next waiting request of the highest lane, or free it."""
+        for lane in LANES:
+            queue = self._waiting[lane]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane: str, timeout: Optional[float] = None):
+        await self.acquire(lane, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth(),
+            "lanes": {lane: {"queue_depth": self.queue_depth(lane), **self._metrics[lane]} for lane in LANES},
+        }
+
+
+def admission_from_env() -> RequestAdmission:
+    return RequestAdmission(
+        max_concurrency=int(os.getenv("API_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+        max_queue=int(os.getenv("API_MAX_QUEUE", DEFAULT_MAX_QUEUE)),
+    )
@@ -1,10 +1,15 @@
-from fastapi import FastAPI, WebSocket, HTTPException, Depends
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 import json
 import asyncio
 import time
 import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 from pydantic import BaseModel
 from typing import Dict, Optional, List
 import logging
@@ -23,10 +28,18 @@ logger = logging.getLogger("api_server")
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# cocktail_agent.py and the shared modules live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 try:
     # For development, you might need to adjust these imports 
     # based on where cocktail_agent.py is located
     from cocktail_agent import compile_agent, start_agent
+    from llm_gateway import (
+        get_metrics, LANES, DEFAULT_LANE, LaneOverloadedError, CircuitOpenError, with_deadline, deadline_from_config,
+    )
+    from checkpoint_introspection import memory_report, thread_memory, TracemallocProbe
+    from conversation_export import ConversationExporter
+    from session_snapshot import SessionSnapshots
     from langgraph.types import Command
     logger.info("Successfully imported cocktail_agent module")
 except ImportError as e:
@@ -39,6 +52,12 @@ except ImportError as e:
         # sys.path.append(project_root)
         
         from cocktail_agent import compile_agent, start_agent
+        from llm_gateway import (
+            get_metrics, LANES, DEFAULT_LANE, LaneOverloadedError, CircuitOpenError, with_deadline, deadline_from_config,
+        )
+        from checkpoint_introspection import memory_report, thread_memory, TracemallocProbe
+        from conversation_export import ConversationExporter
+        from session_snapshot import SessionSnapshots
         from langgraph.types import Command
         logger.info("Successfully imported cocktail_agent module using absolute path")
     except ImportError as e2:
@@ -47,12 +66,30 @@ except ImportError as e:
         raise ImportError(f"Failed to import cocktail_agent module: {e2}")
 
 
+from warmup import WarmupState, warm_up
+from admission import admission_from_env
+
 agent = compile_agent()
+# One state read per turn, cached until the thread's next checkpoint write
+sessions = SessionSnapshots(agent)
+warmup_state = WarmupState()
 config = None  # Will be initialized in start_conversation
+# Seconds a request may spend in the graph; every model call of the turn must finish within it
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+# Graph runs block, so they run on their own pool; admission bounds them and queues the rest by lane
+admission = admission_from_env()
+graph_executor = ThreadPoolExecutor(max_workers=admission.max_concurrency, thread_name_prefix="graph")
+tracemalloc_probe = TracemallocProbe()
+# Finished conversations are exported here by /api/admin/export; one export at a time
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+export_lock = threading.Lock()
 
 # Define request models
 class MessageRequest(BaseModel):
     message: str
+    # Conversation to continue (config.configurable.thread_id from start-conversation).
+    # Defaults to the most recently started conversation.
+    thread_id: Optional[str] = None
 
 class ConversationHistoryResponse(BaseModel):
     session_id: str
@@ -79,104 +116,248 @@ app.add_middleware(
 )
 
 
+def with_priority(config: dict, priority: Optional[str]) -> dict:
+    """Copy of `config` whose LLM calls run in the `priority` lane (X-Priority header)"""
+    if not priority:
+        return config
+    if priority not in LANES:
+        raise HTTPException(status_code=400, detail=f"X-Priority must be one of {list(LANES)}")
+    return {**config, "configurable": {**config["configurable"], "priority": priority}}
+
+def request_deadline(x_request_timeout: Optional[float]) -> float:
+    """Time budget of a request: REQUEST_TIMEOUT, or less if the client asks (X-Request-Timeout header)"""
+    if x_request_timeout is None:
+        return REQUEST_TIMEOUT
+    if x_request_timeout <= 0:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout must be a positive number of seconds")
+    return min(x_request_timeout, REQUEST_TIMEOUT)
+
+def upstream_error(e: Exception) -> Optional[HTTPException]:
+    """HTTP error for a model call that was shed, timed out or refused by the circuit breaker"""
+    if isinstance(e, LaneOverloadedError):
+        # The LLM queue is saturated and this request's lane was shed
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    if isinstance(e, TimeoutError):
+        # DeadlineExceededError or ModelTimeoutError; the conversation stays at its previous turn
+        return HTTPException(status_code=504, detail=str(e))
+    return None
+
+async def run_graph(x_priority: Optional[str], run_config: dict, fn):
+    """Run the blocking graph call `fn` on the graph pool once the request is admitted (waits count against its deadline)"""
+    deadline = deadline_from_config(run_config)
+    timeout = None if deadline is None else max(0.0, deadline - time.time())
+    async with admission.slot(x_priority or DEFAULT_LANE, timeout=timeout):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(graph_executor, context.run, fn)
+
+def resolve_config(thread_id: Optional[str]) -> dict:
+    """Config of the conversation `thread_id`, or of the last started conversation"""
+    if thread_id:
+        return {"configurable": {"thread_id": thread_id}}
+    if config is None:
+        raise HTTPException(status_code=400, detail="No conversation started")
+    return config
+
+@app.on_event("startup")
+async def start_warmup():
+    """Warm up in the background; /ready reports 503 until it finishes"""
+    import cocktail_agent
+    asyncio.get_running_loop().run_in_executor(
+        None, warm_up, warmup_state, agent, start_agent, sessions, cocktail_agent.model
+    )
+
+@app.get("/ready", tags=["Administration"])
+async def ready():
+    """Readiness probe: 200 once warm-up has finished, 503 while warming up or if it failed"""
+    if not warmup_state.ready:
+        return JSONResponse(status_code=503, content=warmup_state.to_dict())
+    return warmup_state.to_dict()
+
+@app.get("/api/metrics", tags=["Administration"])
+async def metrics():
+    """LLM scheduler metrics: queue depth, wait times, token usage, timeouts, circuit breaker state and model tier costs"""
+    import cocktail_agent
+    from model_routing import router
+    return {**get_metrics(), "session_snapshots": sessions.metrics(), "speculation": cocktail_agent.speculator.metrics(),
+            "model_routing": router.metrics(), "request_admission": admission.metrics()}
+
+@app.get("/api/admin/memory", tags=["Administration"])
+async def admin_memory(
+    thread_id: Optional[str] = None,
+    top: int = Query(5, ge=1, le=100),
+    limit: int = Query(50, ge=1),
+    tracemalloc: bool = False,
+):
+    """Checkpoint memory per thread: serialized size, checkpoint count, largest messages and totals.
+
+    With `thread_id` only that conversation is reported. With `tracemalloc=true`
+    the response also includes the allocation growth since the previous such
+    call (the first call starts tracing and only takes the baseline). Tracing
+    stays on, slowing every allocation, until DELETE /api/admin/memory/tracemalloc.
+    """
+    checkpointer = agent.checkpointer
+    loop = asyncio.get_running_loop()
+    # The report serializes checkpoints; keep it off the event loop
+    if thread_id:
+        report = await loop.run_in_executor(None, lambda: thread_memory(checkpointer, thread_id, top=top))
+        if not report["checkpoints"]:
+            raise HTTPException(status_code=404, detail=f"Unknown thread '{thread_id}'")
+    else:
+        report = await loop.run_in_executor(None, lambda: memory_report(checkpointer, top=top, limit=limit))
+    if tracemalloc:
+        report["tracemalloc"] = tracemalloc_probe.diff(top=top)
+    return report
+
+@app.delete("/api/admin/memory/tracemalloc", tags=["Administration"])
+async def admin_memory_stop_tracemalloc():
+    """Stop the allocation tracing started by /api/admin/memory?tracemalloc=true"""
+    return {"stopped": tracemalloc_probe.stop()}
+
+@app.post("/api/admin/export", tags=["Administration"])
+async def admin_export(
+    format: str = Query("jsonl", pattern="^(jsonl|parquet)$"),
+    batch_size: int = Query(500, ge=1),
+    min_idle: float = Query(300, ge=0),
+    evict: bool = False,
+):
+    """Export finished conversations to compressed batch files in EXPORT_DIR (see conversation_export.py).
+
+    Already exported threads are skipped unless they changed since. With
+    `evict=true` exported threads are deleted from the checkpointer.
+    """
+    if not export_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="An export is already running")
+    try:
+        try:
+            exporter = ConversationExporter(agent, "cocktail", EXPORT_DIR, format=format, batch_size=batch_size,
+                                            min_idle=min_idle, evict=evict, on_evict=sessions.invalidate)
+        except RuntimeError as e:
+            # Parquet without pyarrow
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            report = await asyncio.get_running_loop().run_in_executor(None, exporter.run)
+            return {**report, "progress": exporter.progress.summary()}
+        finally:
+            exporter.close()
+    finally:
+        export_lock.release()
+
 @app.post("/api/start-conversation", tags=["Conversation"])
-async def start_conversation():
+async def start_conversation(x_priority: Optional[str] = Header(None), x_request_timeout: Optional[float] = Header(None)):
     """Start a new conversation with the cocktail agent"""
     global config
     try:
-        config = {"configurable": {"thread_id": str(int(time.time()))}}
-        
+        # Timestamp prefix kept for readability, random suffix so concurrent starts never share a thread
+        new_config = {"configurable": {"thread_id": f"{int(time.time())}-{uuid.uuid4().hex[:8]}"}}
+        run_config = with_deadline(with_priority(new_config, x_priority), request_deadline(x_request_timeout))
+
         # Start the agent
-        response = start_agent(agent, config)
-        state = agent.get_state(config)
-        agent_response = ""
-        for task in state.tasks:
-            if hasattr(task, 'interrupts') and task.interrupts:
-                    agent_response = task.interrupts[0].value 
-                    break
-            else:
-                logger.warning(f"Error with interrupt when launching app. Response from start_agent ({type(response)}): \n{response}")
+        def start():
+            return start_agent(agent, run_config), sessions.get(new_config).interrupt_value or ""
+
+        response, agent_response = await run_graph(x_priority, run_config, start)
+        config = new_config
+        if not agent_response:
+            logger.warning(f"Error with interrupt when launching app. Response from start_agent ({type(response)}): \n{response}")
 
         return {
             "config": config,
             "agent_response": agent_response
         }
+    except HTTPException:
+        raise
+    except (LaneOverloadedError, CircuitOpenError, TimeoutError) as e:
+        logger.warning(f"Failing start-conversation request fast: {e}")
+        raise upstream_error(e)
     except Exception as e:
         logger.error(f"Error starting conversation: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to start conversation: {str(e)}")
 
 @app.post("/api/send-message", tags=["Conversation"])
-async def send_message(data: MessageRequest):
+async def send_message(data: MessageRequest, x_priority: Optional[str] = Header(None),
+                       x_request_timeout: Optional[float] = Header(None)):
     """Send a message to the agent and get a response"""
-    global config
+    config = resolve_config(data.thread_id)
+    run_config = with_deadline(with_priority(config, x_priority), request_deadline(x_request_timeout))
     try:
-        is_finished = False
-        agent_response = ""
-        user_response = data.message
-        
-        state = agent.get_state(config)
-        interrupt_value = None
-        for task in state.tasks:
-            if hasattr(task, 'interrupts') and task.interrupts:
-                interrupt_value = task.interrupts[0].value
-                break
+        # The whole turn (state reads and the graph run) blocks, so it runs on the graph pool
+        def turn():
+            is_finished = False
+            agent_response = ""
+            user_response = data.message
+
+            snapshot = sessions.get(config)
+            if snapshot.checkpoint_id is None:
+                # An empty state would read as a finished conversation
+                raise HTTPException(status_code=404, detail=f"Unknown conversation '{config['configurable']['thread_id']}'")
+            interrupt_value = snapshot.interrupt_value
                 
-        if interrupt_value:
-            # Show the interrupt value to the user (likely a question)
-            print(f"Agent asks: {interrupt_value}")
+            if interrupt_value:
+                # Show the interrupt value to the user (likely a question)
+                print(f"Agent asks: {interrupt_value}")
             
-            # Resume graph with user input
-            for event in agent.stream(Command(resume=user_response), config=config, stream_mode="values"):
-                # Add debug print to see the event structure
-                print(f"DEBUG - Event type: {type(event)}")
+                # Resume graph with user input
+                for event in agent.stream(Command(resume=user_response), config=run_config, stream_mode="values"):
+                    # Add debug print to see the event structure
+                    print(f"DEBUG - Event type: {type(event)}")
                 
-                # Extract the latest message from the agent 
-                agent_message = event["messages"][-1]
+                    # Extract the latest message from the agent 
+                    agent_message = event["messages"][-1]
                 
-                # Check message type and display appropriate information
-                if agent_message.type == "ai":
-                    # For AI messages, check if there are tool calls
-                    if hasattr(agent_message, 'tool_calls') and agent_message.tool_calls:
-                        print(f"DEBUG - tool_calls type: {type(agent_message.tool_calls)}")
-                        print(f"DEBUG - tool_calls content: {agent_message.tool_calls}")
+                    # Check message type and display appropriate information
+                    if agent_message.type == "ai":
+                        # For AI messages, check if there are tool calls
+                        if hasattr(agent_message, 'tool_calls') and agent_message.tool_calls:
+                            print(f"DEBUG - tool_calls type: {type(agent_message.tool_calls)}")
+                            print(f"DEBUG - tool_calls content: {agent_message.tool_calls}")
                         
-                        print(f"AI USING TOOL: {agent_message.tool_calls[0]['name']}")
-                        # If it's an AskHuman tool, display the question
-                        if agent_message.tool_calls[0]['name'] == "AskHuman":
-                            agent_response = agent_message.tool_calls[0]['args']['question']
-                            print(f"QUESTION FROM AGENT: {agent_response}")
+                            print(f"AI USING TOOL: {agent_message.tool_calls[0]['name']}")
+                            # If it's an AskHuman tool, display the question
+                            if agent_message.tool_calls[0]['name'] == "AskHuman":
+                                agent_response = agent_message.tool_calls[0]['args']['question']
+                                print(f"QUESTION FROM AGENT: {agent_response}")
+                        else:
+                            # For regular AI messages with no tool calls
+                            agent_response = agent_message.content
+                            print(f"AI MESSAGE: {agent_response}")
+                    elif agent_message.type == "tool":
+                        # For tool messages (user responses)
+                        user_response = agent_message.content
+                        print(f"USER RESPONSE: {user_response}")
                     else:
-                        # For regular AI messages with no tool calls
-                        agent_response = agent_message.content
-                        print(f"AI MESSAGE: {agent_response}")
-                        if not(agent.get_state(config).next):
-                            is_finished = True
-                elif agent_message.type == "tool":
-                    # For tool messages (user responses)
-                    user_response = agent_message.content
-                    print(f"USER RESPONSE: {user_response}")
-                else:
-                    # For any other type of message
-                    print(f"OTHER MESSAGE TYPE: {agent_message.type}")
+                        # For any other type of message
+                        print(f"OTHER MESSAGE TYPE: {agent_message.type}")
                 
-                print("======================\n\n\n")
-        else:
-            # No interrupt, just waiting for normal user input
-            if not(agent.get_state(config).next):
-                print(" \n\n ---APPLICATION HAS ENDED---")
-                is_finished = True
+                    print("======================\n\n\n")
+                snapshot = sessions.get(config)
+                is_finished = snapshot.is_finished
+                if snapshot.interrupt_value:
+                    # The pending question (several AskHuman calls of one turn are asked together)
+                    agent_response = snapshot.interrupt_value
             else:
-                print('\nERROR')
+                # No interrupt, just waiting for normal user input
+                if sessions.get(config).is_finished:
+                    print(" \n\n ---APPLICATION HAS ENDED---")
+                    is_finished = True
+                else:
+                    print('\nERROR')
 
-        return {
-            "agent_response": agent_response,
-            "user_response": user_response,
-            "is_finished": is_finished
-        }
+            return {
+                "agent_response": agent_response,
+                "user_response": user_response,
+                "is_finished": is_finished
+            }
+
+        return await run_graph(x_priority, run_config, turn)
         
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
+    except (LaneOverloadedError, CircuitOpenError, TimeoutError) as e:
+        logger.warning(f"Failing send-message request fast: {e}")
+        raise upstream_error(e)
     except Exception as e:
         # Add better debug information
         import traceback
@@ -0,0 +1,316 @@
+"""Load generator for the Pocket Mixologist API.
+
+Simulates N concurrent users, each doing the full flow:
+start-conversation -> 4 preference answers -> confirmation -> approval.
+
+The target is either the real FastAPI app in this process (`--mode inprocess`,
+requests go through httpx's ASGI transport) or a running server over HTTP
+(`--mode http --url ...`). In-process runs replace the cocktail agent's model
+with an offline backend from fake_llm.py (`--backend fake|recorded`) unless
+`--backend real` is given. To load-test a real server without OpenAI, start it
+with `python load_test.py serve --backend fake`.
+
+Examples:
+    python load_test.py run --users 50 --ramp-up 10 --profile linear --latency 0.2,0.8
+    python load_test.py serve --backend fake --port 8000
+    python load_test.py run --mode http --url http://localhost:8000 --users 20 --server-pid 12345
+    python load_test.py run --mode http --url http://localhost:8001 http://localhost:8002 --users 20
+
+The report covers throughput, latency percentiles per endpoint, error rates and
+the server RSS over time, and can be written as JSON with `--report`.
+
+Given several `--url`s (workers sharing a checkpointer backend, see README),
+every conversation's turns are rotated across them, so a run only succeeds if
+any worker can continue any conversation.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from statistics import quantiles
+from typing import Dict, List, Optional
+
+import httpx
+
+# cocktail_agent.py and fake_llm.py live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+ANSWERS = [
+    ["something sour", "fruity please", "on the sweeter side", "dry"],
+    ["shaken", "stirred", "muddled"],
+    ["gin", "whisky", "vodka", "rum", "mezcal"],
+    ["no restrictions", "no egg white", "I love basil", "no dairy"],
+    ["yes", "go ahead", "sure, proceed"],
+    ["I approve", "yes, perfect", "approved"],
+]
+
+
+# ----------------------------------
+# Target and backend setup
+# ----------------------------------
+def install_backend(backend: str, latency, recording: Optional[str], straggler_rate: float = 0.0,
+                    straggler_latency: float = 0.0) -> None:
+    """Swap the cocktail agent's models for an offline backend (no-op for "real")."""
+    if backend == "real":
+        return
+    import cocktail_agent
+    from fake_llm import build_backend
+
+    cocktail_agent.model = build_backend(backend, latency=latency, recording=recording,
+                                         straggler_rate=straggler_rate, straggler_latency=straggler_latency)
+    # Also serves the structured-output preference extraction (PREFERENCE_EXTRACTION=1)
+    cocktail_agent.extraction_model = cocktail_agent.model
+
+
+def load_app():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import api_server
+
+    return api_server.app
+
+
+def make_clients(mode: str, urls: List[str], timeout: float) -> List[httpx.AsyncClient]:
+    if mode == "inprocess":
+        return [httpx.AsyncClient(transport=httpx.ASGITransport(app=load_app()), base_url="http://loadtest", timeout=timeout)]
+    return [httpx.AsyncClient(base_url=url, timeout=timeout) for url in urls]
+
+
+def read_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident set size of `pid` (or of this process) in MB."""
+    status_path = f"/proc/{pid or 'self'}/status"
+    if os.path.exists(status_path):
+        with open(status_path) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    if pid is None:
+        # No procfs (macOS): fall back to the peak RSS of this process
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return None
+
+
+# ----------------------------------
+# Ramp-up profiles
+# ----------------------------------
+def start_delays(users: int, ramp_up: float, profile: str, steps: int = 5) -> List[float]:
+    """Seconds after the start at which each user begins its flow."""
+    if profile == "spike" or ramp_up <= 0:
+        return [0.0] * users
+    if profile == "linear":
+        return [ramp_up * i / users for i in range(users)]
+    if profile == "step":
+        per_step = max(1, -(-users // steps))
+        return [ramp_up * (i // per_step) / steps for i in range(users)]
+    raise ValueError(f"Unknown profile '{profile}'")
+
+
+# ----------------------------------
+# Users
+# ----------------------------------
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.flows_completed = 0
+        self.flows_failed = 0
+        self.rss: List[Dict[str, float]] = []
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+async def timed_post(client: httpx.AsyncClient, stats: Stats, endpoint: str, payload: Optional[dict] = None) -> dict:
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = await client.post(endpoint, json=payload)
+        ok = response.status_code == 200
+        response.raise_for_status()
+        return response.json()
+    finally:
+        stats.record(endpoint, time.perf_counter() - started, ok)
+
+
+async def user_flow(clients: List[httpx.AsyncClient], stats: Stats, user: int, delay: float, flows: int,
+                    think_time: float) -> None:
+    await asyncio.sleep(delay)
+    for _ in range(flows):
+        try:
+            # With several servers, consecutive turns of a conversation go to different workers
+            started = await timed_post(clients[user % len(clients)], stats, "/api/start-conversation")
+            thread_id = started["config"]["configurable"]["thread_id"]
+            finished = False
+            for turn, choices in enumerate(ANSWERS, start=1):
+                await asyncio.sleep(think_time)
+                reply = await timed_post(clients[(user + turn) % len(clients)], stats, "/api/send-message",
+                                         {"message": random.choice(choices), "thread_id": thread_id})
+                finished = reply["is_finished"]
+                if finished:
+                    break
+            if finished:
+                stats.flows_completed += 1
+            else:
+                stats.flows_failed += 1
+        except (httpx.HTTPError, KeyError, ValueError):
+            stats.flows_failed += 1
+
+
+async def sample_rss(stats: Stats, pid: Optional[int], interval: float, started: float) -> None:
+    while True:
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            stats.rss.append({"t": round(time.perf_counter() - started, 2), "rss_mb": round(rss, 1)})
+        await asyncio.sleep(interval)
+
+
+# ----------------------------------
+# Report
+# ----------------------------------
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {p: value for p in ("p50", "p90", "p95", "p99")}
+    cuts = quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p90": cuts[89], "p95": cuts[94], "p99": cuts[98]}
+
+
+def _hedging_metrics() -> Optional[dict]:
+    from llm_gateway import get_metrics
+
+    return get_metrics()["hedging"]
+
+
+def build_report(stats: Stats, elapsed: float, args: argparse.Namespace) -> dict:
+    requests = sum(len(v) for v in stats.latencies.values())
+    errors = sum(stats.errors.values())
+    return {
+        "users": args.users,
+        "profile": args.profile,
+        "mode": args.mode,
+        "backend": args.backend,
+        "servers": len(args.url) if args.mode == "http" else 1,
+        "elapsed_seconds": round(elapsed, 2),
+        "flows_completed": stats.flows_completed,
+        "flows_failed": stats.flows_failed,
+        "flows_per_second": round(stats.flows_completed / elapsed, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 2),
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "endpoints": {
+            endpoint: {
+                "requests": len(samples),
+                "errors": stats.errors[endpoint],
+                **{k: round(v * 1000, 1) for k, v in _percentiles(samples).items()},
+            }
+            for endpoint, samples in stats.latencies.items()
+        },
+        "rss_mb": stats.rss,
+        # Hedged model calls (LLM_HEDGE=1), only visible in-process
+        "hedging": _hedging_metrics() if args.mode == "inprocess" else None,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n=== Load test: {report['users']} users, {report['profile']} ramp-up, "
+          f"{report['mode']} / {report['backend']} backend, {report['servers']} server(s) ===")
+    print(f"Elapsed: {report['elapsed_seconds']}s  flows ok/failed: {report['flows_completed']}/{report['flows_failed']}  "
+          f"throughput: {report['flows_per_second']} flows/s, {report['requests_per_second']} req/s  "
+          f"error rate: {report['error_rate']:.2%}")
+    print(f"{'endpoint':<28}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in report["endpoints"].items():
+        print(f"{endpoint:<28}{row['requests']:>9}{row['errors']:>8}{row['p50']:>10}{row['p90']:>10}{row['p95']:>10}{row['p99']:>10}")
+    if report["hedging"]:
+        hedging = report["hedging"]
+        print(f"Hedging: {hedging['calls']} calls, {hedging['hedges_fired']} hedges fired, "
+              f"{hedging['hedges_won']} won, {hedging['hedges_capped']} capped")
+    if report["rss_mb"]:
+        rss = report["rss_mb"]
+        print(f"Server RSS: start {rss[0]['rss_mb']} MB, peak {max(s['rss_mb'] for s in rss)} MB, end {rss[-1]['rss_mb']} MB")
+
+
+# ----------------------------------
+# Entry points
+# ----------------------------------
+def parse_latency(value: str):
+    parts = [float(p) for p in value.split(",")]
+    return tuple(parts) if len(parts) == 2 else parts[0]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.mode == "inprocess":
+        install_backend(args.backend, args.latency, args.recording, args.straggler_rate, args.straggler_latency)
+    stats = Stats()
+    # In-process runs measure this process; HTTP runs need the server pid
+    rss_pid = args.server_pid if args.mode == "http" else None
+    clients = make_clients(args.mode, args.url, args.timeout)
+    try:
+        started = time.perf_counter()
+        sampler = asyncio.create_task(sample_rss(stats, rss_pid, args.rss_interval, started))
+        delays = start_delays(args.users, args.ramp_up, args.profile)
+        await asyncio.gather(*(user_flow(clients, stats, user, d, args.flows, args.think_time)
+                               for user, d in enumerate(delays)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+    finally:
+        for client in clients:
+            await client.aclose()
+    report = build_report(stats, elapsed, args)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def serve(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    install_backend(args.backend, args.latency, args.recording, args.straggler_rate, args.straggler_latency)
+    uvicorn.run(load_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the Pocket Mixologist API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backend_args = argparse.ArgumentParser(add_help=False)
+    backend_args.add_argument("--backend", choices=["fake", "recorded", "real"], default="fake")
+    backend_args.add_argument("--recording", help="JSONL file of recorded AI messages (recorded backend)")
+    backend_args.add_argument("--latency", type=parse_latency, default=0.0,
+                              help="Fake model latency in seconds, fixed ('0.5') or uniform range ('0.2,1.5')")
+    backend_args.add_argument("--straggler-rate", type=float, default=0.0,
+                              help="Share of fake model calls slowed down by --straggler-latency (tail latency)")
+    backend_args.add_argument("--straggler-latency", type=float, default=0.0, help="Extra seconds of a straggler call")
+
+    run_parser = subparsers.add_parser("run", parents=[backend_args], help="Run the load test")
+    run_parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    run_parser.add_argument("--url", nargs="+", default=["http://localhost:8000"],
+                            help="Server URL(s); with several, each conversation's turns rotate across them")
+    run_parser.add_argument("--users", type=int, default=10)
+    run_parser.add_argument("--flows", type=int, default=1, help="Flows per user")
+    run_parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds until every user has started")
+    run_parser.add_argument("--profile", choices=["linear", "step", "spike"], default="linear")
+    run_parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between a user's messages")
+    run_parser.add_argument("--timeout", type=float, default=120.0)
+    run_parser.add_argument("--server-pid", type=int, help="Server process to sample RSS from (http mode)")
+    run_parser.add_argument("--rss-interval", type=float, default=1.0)
+    run_parser.add_argument("--report", help="Write the report as JSON to this file")
+
+    serve_parser = subparsers.add_parser("serve", parents=[backend_args], help="Serve the API with an offline backend")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        asyncio.run(run(args))
@@ -0,0 +1,116 @@
+"""Startup warm-up for the API server.
+
+Pays the first-request costs before the pod receives traffic:
+1. graph: builds the compiled graph's structure (lazy on first use)
+2. connections: opens the OpenAI HTTP client's pooled connection (DNS, TLS)
+   with a models listing, which costs no tokens
+3. conversation: runs a canned conversation with the scripted fake model
+   through the real graph, checkpointer, LLM gateway and session snapshots,
+   then deletes its thread
+
+Configuration (environment variables):
+    WARMUP                    "0" skips warm-up (the server is ready immediately)
+    WARMUP_CONNECT            "0" skips opening provider connections
+    WARMUP_FAKE_CONVERSATION  "0" skips the canned conversation
+"""
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from langgraph.types import Command
+
+from fake_llm import ScriptedCocktailModel
+
+logger = logging.getLogger("api_server")
+
+# Answers of the canned conversation: four preferences, the go-ahead and the approval
+WARMUP_ANSWERS = ["fruity", "shaken", "gin", "no restrictions", "yes", "I approve"]
+
+
+class WarmupState:
+    """Progress of the warm-up, reported by /ready."""
+
+    def __init__(self):
+        self.status = "pending"  # pending -> warming_up -> ready | failed
+        self.steps: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "status": self.status, "steps": self.steps, "error": self.error}
+
+
+def _enabled(name: str) -> bool:
+    return os.getenv(name, "1") != "0"
+
+
+def _provider_client(model: Any) -> Any:
+    # bind_tools/with_structured_output wrap the chat model in a RunnableBinding/sequence
+    while not hasattr(model, "root_client") and hasattr(model, "bound"):
+        model = model.bound
+    return getattr(model, "root_client", None)
+
+
+def open_connections(model: Any) -> str:
+    client = _provider_client(model)
+    if client is None:
+        return "skipped (no HTTP client)"
+    try:
+        client.with_options(max_retries=0).models.list()
+    except Exception as e:
+        # The connection is what we are after; an auth or network error is reported, not fatal
+        logger.warning(f"Warm-up could not reach the model provider: {e}")
+        return f"failed ({type(e).__name__})"
+    return "ok"
+
+
+def run_fake_conversation(agent: Any, start_agent: Any, sessions: Any) -> int:
+    """Run the canned conversation on a throwaway thread; returns the number of turns."""
+    config = {"configurable": {"thread_id": f"warmup-{uuid.uuid4().hex[:8]}",
+                               "model": ScriptedCocktailModel(), "priority": "background"}}
+    try:
+        start_agent(agent, config)
+        turns = 0
+        for answer in WARMUP_ANSWERS:
+            if sessions.get(config).is_finished:
+                break
+            agent.invoke(Command(resume=answer), config)
+            turns += 1
+        if not sessions.get(config).is_finished:
+            raise RuntimeError(f"Warm-up conversation did not finish after {turns} turns")
+        return turns
+    finally:
+        agent.checkpointer.delete_thread(config["configurable"]["thread_id"])
+        sessions.invalidate(config["configurable"]["thread_id"])
+
+
+def warm_up(state: WarmupState, agent: Any, start_agent: Any, sessions: Any, model: Any) -> None:
+    """Run every enabled warm-up step, recording per-step timings in `state`."""
+    if not _enabled("WARMUP"):
+        state.status = "ready"
+        return
+
+    state.status = "warming_up"
+    started = time.perf_counter()
+    try:
+        steps = [("graph", lambda: f"{len(agent.get_graph().nodes)} nodes")]
+        if _enabled("WARMUP_CONNECT"):
+            steps.append(("connections", lambda: open_connections(model)))
+        if _enabled("WARMUP_FAKE_CONVERSATION"):
+            steps.append(("conversation", lambda: f"{run_fake_conversation(agent, start_agent, sessions)} turns"))
+        for name, step in steps:
+            step_started = time.perf_counter()
+            result = step()
+            state.steps[name] = {"result": result, "seconds": round(time.perf_counter() - step_started, 3)}
+    except Exception as e:
+        state.status = "failed"
+        state.error = f"{type(e).__name__}: {e}"
+        logger.error(f"Warm-up failed: {state.error}")
+        return
+    state.status = "ready"
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s: {state.steps}")
@@ -15,6 +15,7 @@ export interface StartConversationResponse {
 
 export interface SendMessageRequest {
   message: string;
+  thread_id?: string;
 }
 
 export interface SendMessageResponse {
@@ -39,14 +40,26 @@ export async function startConversation(): Promise<StartConversationResponse> {
   }
 }
 
+/**
+ * Thread of the conversation started by startConversation, if any
+ */
+function currentThreadId(): string | undefined {
+  const stored = typeof window !== 'undefined' ? sessionStorage.getItem('agentConfig') : null;
+  if (!stored) return undefined;
+  const config: ApiConfig = JSON.parse(stored);
+  return config.configurable?.thread_id;
+}
+
 /**
  * Sends a message to the cocktail agent
  */
 export async function sendMessage(message: string): Promise<SendMessageResponse> {
   try {
+    // The thread id lets any API worker continue the conversation
+    const request: SendMessageRequest = { message, thread_id: currentThreadId() };
     const response = await axios.post<SendMessageResponse>(
       `${API_BASE_URL}/api/send-message`,
-      { message }
+      request
     );
     return response.data;
   } catch (error) {
@@ -0,0 +1,96 @@
+"""Versioned registry of static system prompts.
+
+Graph state stores only a prompt id and version. The prompt text is
+prepended to the messages when the model is called, so the same several-KB
+prompt is not copied into every checkpoint of every thread.
+
+A version is the short hash of the prompt text. The registry lives in the
+process: only the texts registered at import (the built-in prompts) are known
+to every worker and after a restart. A thread whose version isn't registered,
+e.g. one started before a prompt was edited, falls back to the latest text
+with a warning. Custom prompts (not a built-in text) must therefore be stored
+in the thread's state as `prompt_text` next to their version; `with_system_prompt`
+uses that text and registers it, so the thread keeps its prompt on any worker.
+Threads created before the registry still have the system message in their
+messages; `with_system_prompt` leaves those alone.
+"""
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_version(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+class PromptRegistry:
+    """Prompt texts by id and version, with the last registered version as the default."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, Dict[str, str]] = {}
+        self._latest: Dict[str, str] = {}
+
+    def register(self, prompt_id: str, text: str, latest: bool = True) -> str:
+        """Register `text` under `prompt_id` and return its version.
+
+        Pass `latest=False` to keep an older text resolvable for existing threads
+        without making it the default for new ones.
+        """
+        version = prompt_version(text)
+        with self._lock:
+            self._prompts.setdefault(prompt_id, {})[version] = text
+            if latest or prompt_id not in self._latest:
+                self._latest[prompt_id] = version
+        return version
+
+    def latest(self, prompt_id: str) -> Tuple[str, str]:
+        """(version, text) of the default version of `prompt_id`."""
+        with self._lock:
+            version = self._latest[prompt_id]
+            return version, self._prompts[prompt_id][version]
+
+    def get(self, prompt_id: str, version: Optional[str] = None) -> str:
+        """Text of `prompt_id` at `version`, or of its latest version.
+
+        Raises:
+            KeyError: If `prompt_id` was never registered
+        """
+        with self._lock:
+            versions = self._prompts[prompt_id]
+            if version and version in versions:
+                return versions[version]
+            latest = self._latest[prompt_id]
+        if version:
+            logger.warning(f"Prompt '{prompt_id}' version {version} is not registered, using {latest}")
+        return versions[latest]
+
+    def ref(self, prompt_id: str) -> Dict[str, str]:
+        """State keys referencing the latest version of `prompt_id`."""
+        version, _ = self.latest(prompt_id)
+        return {"prompt_id": prompt_id, "prompt_version": version}
+
+
+registry = PromptRegistry()
+
+
+def with_system_prompt(messages: List[BaseMessage], prompt_id: Optional[str], version: Optional[str] = None,
+                       prompts: PromptRegistry = registry, text: Optional[str] = None) -> List[BaseMessage]:
+    """Messages to send to the model: the referenced system prompt followed by `messages`.
+
+    `text` is the prompt text persisted with a custom version; it is used as is
+    and registered so later lookups in this process find it.
+    `messages` is returned unchanged when it already holds a system message
+    (threads persisted before the registry) or when no prompt is referenced.
+    """
+    if not prompt_id or any(m.type == "system" for m in messages):
+        return messages
+    if text is not None:
+        prompts.register(prompt_id, text, latest=False)
+        return [SystemMessage(content=text), *messages]
+    return [SystemMessage(content=prompts.get(prompt_id, version)), *messages]
@@ -0,0 +1,128 @@
+"""Compact per-thread view of a graph's state, read once and cached until the next write.
+
+The API, the Streamlit app and the CLI loops only need three things after
+each turn: the pending interrupt value (the next question), whether the run
+has finished, and the last AI message. Getting them from `agent.get_state`
+deserializes the whole checkpoint, and each turn used to do that two or three
+times. `SessionSnapshots.get` reads the state once and caches the snapshot per
+thread. The cache is dropped as soon as the checkpointer saves anything for
+that thread.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+DEFAULT_MAX_THREADS = 10_000
+
+
+class SessionSnapshot(NamedTuple):
+    interrupt_value: Any
+    is_finished: bool
+    last_ai_message: Optional[str]
+    next: Tuple[str, ...]
+    checkpoint_id: Optional[str]
+
+
+def _ai_text(message: Any) -> Optional[str]:
+    """What the user sees of an AI message: its AskHuman questions (asked together), or the message content."""
+    questions = [call["args"].get("question") or "" for call in getattr(message, "tool_calls", None) or []
+                 if call["name"] == "AskHuman"]
+    if questions:
+        return "\n\n".join(questions)
+    return message.content or None
+
+
+def snapshot_from_state(state: Any) -> SessionSnapshot:
+    """Build a SessionSnapshot from a LangGraph StateSnapshot."""
+    interrupt_value = next((task.interrupts[0].value for task in state.tasks if task.interrupts), None)
+    last_ai = next((m for m in reversed(state.values.get("messages", [])) if m.type == "ai"), None)
+    return SessionSnapshot(
+        interrupt_value=interrupt_value,
+        is_finished=not state.next,
+        last_ai_message=_ai_text(last_ai) if last_ai is not None else None,
+        next=tuple(state.next),
+        checkpoint_id=(state.config or {}).get("configurable", {}).get("checkpoint_id"),
+    )
+
+
+class SessionSnapshots:
+    """Cached SessionSnapshot per thread of a compiled graph.
+
+    The graph's checkpointer is wrapped so that every `put`/`put_writes` for a
+    thread (sync or async) invalidates that thread's entry; callers don't need
+    to invalidate after `stream`/`invoke`. Checkpointers shared between
+    workers (those with a `state_token` method) can also be written
+    elsewhere, so cached entries are checked against the token on every hit.
+    At most `max_threads` snapshots are kept, least recently used first out.
+    """
+
+    def __init__(self, agent: Any, max_threads: int = DEFAULT_MAX_THREADS):
+        self.agent = agent
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[SessionSnapshot, Any]]" = OrderedDict()
+        # Threads being read -> (readers, writes seen since), so a read racing a write never caches a stale snapshot
+        self._reading: Dict[str, Tuple[int, int]] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._state_token = getattr(agent.checkpointer, "state_token", None)
+        self._watch(agent.checkpointer)
+
+    def _watch(self, checkpointer: Any) -> None:
+        for name in ("put", "put_writes", "aput", "aput_writes"):
+            method = getattr(checkpointer, name, None)
+            if method is None:
+                continue
+            if name.startswith("a"):
+                async def wrapper(config, *args, _method=method, **kwargs):
+                    try:
+                        return await _method(config, *args, **kwargs)
+                    finally:
+                        self.invalidate(config["configurable"]["thread_id"])
+            else:
+                def wrapper(config, *args, _method=method, **kwargs):
+                    try:
+                        return _method(config, *args, **kwargs)
+                    finally:
+                        self.invalidate(config["configurable"]["thread_id"])
+            setattr(checkpointer, name, wrapper)
+
+    def invalidate(self, thread_id: str) -> None:
+        with self._lock:
+            if thread_id in self._reading:
+                readers, writes = self._reading[thread_id]
+                self._reading[thread_id] = (readers, writes + 1)
+            if self._cache.pop(thread_id, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def get(self, config: dict) -> SessionSnapshot:
+        """Snapshot of the latest state of `config`'s thread."""
+        thread_id = config["configurable"]["thread_id"]
+        # Shared checkpointers can be written by other workers: validate entries with a cheap token
+        token = self._state_token(thread_id) if self._state_token else None
+        with self._lock:
+            cached = self._cache.get(thread_id)
+            if cached is not None and cached[1] == token:
+                self._cache.move_to_end(thread_id)
+                self._stats["hits"] += 1
+                return cached[0]
+            self._stats["misses"] += 1
+            readers, writes_before = self._reading.get(thread_id, (0, 0))
+            self._reading[thread_id] = (readers + 1, writes_before)
+
+        try:
+            snapshot = snapshot_from_state(self.agent.get_state({"configurable": {"thread_id": thread_id}}))
+        finally:
+            with self._lock:
+                readers, writes = self._reading.pop(thread_id)
+                if readers > 1:
+                    self._reading[thread_id] = (readers - 1, writes)
+        with self._lock:
+            if writes == writes_before:
+                self._cache[thread_id] = (snapshot, token)
+                while len(self._cache) > self.max_threads:
+                    self._cache.popitem(last=False)
+        return snapshot
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "cached_threads": len(self._cache)}
@@ -0,0 +1,77 @@
+"""Single-flight coalescing of identical in-flight calls.
+
+While a call for a given key is running, later callers with the same key don't
+start their own: they wait for the first ("leader") call and get its result, or
+its exception. Errors that only concern the leader's own call (`retry_on`, e.g.
+its deadline passing) are not shared: each follower then runs the call itself,
+within its own budget. Nothing is cached; once the leader finishes, the next
+call with that key runs again.
+"""
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple, Type
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Group of keyed calls where duplicates share one execution."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._metrics = {"leaders": 0, "coalesced": 0, "follower_retries": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], retry_on: Tuple[Type[BaseException], ...] = ()) -> Any:
+        """Run `fn()` unless a call with `key` is already in flight, then share its outcome.
+
+        Followers receive a deep copy of the leader's result, so callers can
+        mutate what they get back (e.g. LangGraph assigning message ids). When
+        the leader fails with one of `retry_on`, followers call `fn()` themselves.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._metrics["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._metrics["leaders"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if isinstance(call.error, retry_on):
+                with self._lock:
+                    self._metrics["follower_retries"] += 1
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            result = fn()
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.error is None and call.waiters:
+                # Snapshot before the leader's caller gets (and possibly mutates) the result
+                call.result = copy.deepcopy(result)
+            call.done.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "in_flight": len(self._calls)}
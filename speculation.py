@@ -0,0 +1,181 @@
+"""Speculative model calls for answers that are easy to predict.
+
+While the user is typing an answer that has a few likely values ("no
+restrictions" to "any additional ingredients?", "yes" to "may I proceed?"),
+the prompt the model will receive next is already known up to that answer.
+`Speculator.submit` runs the model on such candidate prompts in the
+background. When the real prompt arrives, `Speculator.take` returns the
+candidate's response if one was speculated for the same prompt. All other
+candidates of the thread are then discarded. A candidate can schedule
+follow-ups (the next turn after its own response); those are kept when their
+parent is used, including follow-ups submitted after the parent was taken.
+
+Prompts are compared by content: message and tool-call ids are ignored, and
+texts are compared case-insensitively without punctuation, so "No restrictions."
+matches a candidate speculated for "no restrictions" (user answers also show
+up inside system notes, such as the collected preferences).
+Speculation is per process; a turn served by another worker is a miss.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_WORKERS = 4
+DEFAULT_TTL = 600.0  # seconds an unused candidate is kept
+
+
+def _normalized(text: Any) -> Any:
+    if not isinstance(text, str):
+        return text
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def speculation_key(messages: List[Any]) -> str:
+    """Hash of a prompt's content, equal for prompts that differ only in ids, case or punctuation."""
+    payload = []
+    for m in messages:
+        tool_calls = [(c["name"], c["args"]) for c in getattr(m, "tool_calls", None) or []]
+        payload.append((m.type, _normalized(m.content), tool_calls))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _tokens(response: Any) -> int:
+    usage = getattr(response, "usage_metadata", None)
+    return (usage or {}).get("total_tokens") or 0
+
+
+class _Candidate:
+    __slots__ = ("future", "parent", "created")
+
+    def __init__(self, future: Future, parent: Optional[str]):
+        self.future = future
+        self.parent = parent
+        self.created = time.monotonic()
+
+
+class Speculator:
+    """Background model calls per thread, used if the real prompt matches and discarded otherwise."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculation")
+        # Reentrant: a done-callback added to a finished future runs at once, under the caller's lock
+        self._lock = threading.RLock()
+        # thread id -> prompt key -> candidate
+        self._candidates: Dict[str, Dict[str, _Candidate]] = {}
+        # thread id -> (key, time) of the candidate its last prompt used, whose follow-ups are still wanted
+        self._taken: Dict[str, Tuple[str, float]] = {}
+        self._metrics = {"speculated": 0, "hits": 0, "misses": 0, "discarded": 0, "failed": 0,
+                         "tokens_used": 0, "tokens_wasted": 0}
+
+    def submit(self, thread_id: str, messages: List[Any], call: Callable[[List[Any]], Any],
+               parent: Optional[str] = None, then: Optional[Callable[[Any], None]] = None) -> str:
+        """Run `call(messages)` in the background as a candidate for `thread_id`'s next prompt.
+
+        `then(response)` runs after the call, typically to submit follow-ups
+        with `parent` set to the returned key. A follow-up whose parent was
+        discarded in the meantime is not submitted; one whose parent was
+        already taken is.
+        """
+        key = speculation_key(messages)
+        with self._lock:
+            self._prune()
+            candidates = self._candidates.get(thread_id, {})
+            if key in candidates:
+                return key
+            if parent is not None and parent not in candidates:
+                if parent != self._taken.get(thread_id, (None, 0.0))[0]:
+                    return key
+                # The parent's turn is the current one: keep it like the follow-ups kept by take()
+                parent = None
+            candidates = self._candidates.setdefault(thread_id, {})
+
+            def run() -> Any:
+                response = call(messages)
+                if then is not None:
+                    then(response)
+                return response
+
+            candidates[key] = _Candidate(self._executor.submit(run), parent)
+            self._metrics["speculated"] += 1
+        return key
+
+    def take(self, thread_id: str, messages: List[Any]) -> Optional[Any]:
+        """Response speculated for exactly this prompt, or None. Waits if the candidate is still running."""
+        with self._lock:
+            self._taken.pop(thread_id, None)
+            candidates = self._candidates.get(thread_id)
+            if not candidates:
+                return None
+            key = speculation_key(messages)
+            hit = candidates.pop(key, None)
+            if hit is not None:
+                self._taken[thread_id] = (key, time.monotonic())
+            # Only the hit's follow-ups can still be used
+            keep = {k: c for k, c in candidates.items() if hit is not None and c.parent == key}
+            for candidate in candidates.values():
+                if candidate.parent != key or hit is None:
+                    self._discard(candidate)
+            if keep:
+                for candidate in keep.values():
+                    candidate.parent = None
+                self._candidates[thread_id] = keep
+            else:
+                del self._candidates[thread_id]
+            self._metrics["hits" if hit is not None else "misses"] += 1
+
+        if hit is None:
+            return None
+        try:
+            response = hit.future.result()
+        except Exception:
+            with self._lock:
+                self._metrics["failed"] += 1
+            return None
+        with self._lock:
+            self._metrics["tokens_used"] += _tokens(response)
+        return response
+
+    def discard(self, thread_id: str) -> None:
+        """Drop every candidate of `thread_id` (e.g. when the thread is deleted)."""
+        with self._lock:
+            self._taken.pop(thread_id, None)
+            for candidate in self._candidates.pop(thread_id, {}).values():
+                self._discard(candidate)
+
+    def _discard(self, candidate: _Candidate) -> None:
+        # Called with the lock held; tokens of running calls are counted once they finish
+        self._metrics["discarded"] += 1
+        if candidate.future.cancel():
+            return
+
+        def count(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                with self._lock:
+                    self._metrics["tokens_wasted"] += _tokens(future.result())
+
+        candidate.future.add_done_callback(count)
+
+    def _prune(self) -> None:
+        expired = time.monotonic() - self.ttl
+        for thread_id in [t for t, (_key, taken_at) in self._taken.items() if taken_at < expired]:
+            del self._taken[thread_id]
+        for thread_id in [t for t, cs in self._candidates.items() if all(c.created < expired for c in cs.values())]:
+            for candidate in self._candidates.pop(thread_id).values():
+                self._discard(candidate)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            spent = self._metrics["tokens_used"] + self._metrics["tokens_wasted"]
+            return {
+                **self._metrics,
+                "hit_rate": self._metrics["hits"] / lookups if lookups else None,
+                # Share of the speculated tokens that were thrown away
+                "token_overhead": self._metrics["tokens_wasted"] / spent if spent else None,
+                "pending_threads": len(self._candidates),
+            }
@@ -1,8 +1,14 @@
+import os
+import sys
 import streamlit as st
 import time
 from cocktail_agent import compile_agent, start_agent
 from langgraph.types import Command
 
+# session_snapshot.py lives in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from session_snapshot import SessionSnapshots
+
 # Set page configuration
 st.set_page_config(
     page_title="Pocket Mixologist",
@@ -145,6 +151,7 @@ st.markdown("<p class='subheader'>Your personal AI bartender crafting exclusive
 # Initialize session state
 if "agent" not in st.session_state:
     st.session_state.agent = compile_agent()
+    st.session_state.sessions = SessionSnapshots(st.session_state.agent)
     st.session_state.config = {"configurable": {"thread_id": str(int(time.time()))}}
     st.session_state.messages = []
     st.session_state.finished = False
@@ -161,6 +168,7 @@ def clear_chat_session_state():
 
 # Initialize the application parameters
 agent = st.session_state.agent
+sessions = st.session_state.sessions
 config = st.session_state.config
 
 # Show message history
@@ -180,12 +188,7 @@ if not st.session_state.conversation_started:
                 start_agent(agent, config)
                 
                 # Check for a node interrupt to get the initial question
-                state = agent.get_state(config)
-                interrupt_value = None
-                for task in state.tasks:
-                    if hasattr(task, 'interrupts') and task.interrupts:
-                        interrupt_value = task.interrupts[0].value
-                        break
+                interrupt_value = sessions.get(config).interrupt_value
                 
                 if interrupt_value and interrupt_value != "None":
                     st.session_state.messages.append({"role": "assistant", "content": interrupt_value})
@@ -238,7 +241,7 @@ if st.session_state.conversation_started and not st.session_state.finished:
                 st.session_state.last_ai_message_id = latest_ai_message
             
             # Check if conversation is finished
-            if not agent.get_state(config).next:
+            if sessions.get(config).is_finished:
                 st.session_state.finished = True
 
 # Add a reset button to start over
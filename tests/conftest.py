@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "pocket-mixologist", "api"),
+                os.path.join(ROOT, "medical-assistant", "wisecare-prescription")]
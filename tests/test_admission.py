@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from admission import RequestAdmission
+from llm_gateway import DeadlineExceededError
+
+
+def test_slot_handed_over_as_the_deadline_passes_is_not_lost(monkeypatch):
+    async def scenario():
+        admission = RequestAdmission(max_concurrency=1)
+        await admission.acquire("interactive")
+
+        async def hand_over_then_time_out(waiter, timeout):
+            # release() resolves the waiter in the same loop iteration as the timeout fires
+            admission.release()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(asyncio, "wait_for", hand_over_then_time_out)
+        with pytest.raises(DeadlineExceededError):
+            await admission.acquire("interactive", timeout=0.01)
+        monkeypatch.undo()
+
+        assert admission.running == 0
+        await asyncio.wait_for(admission.acquire("interactive"), 1)
+        assert admission.running == 1
+
+    asyncio.run(scenario())
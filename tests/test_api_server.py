@@ -0,0 +1,31 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "x")
+os.environ.setdefault("WARMUP", "0")
+
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+
+    import load_test
+    load_test.install_backend("fake", 0.0, None)
+    import api_server
+    return TestClient(api_server.app)
+
+
+def test_send_message_to_unknown_thread_is_404(client):
+    response = client.post("/api/send-message", json={"message": "fruity", "thread_id": "no-such-thread"})
+    assert response.status_code == 404
+
+
+def test_send_message_to_started_thread(client):
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread_id = client.post("/api/start-conversation").json()["config"]["configurable"]["thread_id"]
+        response = client.post("/api/send-message", json={"message": "fruity", "thread_id": thread_id})
+    assert response.status_code == 200
+    assert response.json()["is_finished"] is False
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from document_queue import DocumentQueue
+
+
+def test_job_whose_worker_keeps_dying_fails_after_max_attempts(tmp_path):
+    queue = DocumentQueue(path=str(tmp_path / "jobs.sqlite3"), max_attempts=2, lease=0.05,
+                          generators={"prescription": lambda *a, **k: ("unused.pdf", False)})
+    job_id = queue.submit("prescription", {})
+
+    # Each claim stands for a worker that died before finishing the job
+    for attempt in (1, 2):
+        assert queue._claim()["id"] == job_id
+        time.sleep(0.1)
+    assert queue._claim() is None
+
+    status = queue.status(job_id)
+    assert status["status"] == "failed"
+    assert status["attempts"] == 2
+    assert "lease" in status["error"]
+
+
+def test_job_longer_than_the_lease_runs_once(tmp_path):
+    calls = []
+    lock = threading.Lock()
+
+    def slow(payload, output_path=None, skin_info=None, return_cache_hit=False):
+        with lock:
+            calls.append(payload)
+        time.sleep(0.8)
+        return "out.pdf", False
+
+    queue = DocumentQueue(path=str(tmp_path / "jobs.sqlite3"), workers=2, lease=0.2,
+                          generators={"prescription": slow}).start()
+    try:
+        job_id = queue.submit("prescription", {})
+        assert queue.result(job_id, timeout=5) == "out.pdf"
+    finally:
+        queue.stop()
+
+    assert len(calls) == 1
+    assert queue.status(job_id)["attempts"] == 1
@@ -0,0 +1,42 @@
+import os
+import time
+
+from pdf_cache import PdfCache
+
+
+def make_pdf(path, size=100):
+    with open(path, "wb") as f:
+        f.write(b"%PDF" + b"0" * size)
+    return str(path)
+
+
+def test_repeated_fetch_returns_the_cached_pdf_without_new_files(tmp_path):
+    cache = PdfCache(cache_dir=str(tmp_path / "cache"))
+    generated = make_pdf(tmp_path / "generated.pdf")
+    cached = cache.put("k", generated, move=True)
+    assert not os.path.exists(generated)
+
+    files = set(os.listdir(tmp_path)) | set(os.listdir(tmp_path / "cache"))
+    for _ in range(3):
+        assert cache.fetch("k") == cached
+    assert set(os.listdir(tmp_path)) | set(os.listdir(tmp_path / "cache")) == files
+
+
+def test_fetch_copies_to_a_requested_path(tmp_path):
+    cache = PdfCache(cache_dir=str(tmp_path / "cache"))
+    cache.put("k", make_pdf(tmp_path / "generated.pdf"))
+    assert cache.fetch("k", str(tmp_path / "mine.pdf")) == str(tmp_path / "mine.pdf")
+    assert cache.fetch("missing", str(tmp_path / "other.pdf")) is None
+    assert not os.path.exists(tmp_path / "other.pdf")
+
+
+def test_eviction_keeps_recently_served_pdfs(tmp_path):
+    cache = PdfCache(cache_dir=str(tmp_path / "cache"), max_bytes=150, pin_seconds=60)
+    old = cache.put("old", make_pdf(tmp_path / "a.pdf"))
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    served = cache.put("served", make_pdf(tmp_path / "b.pdf"))
+    cache.put("new", make_pdf(tmp_path / "c.pdf"))
+
+    assert not os.path.exists(old)
+    assert os.path.exists(served)
+    assert cache.fetch("new") is not None
@@ -0,0 +1,41 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from speculation import Speculator, speculation_key
+
+
+def slow_reply(messages, latency=0.2):
+    time.sleep(latency)
+    return AIMessage(content=f"reply to {messages[-1].content}")
+
+
+def test_follow_up_submitted_after_its_parent_was_taken():
+    speculator = Speculator(workers=2)
+    first = [HumanMessage("no restrictions")]
+    second = [*first, AIMessage("reply to no restrictions"), HumanMessage("yes")]
+
+    def then(response):
+        speculator.submit("t", second, slow_reply, parent=speculation_key(first))
+
+    speculator.submit("t", first, slow_reply, then=then)
+    # The real prompt arrives while the candidate is still running, before its follow-up exists
+    assert speculator.take("t", first).content == "reply to no restrictions"
+    assert speculator.take("t", second).content == "reply to yes"
+
+    metrics = speculator.metrics()
+    assert metrics["speculated"] == 2
+    assert metrics["hits"] == 2
+    assert metrics["pending_threads"] == 0
+
+
+def test_follow_up_of_a_discarded_parent_is_dropped():
+    speculator = Speculator(workers=2)
+    parent = [HumanMessage("no restrictions")]
+    speculator.submit("t", parent, lambda messages: slow_reply(messages, 0.0))
+    assert speculator.take("t", [HumanMessage("something else")]) is None
+
+    speculator.submit("t", [*parent, HumanMessage("yes")], slow_reply, parent=speculation_key(parent))
+    metrics = speculator.metrics()
+    assert metrics["speculated"] == 1
+    assert metrics["pending_threads"] == 0